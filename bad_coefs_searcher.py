@@ -1,45 +1,107 @@
-def delete_similar_coefs(coefs):
-    accuracy = 0.00000000001
-    for coef_to in coefs:
-        coef_to_float = float(coef_to)
-        for coef_from in coefs:
-            if(coef_to == coef_from or coefs[coef_to] == None or coefs[coef_from] == None):
+import numpy as np
+
+ACCURACY = 0.00000000001
+
+
+def similar_coefs_parents(slots, values, accuracy=ACCURACY):
+    """
+    Merges candidates of the same slot whose values are within accuracy of each other.
+    Any number of slots (a record, a satellite, a whole day) is processed in one call.
+
+    slots: slot of every candidate, sorted, candidates of a slot in the order they were first seen
+    values: float value of every candidate
+    return: per candidate the index of the candidate it was merged into, -1 if it was kept
+
+    Candidates are sorted by value once, so only neighbours can be within accuracy.
+    Runs of such neighbours are rare and are resolved like the original pairwise search:
+    in first seen order every kept non-zero value takes all values with abs(1 - value / kept) < accuracy.
+    """
+    slots = np.asarray(slots)
+    values = np.asarray(values, dtype=float)
+    parent = np.full(values.size, -1)
+    if values.size < 2:
+        return parent
+
+    order = np.lexsort((values, slots))
+    s = slots[order]
+    v = values[order]
+    # twice the accuracy, the pairwise test is relative to one value only
+    near = (s[1:] == s[:-1]) & (np.abs(v[1:] - v[:-1]) <= 2 * accuracy * np.maximum(np.abs(v[1:]), np.abs(v[:-1])))
+
+    if not near.any():
+        return parent
+
+    edges = np.diff(np.concatenate(([0], near.astype(np.int8), [0])))
+    for a, b in zip(np.flatnonzero(edges == 1).tolist(), (np.flatnonzero(edges == -1) + 1).tolist()):
+        members = np.sort(order[a:b])
+        merged = _pairwise_parents(values[members].tolist(), accuracy)
+        for i, p in enumerate(merged):
+            if p >= 0:
+                parent[members[i]] = members[p]
+
+    return parent
+
+def _pairwise_parents(coefs_floats, accuracy):
+    parent = [-1] * len(coefs_floats)
+    for to, coef_to_float in enumerate(coefs_floats):
+        if parent[to] >= 0 or coef_to_float == 0.0:
+            continue
+        for frm, coef_from_float in enumerate(coefs_floats):
+            if frm == to or parent[frm] >= 0:
                 continue
-            coef_from_float = float(coef_from)
-            if coef_to_float != 0.0:
-                res = coef_from_float / coef_to_float
-                if(accuracy > abs(1.0 - res)):
-                    coefs[coef_to]['count'] += coefs[coef_from]['count']
-                    coefs[coef_to]['owners'] += coefs[coef_from]['owners']
-                    coefs[coef_from] = None
-
-    coefs_temp = {}
-    for coef in coefs:
-        if(coefs[coef] != None):
-            coefs_temp[coef] = coefs[coef]
-    
-    return coefs_temp
+            if accuracy > abs(1.0 - coef_from_float / coef_to_float):
+                parent[frm] = to
 
-def search_bad_coefs(rinex_merged_data):
-    for sv in rinex_merged_data:
-        for datetime_k in rinex_merged_data[sv]:
-            for coef_idx in rinex_merged_data[sv][datetime_k]:
-                coefs_cleared = delete_similar_coefs(rinex_merged_data[sv][datetime_k][coef_idx])
-                coefs_l = sorted(coefs_cleared, key=lambda x: coefs_cleared.get(x)['count'], reverse=True)
+    return parent
+
+def vote(slots, parent, counts):
+    """
+    single pass voting over merged candidates
+    return: (winning candidate of every slot, its count including merged candidates)
+    ties go to the candidate seen first
+    """
+    slots = np.asarray(slots)
+    parent = np.asarray(parent)
+    n = parent.size
+
+    root = np.where(parent < 0, np.arange(n), parent)
+    while True:
+        up = root[root]
+        if (up == root).all():
+            break
+        root = up
 
-                rigth_coef = coefs_cleared[coefs_l[0]]
-                rigth_coef['value'] = coefs_l[0]
+    total = np.bincount(root, weights=counts, minlength=n).astype(np.int64)
+
+    roots = np.flatnonzero(parent < 0)
+    roots = roots[np.lexsort((roots, -total[roots], slots[roots]))]
+    first = np.ones(roots.size, dtype=bool)
+    first[1:] = slots[roots][1:] != slots[roots][:-1]
+
+    return roots[first], total[roots[first]]
+
+def search_bad_coefs(rinex_merged_data):
+    """
+    rinex_merged_data: MergeTable or SqliteMergeTable
+    decides the right coefficient of every slot, the table is returned
+    similar coefs are searched again only in the slots changed since the last consensus,
+    a SqliteMergeTable is searched a chunk of records at a time
+    """
+    if hasattr(rinex_merged_data, 'candidate_chunks'):
+        for ids, slots, values, counts in rinex_merged_data.candidate_chunks():
+            parent = similar_coefs_parents(slots, values)
+            winners, _ = vote(slots, parent, counts)
+            rinex_merged_data.set_chunk_consensus(ids, parent, winners)
+        return rinex_merged_data
 
-                error_coefs_l = coefs_l[1:]
-                error_coefs = []
-                for coef in error_coefs_l:
-                    coef_dict = coefs_cleared[coef]
-                    coef_dict['value'] = coef
-                    error_coefs.append(coef_dict)
+    slots, values, counts = rinex_merged_data.candidates()
 
-                rinex_merged_data[sv][datetime_k][coef_idx] = {}
+    parent, todo = rinex_merged_data.reusable_consensus()
+    redo = np.flatnonzero(todo)
+    merged = similar_coefs_parents(slots[redo], rinex_merged_data.value_floats()[values[redo]])
+    parent[redo] = np.where(merged < 0, -1, redo[merged])
+    winners, _ = vote(slots, parent, counts)
 
-                rinex_merged_data[sv][datetime_k][coef_idx]['rigth_coef'] = rigth_coef
-                rinex_merged_data[sv][datetime_k][coef_idx]['error_coefs'] = error_coefs
+    rinex_merged_data.set_consensus(parent, winners)
 
-    return rinex_merged_data
\ No newline at end of file
+    return rinex_merged_data
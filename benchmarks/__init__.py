@@ -0,0 +1,4 @@
+"""
+benchmarks of the merge pipeline on a synthetic corpus, see benchmarks.run
+"""
+from .corpus import generate_corpus
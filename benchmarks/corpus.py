@@ -0,0 +1,293 @@
+"""
+synthetic RINEX corpus: NAV2, NAV3, OBS2 and OBS3 files of N stations x M days
+
+Every station broadcasts the same ephemerides, a controlled fraction of records
+gets one corrupted coefficient. The injected corruptions are listed in manifest.json.
+"""
+import datetime
+import gzip
+import json
+import os
+import random
+from typing import Any, Dict, List, Sequence
+
+from .encoders import crx_encode, lzw_compress
+
+CONSTELLATIONS = 'GRE'
+START = datetime.date(2020, 2, 14)
+
+# number of broadcast coefficients and ephemeris interval in minutes per system
+NAV_FIELDS = {'G': 29, 'R': 15, 'E': 28, 'C': 29, 'J': 29, 'S': 15, 'I': 28}
+NAV_INTERVAL = {'G': 120, 'R': 30, 'E': 60, 'C': 60, 'J': 60, 'S': 30, 'I': 60}
+PRNS = {'G': 32, 'R': 24, 'E': 30, 'C': 40, 'J': 7, 'S': 20, 'I': 7}
+
+OBS2_TYPES = ['C1', 'L1', 'L2', 'P2', 'D1', 'S1', 'S2']
+OBS3_TYPES = {'G': ['C1C', 'L1C', 'D1C', 'S1C', 'C2W', 'L2W', 'S2W'],
+              'R': ['C1C', 'L1C', 'D1C', 'S1C', 'C2P', 'L2P'],
+              'E': ['C1C', 'L1C', 'D1C', 'S1C', 'C5Q', 'L5Q', 'S5Q'],
+              'C': ['C2I', 'L2I', 'D2I', 'S2I'],
+              'J': ['C1C', 'L1C', 'D1C', 'S1C'],
+              'S': ['C1C', 'L1C', 'S1C'],
+              'I': ['C5A', 'L5A', 'S5A']}
+
+KINDS = ('nav2', 'nav3', 'obs2', 'obs3')
+
+
+def generate_corpus(directory: str,
+                    stations: int = 6,
+                    days: int = 1,
+                    constellations: str = CONSTELLATIONS,
+                    kinds: Sequence[str] = KINDS,
+                    corruption: float = 0.05,
+                    wrap: Sequence[str] = (),
+                    obs_interval: int = 30,
+                    start: datetime.date = START,
+                    seed: int = 1) -> Dict[str, Any]:
+    """
+    write the corpus to directory
+    wrap: applied in order, 'crx' (OBS files only), 'gz' or 'Z', e.g. ('crx', 'gz')
+    return: manifest {'params': {...}, 'files': {kind: [path, ...]}, 'corruptions': [[file, sv, epoch, index], ...]}
+    """
+    os.makedirs(directory, exist_ok=True)
+    rnd = random.Random(seed)
+    svs = [f'{s}{prn:02d}' for s in constellations for prn in range(1, PRNS[s] + 1)]
+    orbits = {sv: [rnd.uniform(-1, 1) * 10 ** rnd.randint(-12, 7) for _ in range(NAV_FIELDS[sv[0]])] for sv in svs}
+
+    manifest: Dict[str, Any] = {
+        'params': {'stations': stations, 'days': days, 'constellations': constellations, 'kinds': list(kinds),
+                   'corruption': corruption, 'wrap': list(wrap), 'obs_interval': obs_interval,
+                   'start': start.isoformat(), 'seed': seed},
+        'files': {kind: [] for kind in kinds},
+        'corruptions': [],
+    }
+
+    for day in range(days):
+        date = start + datetime.timedelta(days=day)
+        for station in range(stations):
+            name = f'ST{station:02d}'
+            visible = sorted(rnd.sample(svs, max(1, int(len(svs) * 0.7))))  # ephemerides, a third is tracked
+            for kind in kinds:
+                if kind == 'nav2':
+                    for system, letter in (('G', 'n'), ('R', 'g')):
+                        if system not in constellations:
+                            continue
+                        fn = f'{name.lower()}{date:%j}0.{date:%y}{letter}'
+                        lines = nav2_lines(date, [sv for sv in visible if sv[0] == system], orbits,
+                                           corruption, rnd, manifest['corruptions'], fn,
+                                           leading_dot=station % 3 == 0)
+                        manifest['files'][kind].append(_write(directory, fn, lines, wrap))
+                elif kind == 'nav3':
+                    fn = f'{name}00USA_R_{date:%Y%j}0000_01D_MN.rnx'
+                    lines = nav3_lines(date, visible, orbits, corruption, rnd, manifest['corruptions'], fn)
+                    manifest['files'][kind].append(_write(directory, fn, lines, wrap))
+                elif kind == 'obs2':
+                    fn = f'{name.lower()}{date:%j}0.{date:%y}o'
+                    lines = obs2_lines(date, visible[::3], obs_interval, rnd)
+                    manifest['files'][kind].append(_write(directory, fn, lines, wrap))
+                elif kind == 'obs3':
+                    fn = f'{name}00USA_R_{date:%Y%j}0000_01D_{obs_interval:02d}S_MO.rnx'
+                    lines = obs3_lines(date, visible[::3], obs_interval, rnd)
+                    manifest['files'][kind].append(_write(directory, fn, lines, wrap))
+                else:
+                    raise ValueError(f'unknown corpus kind {kind}')
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+    return manifest
+
+
+def _write(directory: str, fn: str, lines: List[str], wrap: Sequence[str]) -> str:
+    """write lines with the wrappings applied, return the path"""
+    obs = fn.endswith('o') or fn.endswith('MO.rnx')
+    data = None
+    for w in wrap:
+        if w == 'crx':
+            if not obs:
+                continue
+            lines = crx_encode(lines)
+            fn = fn[:-1] + 'd' if fn.endswith('o') else fn[:-4] + '.crx'
+        elif w == 'gz':
+            data = gzip.compress((data if data is not None else ''.join(lines).encode('ascii')), mtime=0)
+            fn += '.gz'
+        elif w == 'Z':
+            data = lzw_compress(data if data is not None else ''.join(lines).encode('ascii'))
+            fn += '.Z'
+        else:
+            raise ValueError(f'unknown wrapping {w}')
+
+    path = os.path.join(directory, fn)
+    if data is None:
+        with open(path, 'w') as f:
+            f.writelines(lines)
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    return path
+
+
+def nav_field(value: float, exponent: str = 'D', leading_dot: bool = False) -> str:
+    """D19.12 field, '-1.234567890123D+00' or with leading_dot '-.123456789012D+01'"""
+    if not leading_dot:
+        mantissa, exp = f'{value:.12E}'.split('E')
+        return f'{mantissa}{exponent}{exp[0]}{exp[1:].zfill(2)}'.rjust(19)
+
+    if value == 0:
+        return f'  .000000000000{exponent}+00'
+    exp = int(f'{value:E}'.split('E')[1]) + 1
+    digits = f'{abs(value) / 10 ** exp:.12f}'[1:]
+    if digits.startswith('1.'):  # rounded up to 1
+        exp += 1
+        digits = f'{abs(value) / 10 ** exp:.12f}'[1:]
+
+    return f' {"-" if value < 0 else " "}{digits}{exponent}{"+" if exp >= 0 else "-"}{abs(exp):02d}'
+
+
+def _epochs(date: datetime.date, minutes: int):
+    """ephemeris epochs of a day, the first of the next day included like real files"""
+    t0 = datetime.datetime.combine(date, datetime.time())
+    for m in range(0, 24 * 60 + 1, minutes):
+        yield t0 + datetime.timedelta(minutes=m)
+
+
+def _values(sv: str, t: datetime.datetime, orbits: Dict[str, List[float]]) -> List[float]:
+    values = list(orbits[sv])
+    values[0] += t.hour + t.minute / 60
+    values[-1] += t.hour * 3600 + t.minute * 60
+
+    return values
+
+
+def _corrupt(values: List[float], sv: str, t: datetime.datetime, corruption: float,
+             rnd: random.Random, corruptions: list, fn: str):
+    if rnd.random() < corruption:
+        i = rnd.randrange(len(values))
+        values[i] = values[i] * 1.001 if values[i] else 1e-9
+        corruptions.append([fn, sv, t.isoformat(), i])
+
+
+def nav2_lines(date: datetime.date, svs: Sequence[str], orbits: Dict[str, List[float]],
+               corruption: float, rnd: random.Random, corruptions: list, fn: str,
+               leading_dot: bool = False) -> List[str]:
+    glonass = svs and svs[0][0] == 'R'
+    lines = [f"{'2.11':>9}{'':11}{'G: GLONASS NAV DATA' if glonass else 'N: GPS NAV DATA':<40}RINEX VERSION / TYPE\n"]
+    if not glonass:
+        lines.append('    0.1676D-07  0.2235D-07 -0.1192D-06 -0.1192D-06          ION ALPHA           \n')
+        lines.append('    0.1208D+06  0.1310D+06 -0.1310D+06 -0.1966D+06          ION BETA            \n')
+    lines.append(f"{'':60}END OF HEADER       \n")
+
+    for t in _epochs(date, NAV_INTERVAL['R' if glonass else 'G']):
+        for sv in svs:
+            values = _values(sv, t, orbits)
+            _corrupt(values, sv, t, corruption, rnd, corruptions, fn)
+            fields = [nav_field(v, 'D', leading_dot) for v in values]
+            lines.append(f'{int(sv[1:]):2d} {t:%y} {t.month:2d} {t.day:2d} {t.hour:2d} {t.minute:2d}{t.second:5.1f}'
+                         + ''.join(fields[:3]) + '\n')
+            for i in range(3, len(fields), 4):
+                lines.append('   ' + ''.join(fields[i:i + 4]) + '\n')
+
+    return lines
+
+
+def nav3_lines(date: datetime.date, svs: Sequence[str], orbits: Dict[str, List[float]],
+               corruption: float, rnd: random.Random, corruptions: list, fn: str) -> List[str]:
+    lines = [f"{'3.04':>9}{'':11}{'N: GNSS NAV DATA':<20}{'M: MIXED':<20}RINEX VERSION / TYPE\n",
+             'GPSA   7.4506E-09  2.2352E-08 -5.9605E-08 -1.1921E-07       IONOSPHERIC CORR    \n',
+             'GPSB   9.0112E+04  1.3107E+05 -6.5536E+04 -5.2429E+05       IONOSPHERIC CORR    \n',
+             'GAL    2.8750E+01  1.1719E-02  1.2207E-02  0.0000E+00       IONOSPHERIC CORR    \n',
+             f"{'':60}END OF HEADER       \n"]
+
+    records = []
+    for sv in svs:
+        for t in _epochs(date, NAV_INTERVAL[sv[0]]):
+            records.append((t, sv))
+    records.sort()  # NAV3 files are ordered by time, not by satellite
+
+    for t, sv in records:
+        values = _values(sv, t, orbits)
+        _corrupt(values, sv, t, corruption, rnd, corruptions, fn)
+        fields = [nav_field(v, 'E') for v in values]
+        lines.append(f'{sv} {t:%Y %m %d %H %M %S}' + ''.join(fields[:3]) + '\n')
+        for i in range(3, len(fields), 4):
+            lines.append('    ' + ''.join(fields[i:i + 4]) + '\n')
+
+    return lines
+
+
+def _obs_header(version: str, date: datetime.date, obs_interval: int) -> List[str]:
+    return [f"{version:>9}{'':11}{'OBSERVATION DATA':<20}{'M (MIXED)' if version < '3' else 'M':<20}RINEX VERSION / TYPE\n",
+            f"{'benchmarks':<20}{'benchmarks':<20}{date:%Y%m%d} 000000 UTC PGM / RUN BY / DATE \n",
+            f"{'SYNTHETIC':<60}MARKER NAME         \n",
+            f"{'  2849987.3450  2183143.6520  5237186.5830':<60}APPROX POSITION XYZ \n",
+            f"{obs_interval:10.3f}{'':50}INTERVAL            \n",
+            f"{date.year:6d}{date.month:6d}{date.day:6d}{0:6d}{0:6d}{0:13.7f}     GPS         TIME OF FIRST OBS   \n"]
+
+
+def _observations(sv: str, types: Sequence[str], obs_interval: int, state: Dict[str, list],
+                  rnd: random.Random) -> List[str]:
+    """F14.3 + LLI + SSI of every type, ranges and phases continue from the previous epoch"""
+    arcs = state.get(sv)
+    if arcs is None or rnd.random() < 0.002:  # new arc
+        arcs = state[sv] = [[rnd.randint(2 * 10 ** 10, 2 * 10 ** 10 + 10 ** 9), rnd.randint(-3000000, 3000000)]
+                            for _ in types]
+    obs = []
+    for arc, typ in zip(arcs, types):
+        arc[0] += arc[1] * obs_interval + rnd.randint(-5, 5)
+        if rnd.random() < 0.02:
+            obs.append(' ' * 16)
+            continue
+        if typ[0] == 'S':
+            v = 40000 + rnd.randint(0, 9000)
+        elif typ[0] == 'D':
+            v = arc[1] // 100
+        else:
+            v = arc[0] % 10 ** 13
+        q, r = divmod(abs(v), 1000)
+        field = f'{"-" if v < 0 else ""}{q}.{r:03d}'.rjust(14)
+        lli = '1' if rnd.random() < 0.001 else ' '
+        ssi = str(rnd.randint(5, 9)) if typ[0] != 'S' else ' '
+        obs.append(field + lli + ssi)
+
+    return obs
+
+
+def obs2_lines(date: datetime.date, svs: Sequence[str], obs_interval: int, rnd: random.Random) -> List[str]:
+    lines = _obs_header('2.11', date, obs_interval)
+    lines.append(f'{len(OBS2_TYPES):6d}' + ''.join(f'{t:>6}' for t in OBS2_TYPES).ljust(54) + '# / TYPES OF OBSERV \n')
+    lines.append(f"{'':60}END OF HEADER       \n")
+
+    state: Dict[str, list] = {}
+    t0 = datetime.datetime.combine(date, datetime.time())
+    for k in range(0, 86400 // obs_interval):
+        t = t0 + datetime.timedelta(seconds=k * obs_interval)
+        epoch_svs = [sv for i, sv in enumerate(svs) if (i * 7 + k // 240) % 3]
+        line = f' {t:%y} {t.month:2d} {t.day:2d} {t.hour:2d} {t.minute:2d}{t.second:11.7f}  0{len(epoch_svs):3d}'
+        lines.append(line + ''.join(epoch_svs[:12]) + '\n')
+        for i in range(12, len(epoch_svs), 12):
+            lines.append(' ' * 32 + ''.join(epoch_svs[i:i + 12]) + '\n')
+        for sv in epoch_svs:
+            obs = _observations(sv, OBS2_TYPES, obs_interval, state, rnd)
+            for i in range(0, len(obs), 5):
+                lines.append(''.join(obs[i:i + 5]).rstrip() + '\n')
+
+    return lines
+
+
+def obs3_lines(date: datetime.date, svs: Sequence[str], obs_interval: int, rnd: random.Random) -> List[str]:
+    lines = _obs_header('3.04', date, obs_interval)
+    for system in sorted({sv[0] for sv in svs}):
+        types = OBS3_TYPES[system]
+        lines.append(f'{system}  {len(types):3d}' + ''.join(' ' + t for t in types).ljust(54) + 'SYS / # / OBS TYPES \n')
+    lines.append(f"{'':60}END OF HEADER       \n")
+
+    state: Dict[str, list] = {}
+    t0 = datetime.datetime.combine(date, datetime.time())
+    for k in range(0, 86400 // obs_interval):
+        t = t0 + datetime.timedelta(seconds=k * obs_interval)
+        epoch_svs = [sv for i, sv in enumerate(svs) if (i * 7 + k // 240) % 3]
+        lines.append(f'> {t:%Y %m %d %H %M} {t.second:10.7f}  0{len(epoch_svs):3d}\n')
+        for sv in epoch_svs:
+            lines.append((sv + ''.join(_observations(sv, OBS3_TYPES[sv[0]], obs_interval, state, rnd))).rstrip() + '\n')
+
+    return lines
@@ -0,0 +1,162 @@
+"""
+writers for the compressed corpus variants: unix compress (.Z) and Hatanaka CRINEX
+"""
+from typing import Dict, Iterable, List, Optional
+
+
+def lzw_compress(data: bytes, maxbits: int = 16) -> bytes:
+    """
+    unix compress in block mode, codes are written in groups of n_bits bytes
+    and a group is padded when the code width grows, like compress(1) does
+    """
+    out = bytearray(b'\x1f\x9d' + bytes([maxbits | 0x80]))
+    n_bits = 9
+    group: List[int] = []
+
+    def flush():
+        value = 0
+        for i, code in enumerate(group):
+            value |= code << (i * n_bits)
+        # a full group is n_bits bytes, only the last group of the file is shorter
+        nbytes = n_bits if len(group) == 8 else (len(group) * n_bits + 7) // 8
+        out.extend(value.to_bytes(n_bits + 1, 'little')[:nbytes])
+        group.clear()
+
+    table = {bytes([i]): i for i in range(256)}
+    free = 257
+    w = b''
+    for byte in data:
+        wc = w + bytes([byte])
+        if wc in table:
+            w = wc
+            continue
+
+        group.append(table[w])
+        if len(group) == 8:
+            flush()
+        if free > (1 << n_bits) - 1 and n_bits < maxbits:
+            if group:  # pad the group to n_bits bytes
+                group.extend([0] * (8 - len(group)))
+                flush()
+            n_bits += 1
+        if free < 1 << maxbits:
+            table[wc] = free
+            free += 1
+        w = bytes([byte])
+
+    if w:
+        group.append(table[w])
+    if group:
+        flush()
+
+    return bytes(out)
+
+
+def crx_encode(lines: Iterable[str], order: int = 3) -> List[str]:
+    """
+    Hatanaka compression of RINEX 2 / 3 OBS lines to CRINEX 1.0 / 3.0 lines
+
+    Observations and the clock offset become order-th differences, epoch lines and flags text differences.
+    """
+    lines = iter(lines)
+    first = next(lines)
+    v3 = first[:9].strip().startswith('3')
+    out = [f"{'3.0' if v3 else '1.0':<20}{'COMPACT RINEX FORMAT':<40}CRINEX VERS   / TYPE\n",
+           f"{'benchmarks':<60}CRINEX PROG / DATE\n",
+           first]
+
+    ntypes: Dict[str, int] = {}
+    for ln in lines:
+        out.append(ln)
+        if 'SYS / # / OBS TYPES' in ln[60:] and ln[0] != ' ':
+            ntypes[ln[0]] = int(ln[3:6])
+        elif '# / TYPES OF OBSERV' in ln[60:] and ln[:6].strip():
+            ntypes[''] = int(ln[:6])
+        if 'END OF HEADER' in ln[60:]:
+            break
+
+    epoch = ''
+    clock: Optional[list] = None
+    arcs: Dict[str, tuple] = {}
+    for ln in lines:
+        ln = ln.rstrip('\r\n')
+        flag = ln[31:32] if v3 else ln[28:29]
+        Nsv = int(ln[32:35] if v3 else ln[29:32])
+        if flag.strip() and flag in '2345':
+            out.append((ln if v3 else '&' + ln[1:]) + '\n')
+            out.extend(next(lines) for _ in range(Nsv))
+            epoch = ''
+            arcs = {}
+            continue
+
+        if v3:
+            clock_field = ln[41:56].strip()
+            data = [next(lines).rstrip('\r\n') for _ in range(Nsv)]
+            svs = [d[:3] for d in data]
+            bodies = [d[3:] for d in data]
+            new_epoch = ln[:35].ljust(41) + ''.join(svs)
+        else:
+            clock_field = ln[68:80].strip()
+            sats = ln[32:68]
+            for _ in range(12, Nsv, 12):
+                sats += next(lines).rstrip('\r\n')[32:68]
+            svs = [sats[i:i + 3] for i in range(0, 3 * Nsv, 3)]
+            Nl = -(-ntypes[''] // 5)
+            bodies = [''.join(next(lines).rstrip('\r\n').ljust(80) for _ in range(Nl)) for _ in svs]
+            new_epoch = ln[:32] + ''.join(svs)
+
+        if not epoch:
+            out.append((new_epoch if v3 else '&' + new_epoch[1:]) + '\n')
+        else:
+            out.append(_text_diff(epoch, new_epoch) + '\n')
+        epoch = new_epoch
+
+        if clock_field:
+            field, clock = _arc_diff(clock, int(clock_field.replace('.', '')), order)
+            out.append(field + '\n')
+        else:
+            clock = None
+            out.append('\n')
+
+        new_arcs = {}
+        for sv, body in zip(svs, bodies):
+            ntype = ntypes[sv[0]] if v3 else ntypes['']
+            body = body.ljust(16 * ntype)
+            old_arcs, old_flags = arcs.get(sv, ([None] * ntype, ''))
+            fields = []
+            sv_arcs = []
+            for j in range(ntype):
+                value = body[16 * j:16 * j + 14]
+                if not value.strip():
+                    fields.append('')
+                    sv_arcs.append(None)
+                    continue
+                field, arc = _arc_diff(old_arcs[j], int(value.replace('.', '')), order)
+                fields.append(field)
+                sv_arcs.append(arc)
+
+            flags = ''.join(body[16 * j + 14:16 * j + 16] for j in range(ntype))
+            new_arcs[sv] = (sv_arcs, flags)
+            out.append((' '.join(fields) + ' ' + _text_diff(old_flags, flags)).rstrip() + '\n')
+        arcs = new_arcs
+
+    return out
+
+
+def _text_diff(old: str, new: str) -> str:
+    n = max(len(old), len(new))
+
+    return ''.join(' ' if o == c else ('&' if c == ' ' else c)
+                   for o, c in zip(old.ljust(n), new.ljust(n))).rstrip()
+
+
+def _arc_diff(arc: Optional[list], value: int, order: int):
+    """(field, arc) with arc = [order, value, 1st difference, ...] like the decoder keeps it"""
+    if arc is None:
+        return f'{order}&{value}', [order, value]
+
+    diffs = [value]
+    for i in range(1, min(len(arc) - 1, arc[0]) + 1):
+        diffs.append(diffs[-1] - arc[i])
+
+    return str(diffs[-1]), [arc[0]] + diffs
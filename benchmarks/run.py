@@ -0,0 +1,166 @@
+"""
+timed and memory profiled benchmarks of the merge pipeline
+
+    python -m benchmarks.run --stations 6 --days 1 --output results.json
+    python -m benchmarks.run --compare old.json new.json
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import parselib as pl
+from rinex_merger import merge_rinexes
+from bad_coefs_searcher import search_bad_coefs
+from rinex_writer import write_rinex
+from report_writer import write_report
+
+from .corpus import KINDS, generate_corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(func: Callable[[Any], Any], setup: Callable[[], Any] = lambda: None, repeat: int = 3) -> Dict[str, Any]:
+    """
+    run func(setup()) repeat times, only func is timed
+    the peak of traced Python allocations is measured in one extra run, tracing slows the code down
+    """
+    seconds = []
+    for _ in range(repeat):
+        arg = setup()
+        gc.collect()
+        t = time.perf_counter()
+        func(arg)
+        seconds.append(time.perf_counter() - t)
+        del arg
+
+    arg = setup()
+    gc.collect()
+    tracemalloc.start()
+    func(arg)
+    gc.collect()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': seconds, 'min': min(seconds), 'median': statistics.median(seconds), 'peak_bytes': peak}
+
+
+def _quiet(func, *args, **kwargs):
+    """merge_rinexes prints every file"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _merged(files: List[str]):
+    return _quiet(merge_rinexes, files)
+
+
+def _searched(files: List[str]):
+    merged = _merged(files)
+    merged['data'] = search_bad_coefs(merged['data'])
+    return merged
+
+
+def _write_report(merged, workdir: str):
+    report = os.path.join(workdir, 'report')
+    shutil.rmtree(report, ignore_errors=True)
+    write_report(merged['data'], report)
+
+
+def run_benchmarks(manifest: Dict[str, Any], workdir: str, repeat: int = 3) -> Dict[str, Dict[str, Any]]:
+    files = manifest['files']
+    nav = files.get('nav2', []) + files.get('nav3', [])
+    obs = files.get('obs2', []) + files.get('obs3', [])
+
+    results = {}
+    if nav:
+        results['rinexnav'] = measure(lambda _: [pl.rinexnav(fn) for fn in nav], repeat=repeat)
+        results['merge_rinexes'] = measure(lambda _: _merged(nav), repeat=repeat)
+        results['search_bad_coefs'] = measure(lambda m: search_bad_coefs(m['data']), lambda: _merged(nav), repeat)
+        results['write_rinex'] = measure(lambda m: write_rinex(m, filename=os.path.join(workdir, 'merged.rnx')),
+                                         lambda: _searched(nav), repeat)
+        results['write_report'] = measure(lambda m: _write_report(m, workdir), lambda: _searched(nav), repeat)
+    if obs:
+        def read_lines(_):
+            for fn in obs:
+                with pl.rio.opener(fn) as f:
+                    for _ in f:
+                        pass
+        results['opener_obs'] = measure(read_lines, repeat=repeat)
+
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                universal_newlines=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {'commit': commit, 'python': sys.version.split()[0], 'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> str:
+    """table of the new / old ratio of min time and peak memory per benchmark"""
+    rows = [f"{'benchmark':<20}{'old s':>10}{'new s':>10}{'ratio':>8}{'old MB':>10}{'new MB':>10}{'ratio':>8}"]
+    for name, n in new['results'].items():
+        o = old['results'].get(name)
+        if o is None:
+            continue
+        rows.append(f"{name:<20}{o['min']:10.3f}{n['min']:10.3f}{n['min'] / o['min']:8.2f}"
+                    f"{o['peak_bytes'] / 1e6:10.1f}{n['peak_bytes'] / 1e6:10.1f}"
+                    f"{n['peak_bytes'] / max(o['peak_bytes'], 1):8.2f}")
+
+    return '\n'.join(rows)
+
+
+def main(argv: List[str] = None):
+    p = argparse.ArgumentParser(description='benchmark the RINEX merge pipeline on a synthetic corpus')
+    p.add_argument('--stations', type=int, default=6)
+    p.add_argument('--days', type=int, default=1)
+    p.add_argument('--constellations', default='GRE')
+    p.add_argument('--kinds', nargs='+', default=list(KINDS), choices=KINDS)
+    p.add_argument('--corruption', type=float, default=0.05)
+    p.add_argument('--wrap', nargs='*', default=[], choices=('crx', 'gz', 'Z'))
+    p.add_argument('--obs-interval', type=int, default=30)
+    p.add_argument('--seed', type=int, default=1)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--corpus', help='keep the corpus in this directory')
+    p.add_argument('--output', default='benchmark_results.json')
+    p.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files and exit')
+    a = p.parse_args(argv)
+
+    if a.compare:
+        with open(a.compare[0]) as f, open(a.compare[1]) as g:
+            print(compare(json.load(f), json.load(g)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = a.corpus or os.path.join(tmp, 'corpus')
+        manifest = generate_corpus(corpus, a.stations, a.days, a.constellations, a.kinds, a.corruption,
+                                   a.wrap, a.obs_interval, seed=a.seed)
+        results = run_benchmarks(manifest, tmp, a.repeat)
+
+    out = {'environment': environment(), 'corpus': manifest['params'], 'results': results}
+    with open(a.output, 'w') as f:
+        json.dump(out, f, indent=1)
+
+    for name, r in results.items():
+        print(f"{name:<20}{r['min']:10.3f} s{r['peak_bytes'] / 1e6:10.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
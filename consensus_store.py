@@ -0,0 +1,104 @@
+import datetime
+import json
+
+import numpy as np
+
+CONSENSUS_FILE = 'merged.npz'
+
+
+def write_consensus(rinex_merged, filename=CONSENSUS_FILE):
+    """
+    write the result of merge_rinexes and search_bad_coefs to a npz file:
+    sv x epoch x coefficient arrays of the right coefs and their votes, every candidate with
+    its count, the candidate it was merged into and its owners, and the merged header
+    """
+    table = rinex_merged['data']
+    arrays = table.consensus_arrays()
+    meta = {
+        'header': rinex_merged['header'],
+        'datetimes': [[d.isoformat(), n] for d, n in rinex_merged['datetimes'].items()],
+        'max_i_q': rinex_merged['max_i_q'],
+    }
+
+    np.savez(filename,
+             files=np.array(table.files, dtype=str),
+             values=np.array(table.values, dtype=str),
+             ncoefs=_ncoefs(arrays['value']),
+             meta=np.array(json.dumps(meta)),
+             **arrays)
+
+
+def read_consensus(filename=CONSENSUS_FILE):
+    """
+    a consensus written by write_consensus, shaped like the result of merge_rinexes,
+    so write_rinex can write it again: {'header', 'datetimes', 'max_i_q', 'data': Consensus}
+    """
+    consensus = Consensus(filename)
+    meta = json.loads(consensus['meta'].item())
+
+    return {
+        'header': meta['header'],
+        'datetimes': {datetime.datetime.fromisoformat(d): n for d, n in meta['datetimes']},
+        'max_i_q': meta['max_i_q'],
+        'data': consensus,
+    }
+
+
+def _ncoefs(value):
+    """coefficients of every record, the right coefs of a record are one run from index 0"""
+    return (value >= 0).sum(axis=2).astype(np.uint8)
+
+
+class Consensus:
+    """
+    arrays of a consensus file, each read from the file when first used
+
+    consensus['value'][i, j, k] is the value id of coefficient k of satellite consensus['sv'][i]
+    at consensus['epoch'][j], see MergeTable.consensus_arrays for the others
+    """
+
+    def __init__(self, filename):
+        self._file = np.load(filename, allow_pickle=False)
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = self._file[name]
+
+        return self._arrays[name]
+
+    def keys(self):
+        return self._file.files
+
+    @property
+    def files(self):
+        return self['files'].tolist()
+
+    def right_coefs(self):
+        """
+        yields (sv, epoch, right coefs) of every record, sorted by satellite and epoch
+        like MergeTable.right_coefs
+        """
+        values = self['values']
+        value = self['value']
+        ncoefs = self['ncoefs']
+        epochs = self['epoch'].tolist()
+        for i, sv in enumerate(self['sv'].tolist()):
+            for j in np.flatnonzero(ncoefs[i]).tolist():
+                yield sv, epochs[j], values[value[i, j, :ncoefs[i, j]]].tolist()
+
+    def owners(self, candidate):
+        """files of a candidate in merge order"""
+        start = self['owner_start']
+        files = self['files']
+
+        return files[self['owner_file'][start[candidate]:start[candidate + 1]]].tolist()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,149 @@
+import argparse
+import logging
+import os
+import time
+
+from rinex_merger import merge_rinexes, get_datetime_from_file_name
+from merge_state import MergeState
+from bad_coefs_searcher import search_bad_coefs
+from rinex_writer import write_rinex
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+POLL_INTERVAL = 1.0  # seconds between directory scans without inotify
+DEBOUNCE = 2.0  # seconds without changes before the output is rewritten
+IGNORED_SUFFIXES = ('.tmp', '.part', '.idx.npz', '.npz')
+
+
+def mergeable(name):
+    """files of the input directory which are merged: RINEX names merge_rinexes can date"""
+    if name.startswith('.') or name.endswith(IGNORED_SUFFIXES):
+        return False
+    try:
+        get_datetime_from_file_name(name)
+    except Exception:
+        return False
+
+    return True
+
+
+class DirectoryWatcher:
+    """
+    files of a directory and their (size, mtime), rescanned when inotify reports a change
+    or every poll seconds if inotify_simple is not installed
+
+    A file is listed once it is unchanged for one scan, so files still being copied are not merged.
+    """
+
+    def __init__(self, directory, poll=POLL_INTERVAL):
+        self.directory = directory
+        self.poll = poll
+        self._seen = {}
+        self._settled = {}
+        self._inotify = None
+        if inotify_simple is not None:
+            flags = inotify_simple.flags
+            self._inotify = inotify_simple.INotify()
+            self._inotify.add_watch(directory, flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM | flags.DELETE)
+
+    def scan(self):
+        """rescan, return: True if the settled files changed"""
+        seen = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and mergeable(entry.name):
+                    stat = entry.stat()
+                    seen[entry.path] = (stat.st_size, stat.st_mtime_ns)
+
+        settled = {path: fp for path, fp in seen.items() if self._seen.get(path) == fp}
+        self._seen = seen
+        changed = settled != self._settled
+        self._settled = settled
+
+        return changed
+
+    def pending(self):
+        """files seen but not settled yet"""
+        return len(self._seen) != len(self._settled)
+
+    def wait(self, timeout):
+        """block until the directory may have changed or timeout seconds passed"""
+        if self._inotify is not None and not self.pending():
+            self._inotify.read(timeout=int(timeout * 1000))
+        else:
+            time.sleep(min(timeout, self.poll))
+
+    def files(self):
+        return sorted(self._settled)
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+
+
+def write_atomic(merged, output):
+    """replace output by the merged RINEX, readers never see a partly written file"""
+    tmp = output + '.tmp'
+    write_rinex(merged, filename=tmp)
+    os.replace(tmp, output)
+
+
+def ingest(directory, output, state_dir=None, workers=None, debounce=DEBOUNCE, poll=POLL_INTERVAL, once=False):
+    """
+    watch directory and keep output the merged RINEX of its files
+
+    Every new or changed file is parsed once and folded into the merge table kept in memory,
+    search_bad_coefs reruns for the slots it touched and output is rewritten once no file
+    changed for debounce seconds. The state is saved to state_dir after each update, so a
+    restarted ingest continues where it stopped.
+    once: update for the files present and return
+    """
+    state = MergeState.load(state_dir) if state_dir else MergeState()
+    watcher = DirectoryWatcher(directory, poll)
+    last_change = None
+    try:
+        watcher.scan()
+        while True:
+            if watcher.scan():
+                last_change = time.monotonic()
+            elif once and not watcher.pending():
+                last_change = last_change or time.monotonic() - debounce
+
+            if last_change is not None and time.monotonic() - last_change >= debounce and not watcher.pending():
+                t = time.monotonic()
+                merged = merge_rinexes(watcher.files(), workers=workers, state=state)
+                if merged['datetimes']:
+                    merged['data'] = search_bad_coefs(merged['data'])
+                    write_atomic(merged, output)
+                if state_dir:
+                    state.save(state_dir)
+                logging.info(f'{output} updated from {len(watcher.files())} files in {time.monotonic() - t:.2f} s')
+                last_change = None
+                if once:
+                    return merged
+
+            watcher.wait(debounce if last_change is not None else poll)
+    finally:
+        watcher.close()
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description='watch a directory of NAV files and keep their merged RINEX up to date')
+    p.add_argument('directory')
+    p.add_argument('-o', '--output', default='merged.rnx')
+    p.add_argument('--state', help='directory keeping the merge state between runs')
+    p.add_argument('-j', '--workers', type=int, default=os.cpu_count())
+    p.add_argument('--debounce', type=float, default=DEBOUNCE)
+    p.add_argument('--poll', type=float, default=POLL_INTERVAL)
+    p.add_argument('--once', action='store_true', help='merge the files present and exit')
+    a = p.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    ingest(a.directory, a.output, a.state, a.workers, a.debounce, a.poll, a.once)
+
+
+if __name__ == '__main__':
+    main()
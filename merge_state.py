@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+from merge_table import MergeTable
+
+TABLE_FILE = 'table.npz'
+FILES_FILE = 'files.json'
+
+
+def fingerprint(file):
+    """(size, modification time) of a file, a changed fingerprint means the file is parsed again"""
+    stat = os.stat(file)
+
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class MergeState:
+    """
+    Merge table and what is known about every merged file, kept in a directory between runs.
+
+    files: {file: {'fingerprint': [size, mtime], 'date': iso date from the file name,
+                   'ionospheric_corr': {gps: [coef, ...]} or None if the file couldn't be read,
+                   'reason': why the file couldn't be read, if it couldn't}}
+    filters: {'use': [system, ...] or None, 'tlim': [start, stop] or None} the files were parsed with,
+             None if not known yet
+    """
+
+    def __init__(self, table=None, files=None, filters=None):
+        self.table = table if table is not None else MergeTable()
+        self.files = files if files is not None else {}
+        self.filters = filters
+
+    @classmethod
+    def load(cls, directory):
+        """state saved in directory, an empty state if there is none"""
+        table_path = os.path.join(directory, TABLE_FILE)
+        files_path = os.path.join(directory, FILES_FILE)
+        if not (os.path.exists(table_path) and os.path.exists(files_path)):
+            return cls()
+
+        with open(files_path) as f:
+            meta = json.load(f)
+        if 'files' not in meta:  # saved without its filters, they are unknown
+            meta = {'files': meta, 'filters': None}
+
+        return cls(MergeTable.load(table_path), meta['files'], meta['filters'])
+
+    def save(self, directory):
+        """replace the state saved in directory"""
+        os.makedirs(directory, exist_ok=True)
+
+        table_tmp = os.path.join(directory, 'table.tmp.npz')
+        self.table.save(table_tmp)
+        files_tmp = os.path.join(directory, FILES_FILE + '.tmp')
+        with open(files_tmp, 'w') as f:
+            json.dump({'filters': self.filters, 'files': self.files}, f)
+
+        os.replace(table_tmp, os.path.join(directory, TABLE_FILE))
+        os.replace(files_tmp, os.path.join(directory, FILES_FILE))
+
+    def set_filters(self, use=None, tlim=None):
+        """
+        the use and tlim files are parsed with, the files of a state made with other filters are forgotten
+        return: True if files were forgotten
+        """
+        filters = {'use': None if use is None else sorted(use),
+                   'tlim': None if tlim is None else [t.isoformat() if isinstance(t, datetime.datetime) else str(t)
+                                                      for t in tlim]}
+        if filters == self.filters:
+            return False
+
+        forget = list(self.files)
+        self.table.remove_files(forget)
+        self.files = {}
+        self.filters = filters
+
+        return bool(forget)
+
+    def outdated(self, files):
+        """
+        forget the files which are not in files any more or have changed
+        return: files to parse, in the order of files
+        """
+        current = set(files)
+        forget = [file for file, meta in self.files.items()
+                  if file not in current or not os.path.exists(file) or fingerprint(file) != meta['fingerprint']]
+
+        self.table.remove_files(forget)
+        for file in forget:
+            del self.files[file]
+
+        return [file for file in files if file not in self.files]
+
+    def add_file(self, file, date, ionospheric_corr, reason=None):
+        """
+        remember a parsed file, its records are added to the table by the caller
+        reason: why a file without ionospheric_corr couldn't be read
+        """
+        self.files[file] = {
+            'fingerprint': fingerprint(file),
+            'date': date.isoformat(),
+            'ionospheric_corr': ionospheric_corr,
+        }
+        if reason is not None:
+            self.files[file]['reason'] = reason
+
+    def file_date(self, file):
+        return datetime.datetime.fromisoformat(self.files[file]['date'])
@@ -0,0 +1,230 @@
+from itertools import groupby
+import os
+from pathlib import Path
+import sqlite3
+
+import numpy as np
+
+from merge_table import SLOT_WIDTH, order_ranks
+from parselib.epochs import from_epoch
+
+BATCH_ROWS = 1 << 16  # coefficient rows inserted at once
+CHUNK_RECORDS = 1 << 12  # records searched for the consensus at once
+POSITION = 1 << 40  # first seen position = file rank * POSITION + row id
+APPLICATION_ID = 0x524E584D  # 'RNXM' in the database header, marks the databases SqliteMergeTable made
+
+SCHEMA = """
+CREATE TABLE files (id INTEGER PRIMARY KEY, name TEXT, rank INTEGER);
+CREATE TABLE records (id INTEGER PRIMARY KEY, sv TEXT, epoch INTEGER);
+CREATE TABLE coefs (rec INTEGER, idx INTEGER, value TEXT, file INTEGER);
+CREATE TABLE candidates (id INTEGER PRIMARY KEY, rec INTEGER, idx INTEGER, value TEXT, count INTEGER,
+                         parent INTEGER, winner INTEGER);
+CREATE INDEX records_sv ON records (sv, epoch);
+CREATE INDEX candidates_rec ON candidates (rec, idx);
+"""
+
+
+class SqliteMergeTable:
+    """
+    MergeTable kept in a SQLite database file, for merges that don't fit in memory
+
+    Every coefficient a file gives is a row of coefs, inserted in batches. The candidates of each
+    (sv, epoch, coefficient index) slot are aggregated in SQL and searched for the consensus in chunks
+    of records, right_coefs and report_records stream from the database in sorted order.
+    Memory holds the id of every record and one batch or chunk, not the candidates of all files.
+
+    The database is created anew, it doesn't keep a merge between runs like MergeState does.
+    An existing file at path is only replaced if it is a database made by this class.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.exists(path):
+            if not _created_here(path):
+                raise FileExistsError(f'{path} is not a merge database, not replacing it')
+            os.remove(path)
+        self._db = sqlite3.connect(path)
+        # the database is rebuilt by every run, a crash loses nothing worth a journal on disk
+        self._db.execute('PRAGMA journal_mode = MEMORY')
+        self._db.execute('PRAGMA synchronous = OFF')
+        self._db.execute(f'PRAGMA application_id = {APPLICATION_ID}')
+        self._db.executescript(SCHEMA)
+
+        self.files = []
+        self._file_ids = {}
+        self._records = {}  # (sv, epoch) -> record id
+        self._nrecords = 0  # next record id
+        self._rows = []
+        self.max_i_q = 0
+
+    def file_id(self, file, repeat=False):
+        """intern file name, repeat: a new id for a file listed again"""
+        try:
+            if not repeat:
+                return self._file_ids[file]
+            raise KeyError(file)
+        except KeyError:
+            file_id = self._file_ids[file] = len(self.files)
+            self.files.append(file)
+            self._db.execute('INSERT INTO files VALUES (?, ?, ?)', (file_id, file, file_id))
+            return file_id
+
+    def add_record(self, file_id, sv, epoch, coefs):
+        """
+        add coefficient strings of one record of one file
+        epoch: integer microseconds, see parselib.epochs
+        """
+        rec = self._records.get((sv, epoch))
+        if rec is None:
+            rec = self._records[(sv, epoch)] = self._nrecords
+            self._nrecords += 1
+            self._db.execute('INSERT INTO records VALUES (?, ?, ?)', (rec, sv, epoch))
+
+        self._rows.extend((rec, idx, coef, file_id) for idx, coef in enumerate(coefs))
+        if len(coefs) - 1 > self.max_i_q:
+            self.max_i_q = len(coefs) - 1
+        if len(self._rows) >= BATCH_ROWS:
+            self._flush()
+
+    def _index(self):
+        """
+        index coefs by slot once they are all inserted, cheaper than updating the index on every insert,
+        file makes it cover the candidate aggregation
+        """
+        self._flush()
+        self._db.execute('CREATE INDEX IF NOT EXISTS coefs_slot ON coefs (rec, idx, value, file)')
+
+    def _flush(self):
+        self._db.executemany('INSERT INTO coefs VALUES (?, ?, ?, ?)', self._rows)
+        self._rows = []
+
+    def set_file_order(self, files):
+        """merge in the order of files, files not listed go last"""
+        self._db.executemany('UPDATE files SET rank = ? WHERE id = ?',
+                             [(rank, i) for i, rank in enumerate(order_ranks(files, self.files))])
+
+    def remove_files(self, files):
+        """remove all records files added, records no file gives any more are dropped"""
+        file_ids = [(self._file_ids[file],) for file in files if file in self._file_ids]
+        if not file_ids:
+            return
+
+        self._flush()
+        self._db.executemany('DELETE FROM coefs WHERE file = ?', file_ids)
+        self._db.execute('DELETE FROM records WHERE id NOT IN (SELECT DISTINCT rec FROM coefs)')
+        self._records = {(sv, epoch): rec for rec, sv, epoch in self._db.execute('SELECT * FROM records')}
+
+    def candidate_chunks(self):
+        """
+        candidates of CHUNK_RECORDS records at a time, like MergeTable.candidates:
+        yields (candidate ids, slots, float values, counts), candidates sorted by slot and first seen
+        """
+        self._index()
+        self._db.execute('DELETE FROM candidates')
+        n = 0
+        for rec0 in range(0, self._nrecords, CHUNK_RECORDS):
+            rows = self._db.execute(
+                'SELECT c.rec, c.idx, c.value, COUNT(*), MIN(f.rank * ? + c.rowid) AS first '
+                'FROM coefs c JOIN files f ON f.id = c.file WHERE c.rec >= ? AND c.rec < ? '
+                'GROUP BY c.rec, c.idx, c.value ORDER BY c.rec, c.idx, first',
+                (POSITION, rec0, rec0 + CHUNK_RECORDS)).fetchall()
+            if not rows:
+                continue
+
+            ids = np.arange(n, n + len(rows))
+            n += len(rows)
+            self._db.executemany('INSERT INTO candidates VALUES (?, ?, ?, ?, ?, -1, 0)',
+                                 [(i, rec, idx, value, count) for i, (rec, idx, value, count, _) in zip(ids.tolist(), rows)])
+            slots = np.array([rec * SLOT_WIDTH + idx for rec, idx, *_ in rows], dtype=np.int64)
+            values = np.array([float(value) for _, _, value, _, _ in rows])
+            counts = np.array([count for _, _, _, count, _ in rows], dtype=np.int64)
+            yield ids, slots, values, counts
+
+    def set_chunk_consensus(self, ids, parent, winners):
+        """
+        parent: per candidate of the chunk the candidate of the chunk it was merged into, -1 if kept
+        winners: the right candidate of every slot of the chunk
+        """
+        merged = np.flatnonzero(parent >= 0)
+        self._db.executemany('UPDATE candidates SET parent = ? WHERE id = ?',
+                             zip(ids[parent[merged]].tolist(), ids[merged].tolist()))
+        self._db.executemany('UPDATE candidates SET winner = 1 WHERE id = ?', [(i,) for i in ids[winners].tolist()])
+
+    def right_coefs(self):
+        """
+        yields (sv, epoch, right coefs) of every record, sorted by satellite and epoch
+        needs the consensus
+        """
+        rows = self._db.execute('SELECT r.sv, r.epoch, c.value FROM records r JOIN candidates c ON c.rec = r.id '
+                                'WHERE c.winner ORDER BY r.sv, r.epoch, c.idx')
+        for (sv, epoch), coefs in groupby(rows, key=lambda row: row[:2]):
+            yield sv, epoch, [coef for _, _, coef in coefs]
+
+    def report_records(self):
+        """
+        yields (sv, datetime, coefs) of every record in the order the files first give them, coefs like
+        MergeTable gives them after the consensus: [{'rigth_coef': {...}, 'error_coefs': [{...}, ...]}, ...]
+        """
+        order = self._db.execute(
+            'WITH rf AS (SELECT c.rec AS rec, MIN(f.rank * ? + c.rowid) AS first '
+            '            FROM coefs c JOIN files f ON f.id = c.file GROUP BY c.rec), '
+            'sf AS (SELECT r.sv AS sv, MIN(rf.first) AS first FROM rf JOIN records r ON r.id = rf.rec GROUP BY r.sv) '
+            'SELECT r.id, r.sv, r.epoch FROM rf JOIN records r ON r.id = rf.rec JOIN sf ON sf.sv = r.sv '
+            'ORDER BY sf.first, rf.first', (POSITION,))
+        reader = self._db.cursor()
+        for rec, sv, epoch in order:
+            cands = reader.execute('SELECT id, idx, value, count, parent FROM candidates WHERE rec = ? ORDER BY id',
+                                   (rec,)).fetchall()
+            owners = {}
+            for idx, value, file in reader.execute(
+                    'SELECT c.idx, c.value, c.file FROM coefs c JOIN files f ON f.id = c.file WHERE c.rec = ? '
+                    'ORDER BY f.rank, c.rowid', (rec,)):
+                owners.setdefault((idx, value), []).append(self.files[file])
+
+            coefs = []
+            for idx, slot in groupby(cands, key=lambda c: c[1]):
+                coefs.append(_slot(list(slot), owners, idx))
+
+            yield sv, from_epoch(epoch), coefs
+
+    def commit(self):
+        self._flush()
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+
+def _created_here(path):
+    try:
+        db = sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+        try:
+            return db.execute('PRAGMA application_id').fetchone()[0] == APPLICATION_ID
+        finally:
+            db.close()
+    except sqlite3.DatabaseError:  # not a database
+        return False
+
+
+def _slot(cands, owners, idx):
+    """candidates of one slot grouped like MergeTable._slot"""
+    children = {c[0]: [] for c in cands}
+    roots = []
+    for c in cands:
+        if c[4] < 0:
+            roots.append(c)
+        else:
+            children[c[4]].append(c)
+
+    def group(c):
+        coef = {'count': c[3], 'owners': list(owners[idx, c[2]])}
+        for child in children[c[0]]:
+            merged = group(child)
+            coef['count'] += merged['count']
+            coef['owners'] += merged['owners']
+        coef['value'] = c[2]
+        return coef
+
+    groups = sorted(map(group, roots), key=lambda x: x['count'], reverse=True)
+
+    return {'rigth_coef': groups[0], 'error_coefs': groups[1:]}
@@ -0,0 +1,593 @@
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+from parselib.epochs import to_epoch, from_epoch
+
+SLOT_WIDTH = 256  # coefficient indexes per record, slot = record * SLOT_WIDTH + index
+
+
+class MergeTable(Mapping):
+    """
+    Columnar store of the coefficient candidates of all merged files.
+
+    A record is a (satellite, integer epoch) pair. The coefficients a file gives for
+    a record are interned once as a variant (a run of value ids in a typed array);
+    files that agree share the variant, so each file adds one (file id, variant id)
+    occurrence per record instead of a dict entry and an owner per coefficient.
+
+    The table reads like the nested dict merge_rinexes used to build:
+    table[sv][datetime][coef_idx] -> {value: {'count': int, 'owners': [file, ...]}}
+    and after set_consensus():
+    table[sv][datetime][coef_idx] -> {'rigth_coef': {...}, 'error_coefs': [{...}, ...]}
+    The dicts are created on access only.
+
+    For incremental merging files can be removed again, records touched since the last
+    set_consensus() are kept as dirty, and the whole table is saved to and loaded from npz.
+    """
+
+    def __init__(self):
+        self.files = []
+        self._file_ids = {}
+        self.values = []
+        self._value_ids = {}
+        self._value_floats = np.empty(0)
+
+        self.svs = {}  # sv -> record ids in insertion order
+        self._records = {}  # (sv, epoch) -> record id
+        self.rec_sv = []
+        self.rec_epoch = array('q')
+        self.rec_ncoefs = array('B')
+
+        self._variants = {}  # (record id, coefs) -> variant id
+        self.var_rec = array('i')
+        self.var_start = array('q')  # offset in var_values
+        self.var_values = array('i')
+
+        self.occ_variant = array('i')
+        self.occ_file = array('i')
+
+        self.max_i_q = 0
+        self.file_order = None  # rank per file id, None means the order files were added in
+
+        self._dirty = set()  # record ids changed since the last set_consensus()
+        self._consensus = None  # (slot, parent relative to its slot) of every candidate of the last consensus
+
+        self._index = None
+        self._parent = None
+        self._winners = None
+
+    def file_id(self, file, repeat=False):
+        """
+        intern file name
+        repeat: a new id for a file listed again, its records are counted again
+        """
+        try:
+            if not repeat:
+                return self._file_ids[file]
+            raise KeyError(file)
+        except KeyError:
+            self._file_ids[file] = len(self.files)
+            self.files.append(file)
+            if self.file_order is not None:
+                self.file_order.append(max(self.file_order, default=-1) + 1)
+            return self._file_ids[file]
+
+    def add_record(self, file_id, sv, epoch, coefs):
+        """
+        add coefficient strings of one record of one file
+        epoch: integer microseconds, see parselib.epochs
+        """
+        key = (sv, epoch)
+        rec = self._records.get(key)
+        if rec is None:
+            rec = len(self.rec_sv)
+            self._records[key] = rec
+            self.svs.setdefault(sv, []).append(rec)
+            self.rec_sv.append(sv)
+            self.rec_epoch.append(epoch)
+            self.rec_ncoefs.append(0)
+
+        key = (rec, tuple(coefs))
+        variant = self._variants.get(key)
+        if variant is None:
+            variant = self._variants[key] = len(self.var_rec)
+            self.var_rec.append(rec)
+            self.var_start.append(len(self.var_values))
+            self.var_values.extend(map(self._value_id, coefs))
+
+            n = len(coefs)
+            if n > self.rec_ncoefs[rec]:
+                self.rec_ncoefs[rec] = n
+            if n - 1 > self.max_i_q:
+                self.max_i_q = n - 1
+
+        self.occ_variant.append(variant)
+        self.occ_file.append(file_id)
+        self._dirty.add(rec)
+
+        self._index = None
+        self._parent = None
+        self._winners = None
+
+    def _value_id(self, coef):
+        v = self._value_ids.get(coef)
+        if v is None:
+            v = self._value_ids[coef] = len(self.values)
+            self.values.append(coef)
+
+        return v
+
+    def value_floats(self):
+        """float of every interned value, converted once"""
+        if self._value_floats.size < len(self.values):
+            new = self.values[self._value_floats.size:]
+            self._value_floats = np.append(self._value_floats, np.fromiter(map(float, new), float, len(new)))
+
+        return self._value_floats
+
+    def file_ranks(self):
+        if self.file_order is None:
+            return np.arange(len(self.files))
+
+        return np.asarray(self.file_order)
+
+    def set_file_order(self, files):
+        """
+        merge in the order of files, files not listed go last
+        records and satellites are reordered like they would be added in this order
+        """
+        ranks = order_ranks(files, self.files)
+
+        # files of the clean records must keep their relative order, else the first seen order changes
+        occ_rec = np.array(self.var_rec, dtype=np.int64)[np.array(self.occ_variant, dtype=np.int64)]
+        clean = ~np.isin(occ_rec, list(self._dirty))
+        used = np.unique(np.array(self.occ_file, dtype=np.int64)[clean])
+        if not np.array_equal(np.argsort(self.file_ranks()[used]), np.argsort(np.asarray(ranks, dtype=np.int64)[used])):
+            self._dirty.update(range(len(self.rec_sv)))
+
+        self.file_order = ranks
+        self._index = None
+        self._parent = None
+        self._winners = None
+
+        index = self._build_index()
+        rec_first = np.full(len(self.rec_sv), index['pos'].size, dtype=np.int64)
+        np.minimum.at(rec_first, occ_rec, index['pos'])
+
+        self.svs = {}
+        for rec in np.argsort(rec_first, kind='stable').tolist():
+            self.svs.setdefault(self.rec_sv[rec], []).append(rec)
+
+    def remove_files(self, files):
+        """
+        remove all records files added, records no file gives any more are dropped
+        record and variant ids are compacted, file ids are kept
+        """
+        file_ids = [self._file_ids[file] for file in files if file in self._file_ids]
+        occ_file = np.array(self.occ_file, dtype=np.int64)
+        occ_variant = np.array(self.occ_variant, dtype=np.int64)
+        drop = np.isin(occ_file, file_ids)
+        if not drop.any():
+            return
+
+        var_rec = np.array(self.var_rec, dtype=np.int64)
+        var_start = np.array(self.var_start, dtype=np.int64)
+        var_values = np.array(self.var_values, dtype=np.int64)
+        lens = np.diff(np.append(var_start, var_values.size))
+
+        used_var = np.zeros(var_rec.size, dtype=bool)
+        used_var[occ_variant[~drop]] = True
+        var_map = np.cumsum(used_var) - 1
+        used_rec = np.zeros(len(self.rec_sv), dtype=bool)
+        used_rec[var_rec[used_var]] = True
+        rec_map = np.cumsum(used_rec) - 1
+
+        touched = set(var_rec[occ_variant[drop]].tolist()) | self._dirty
+        new_var_rec = rec_map[var_rec[used_var]]
+        new_lens = lens[used_var]
+
+        self.occ_variant = array('i', var_map[occ_variant[~drop]].tolist())
+        self.occ_file = array('i', occ_file[~drop].tolist())
+
+        self.var_rec = array('i', new_var_rec.tolist())
+        self.var_start = array('q', (np.cumsum(new_lens) - new_lens).tolist())
+        self.var_values = array('i', var_values[np.repeat(used_var, lens)].tolist())
+
+        rec_map_l = rec_map.tolist()
+        used_var_l = used_var.tolist()
+        used_rec_l = used_rec.tolist()
+        var_map_l = var_map.tolist()
+        self._variants = {(rec_map_l[rec], coefs): var_map_l[var]
+                          for (rec, coefs), var in self._variants.items() if used_var_l[var]}
+
+        self.rec_sv = [sv for sv, used in zip(self.rec_sv, used_rec_l) if used]
+        self.rec_epoch = array('q', np.array(self.rec_epoch, dtype=np.int64)[used_rec].tolist())
+        ncoefs = np.zeros(len(self.rec_sv), dtype=np.int64)
+        np.maximum.at(ncoefs, new_var_rec, new_lens)
+        self.rec_ncoefs = array('B', ncoefs.tolist())
+        self.max_i_q = max(int(ncoefs.max(initial=0)) - 1, 0)
+
+        self._records = {(sv, epoch): rec for rec, (sv, epoch) in enumerate(zip(self.rec_sv, self.rec_epoch))}
+        svs = {}
+        for sv, recs in self.svs.items():
+            recs = [rec_map_l[rec] for rec in recs if used_rec_l[rec]]
+            if recs:
+                svs[sv] = recs
+        self.svs = svs
+
+        self._dirty = {rec_map_l[rec] for rec in touched if used_rec_l[rec]}
+        if self._consensus is not None:
+            slot, rel = self._consensus
+            rec = slot // SLOT_WIDTH
+            keep = used_rec[rec]
+            self._consensus = (rec_map[rec[keep]] * SLOT_WIDTH + slot[keep] % SLOT_WIDTH, rel[keep])
+
+        self._index = None
+        self._parent = None
+        self._winners = None
+
+    def candidates(self):
+        """
+        distinct values of every slot, sorted by slot and by the file order they were first seen in
+        slot = record id * SLOT_WIDTH + coefficient index
+        return: (slot, value id, count) arrays
+        """
+        index = self._build_index()
+
+        return index['slot'], index['value'], index['count']
+
+    def set_consensus(self, parent, winners):
+        """
+        parent: per candidate (as returned by candidates()) the candidate it was merged into, -1 if kept
+        winners: the right candidate of every slot, in slot order
+        """
+        index = self._build_index()
+        self._parent = np.asarray(parent)
+        self._winners = np.asarray(winners)
+
+        slot_start = index['slot_start']
+        own_start = np.repeat(slot_start[:-1], np.diff(slot_start))
+        self._consensus = (index['slot'], np.where(self._parent < 0, -1, self._parent - own_start))
+        self._dirty = set()
+
+    def reusable_consensus(self):
+        """
+        parents of the last set_consensus() for the slots no record change touched since
+        return: (parent per candidate, mask of the candidates which still have to be merged)
+        """
+        index = self._build_index()
+        n = index['slot'].size
+        parent = np.full(n, -1)
+        todo = np.ones(n, dtype=bool)
+        if self._consensus is None or n == 0 or self._consensus[0].size == 0:
+            return parent, todo
+
+        old_slot, old_rel = self._consensus
+        old_keys, old_start, old_count = np.unique(old_slot, return_index=True, return_counts=True)
+        keys = index['slot_keys']
+        start = index['slot_start'][:-1]
+        count = np.diff(index['slot_start'])
+
+        i = np.minimum(np.searchsorted(old_keys, keys), old_keys.size - 1)
+        dirty = np.zeros(len(self.rec_sv), dtype=bool)
+        dirty[list(self._dirty)] = True
+        clean = (old_keys[i] == keys) & (old_count[i] == count) & ~dirty[keys // SLOT_WIDTH]
+
+        lens = count[clean]
+        new = _ranges(start[clean], lens)
+        rel = old_rel[_ranges(old_start[i[clean]], lens)]
+        parent[new] = np.where(rel < 0, -1, rel + np.repeat(start[clean], lens))
+        todo[new] = False
+
+        return parent, todo
+
+    def right_coefs(self):
+        """
+        yields (sv, epoch, right coefs) of every record, sorted by satellite and epoch
+        needs set_consensus()
+        """
+        index = self._build_index()
+        slot_keys = index['slot_keys']
+        coefs = np.array(self.values, dtype=object)[index['value'][self._winners]].tolist()
+        # slots are sorted, so the coefs of a record are one run
+        bounds = np.searchsorted(slot_keys, np.arange(len(self.rec_sv) + 1) * SLOT_WIDTH).tolist()
+
+        sv_names, sv_codes = np.unique(np.array(self.rec_sv), return_inverse=True)
+        for rec in np.lexsort((np.array(self.rec_epoch), sv_codes)).tolist():
+            yield self.rec_sv[rec], self.rec_epoch[rec], coefs[bounds[rec]:bounds[rec + 1]]
+
+    def consensus_arrays(self):
+        """
+        the consensus as arrays, needs set_consensus()
+
+        sv, epoch: sorted satellites and integer epochs of the records
+        value, count: shape (sv, epoch, coefficient index), value id and votes (merged candidates
+                      included) of the right coef, -1 and 0 where a record has no such coefficient
+        cand_*: every candidate, sorted by slot and first seen: its record's sv and epoch position,
+                coefficient index, value id, own count and the candidate it was merged into (-1 if kept)
+        owner_start, owner_file: files of candidate c are owner_file[owner_start[c]:owner_start[c + 1]]
+                                 in merge order
+        """
+        index = self._build_index()
+        slot = index['slot']
+        counts = index['count']
+        parent = self._parent
+        n = slot.size
+
+        root = np.where(parent < 0, np.arange(n), parent)
+        while True:
+            up = root[root]
+            if (up == root).all():
+                break
+            root = up
+        total = np.bincount(root, weights=counts, minlength=n).astype(np.int64)
+
+        sv_names, rec_sv = np.unique(np.array(self.rec_sv, dtype=str), return_inverse=True)
+        epochs, rec_epoch = np.unique(np.array(self.rec_epoch, dtype=np.int64), return_inverse=True)
+        rec = slot // SLOT_WIDTH
+        idx = slot % SLOT_WIDTH
+
+        shape = (sv_names.size, epochs.size, self.max_i_q + 1 if len(self.rec_sv) else 0)
+        value = np.full(shape, -1, dtype=np.int32)
+        count = np.zeros(shape, dtype=np.int32)
+        w = self._winners
+        value[rec_sv[rec[w]], rec_epoch[rec[w]], idx[w]] = index['value'][w]
+        count[rec_sv[rec[w]], rec_epoch[rec[w]], idx[w]] = total[w]
+
+        # owners of every candidate: the occurrences of the variants of its rows
+        row_lens = index['row_end'] - index['row_start']
+        row_var = index['row_var'][_ranges(index['row_start'], row_lens)]
+        occ_start = index['occ_start']
+        occ_lens = occ_start[row_var + 1] - occ_start[row_var]
+        occ = index['by_variant'][_ranges(occ_start[row_var], occ_lens)]
+        occ_cand = np.repeat(np.repeat(np.arange(n), row_lens), occ_lens)
+        occ = occ[np.lexsort((index['pos'][occ], occ_cand))]
+
+        return {
+            'sv': sv_names,
+            'epoch': epochs,
+            'value': value,
+            'count': count,
+            'cand_sv': rec_sv[rec],
+            'cand_epoch': rec_epoch[rec],
+            'cand_index': idx,
+            'cand_value': index['value'],
+            'cand_count': counts,
+            'cand_parent': np.asarray(parent),
+            'owner_start': np.append(0, np.cumsum(np.bincount(occ_cand, minlength=n))),
+            'owner_file': index['occ_file'][occ],
+        }
+
+    def save(self, path):
+        """write the table to a npz file"""
+        slot, rel = self._consensus if self._consensus is not None else (np.empty(0, np.int64), np.empty(0, np.int64))
+        np.savez(path,
+                 files=np.array(self.files, dtype=str),
+                 file_ranks=self.file_ranks(),
+                 values=np.array(self.values, dtype=str),
+                 rec_sv=np.array(self.rec_sv, dtype=str),
+                 rec_epoch=np.array(self.rec_epoch, dtype=np.int64),
+                 rec_ncoefs=np.array(self.rec_ncoefs, dtype=np.uint8),
+                 rec_order=np.array([rec for recs in self.svs.values() for rec in recs], dtype=np.int64),
+                 var_rec=np.array(self.var_rec, dtype=np.int32),
+                 var_start=np.array(self.var_start, dtype=np.int64),
+                 var_values=np.array(self.var_values, dtype=np.int32),
+                 occ_variant=np.array(self.occ_variant, dtype=np.int32),
+                 occ_file=np.array(self.occ_file, dtype=np.int32),
+                 dirty=np.array(sorted(self._dirty), dtype=np.int64),
+                 consensus_slot=slot,
+                 consensus_rel=rel,
+                 has_consensus=self._consensus is not None)
+
+    @classmethod
+    def load(cls, path):
+        """read a table written by save()"""
+        table = cls()
+        with np.load(path, allow_pickle=False) as data:
+            table.files = data['files'].tolist()
+            table._file_ids = {file: i for i, file in enumerate(table.files)}
+            table.file_order = data['file_ranks'].tolist()
+            table.values = data['values'].tolist()
+            table._value_ids = {value: i for i, value in enumerate(table.values)}
+
+            table.rec_sv = data['rec_sv'].tolist()
+            table.rec_epoch = array('q', data['rec_epoch'].tolist())
+            table.rec_ncoefs = array('B', data['rec_ncoefs'].tolist())
+            table._records = {(sv, epoch): rec for rec, (sv, epoch) in enumerate(zip(table.rec_sv, table.rec_epoch))}
+            for rec in data['rec_order'].tolist():
+                table.svs.setdefault(table.rec_sv[rec], []).append(rec)
+
+            table.var_rec = array('i', data['var_rec'].tolist())
+            table.var_start = array('q', data['var_start'].tolist())
+            table.var_values = array('i', data['var_values'].tolist())
+            table.occ_variant = array('i', data['occ_variant'].tolist())
+            table.occ_file = array('i', data['occ_file'].tolist())
+
+            values = table.values
+            var_values = table.var_values.tolist()
+            bounds = table.var_start.tolist() + [len(var_values)]
+            for var, rec in enumerate(table.var_rec):
+                coefs = tuple(values[v] for v in var_values[bounds[var]:bounds[var + 1]])
+                table._variants[(rec, coefs)] = var
+
+            table.max_i_q = max(int(data['rec_ncoefs'].max(initial=0)) - 1, 0)
+            table._dirty = set(data['dirty'].tolist())
+            if data['has_consensus']:
+                table._consensus = (data['consensus_slot'], data['consensus_rel'])
+
+        return table
+
+    def _build_index(self):
+        if self._index is not None:
+            return self._index
+
+        occ_variant = np.array(self.occ_variant, dtype=np.int64)
+        occ_file = np.array(self.occ_file, dtype=np.int64)
+        Nvar = len(self.var_rec)
+        Nocc = occ_variant.size
+        # position of each occurrence in merge order (file rank, then insertion)
+        occ_order = np.lexsort((np.arange(Nocc), self.file_ranks()[occ_file]))
+        pos = np.empty(Nocc, dtype=np.int64)
+        pos[occ_order] = np.arange(Nocc)
+
+        var_count = np.bincount(occ_variant, minlength=Nvar)
+        var_first = np.full(Nvar, Nocc, dtype=np.int64)
+        np.minimum.at(var_first, occ_variant, pos)
+        # occurrences of each variant, in merge order
+        by_variant = occ_order[np.argsort(occ_variant[occ_order], kind='stable')]
+        var_occ_start = np.append(0, np.cumsum(var_count))
+
+        # one row per coefficient of each variant
+        value = np.array(self.var_values, dtype=np.int64)
+        var_start = np.array(self.var_start, dtype=np.int64)
+        lens = np.diff(np.append(var_start, value.size))
+        row_var = np.repeat(np.arange(Nvar), lens)
+        idx = np.arange(value.size) - np.repeat(var_start, lens)
+        slot = np.array(self.var_rec, dtype=np.int64)[row_var] * SLOT_WIDTH + idx
+
+        rows = np.lexsort((var_first[row_var], value, slot))
+        s = slot[rows]
+        v = value[rows]
+        new = np.ones(rows.size, dtype=bool)
+        new[1:] = (s[1:] != s[:-1]) | (v[1:] != v[:-1])
+        start = np.flatnonzero(new)
+        count = np.add.reduceat(var_count[row_var[rows]], start) if start.size else start
+        first = var_first[row_var[rows[start]]]
+
+        cand = np.lexsort((first, s[start]))
+        c_slot = s[start][cand]
+
+        slot_keys, slot_start = np.unique(c_slot, return_index=True)
+
+        self._index = {
+            'slot': c_slot,
+            'value': v[start][cand],
+            'count': count[cand],
+            'row_start': start[cand],
+            'row_end': np.append(start[1:], rows.size)[cand],
+            'row_var': row_var[rows],
+            'occ_start': var_occ_start,
+            'by_variant': by_variant,
+            'pos': pos,
+            'occ_file': occ_file,
+            'slot_keys': slot_keys,
+            'slot_start': np.append(slot_start, c_slot.size),
+        }
+
+        return self._index
+
+    def _owners(self, c):
+        index = self._index
+        occ = [index['by_variant'][index['occ_start'][var]:index['occ_start'][var + 1]]
+               for var in index['row_var'][index['row_start'][c]:index['row_end'][c]]]
+        occ = np.concatenate(occ)
+        occ = occ[np.argsort(index['pos'][occ])]
+
+        return [self.files[f] for f in index['occ_file'][occ].tolist()]
+
+    def _slot(self, rec, coef_idx):
+        index = self._build_index()
+        i = np.searchsorted(index['slot_keys'], rec * SLOT_WIDTH + coef_idx)
+        a, b = index['slot_start'][i:i + 2].tolist()
+        cands = range(a, b)
+
+        if self._parent is None:
+            return {self.values[index['value'][c]]: {'count': int(index['count'][c]), 'owners': self._owners(c)}
+                    for c in cands}
+
+        children = {c: [] for c in cands}
+        roots = []
+        for c in cands:
+            p = self._parent[c]
+            if p < 0:
+                roots.append(c)
+            else:
+                children[p].append(c)
+
+        def group(c):
+            coef = {'count': int(index['count'][c]), 'owners': self._owners(c)}
+            for child in children[c]:
+                merged = group(child)
+                coef['count'] += merged['count']
+                coef['owners'] += merged['owners']
+            coef['value'] = self.values[index['value'][c]]
+            return coef
+
+        groups = sorted(map(group, roots), key=lambda x: x['count'], reverse=True)
+
+        return {'rigth_coef': groups[0], 'error_coefs': groups[1:]}
+
+    def __getitem__(self, sv):
+        if sv not in self.svs:
+            raise KeyError(sv)
+
+        return _SvView(self, sv)
+
+    def __iter__(self):
+        return iter(self.svs)
+
+    def __len__(self):
+        return len(self.svs)
+
+
+def _ranges(starts, lens):
+    """concatenated ranges starts[i] .. starts[i] + lens[i]"""
+    offsets = np.cumsum(lens) - lens
+
+    return np.repeat(starts - offsets, lens) + np.arange(lens.sum())
+
+
+class _SvView(Mapping):
+    """datetime -> record of one satellite"""
+
+    def __init__(self, table, sv):
+        self._table = table
+        self._sv = sv
+
+    def __getitem__(self, datetime_k):
+        rec = self._table._records.get((self._sv, to_epoch(datetime_k)))
+        if rec is None:
+            raise KeyError(datetime_k)
+
+        return _RecordView(self._table, rec)
+
+    def __iter__(self):
+        epochs = self._table.rec_epoch
+        return (from_epoch(epochs[rec]) for rec in self._table.svs[self._sv])
+
+    def __len__(self):
+        return len(self._table.svs[self._sv])
+
+
+class _RecordView(Mapping):
+    """coefficient index -> candidates of one record"""
+
+    def __init__(self, table, rec):
+        self._table = table
+        self._rec = rec
+
+    def __getitem__(self, coef_idx):
+        if not 0 <= coef_idx < len(self):
+            raise KeyError(coef_idx)
+
+        return self._table._slot(self._rec, coef_idx)
+
+    def __iter__(self):
+        return iter(range(len(self)))
+
+    def __len__(self):
+        return self._table.rec_ncoefs[self._rec]
+
+
+def order_ranks(order, files):
+    """
+    rank of every file id in order, the n-th id of a file listed again gets its n-th position
+    files not in order go last
+    """
+    positions = {}
+    for i, file in enumerate(order):
+        positions.setdefault(file, []).append(i)
+
+    return [positions[file].pop(0) if positions.get(file) else len(order) + i for i, file in enumerate(files)]
@@ -0,0 +1,153 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+STAGES = ('open', 'header', 'decode', 'merge', 'consensus', 'write', 'report')
+COUNTERS = ('bytes', 'records', 'coefficients')
+CACHE_COUNTERS = ('hits', 'misses', 'evictions')
+PROMETHEUS_PREFIX = 'rinex_merge'
+
+
+def peak_rss():
+    """peak resident set size in bytes of this process and of its largest finished child (the workers)"""
+    if resource is None:
+        return None
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+
+    return max(own, children) * 1024  # kilobytes on Linux
+
+
+class Metrics:
+    """
+    wall and CPU time, calls and counters of every pipeline stage of a run, and the files skipped
+
+    Stages run in worker processes (open, decode) are timed there and added per file,
+    their wall time is the sum over files, not the elapsed time.
+    Files of an incremental merge taken from the state are counted as reused, or listed as skipped
+    with the reason stored when an earlier run couldn't read them.
+    cache: the hits, misses and evictions of the NavCache, counted where the files are parsed.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+        self.skipped = []
+        self.merged = 0
+        self.reused = 0
+        self.cache = dict.fromkeys(CACHE_COUNTERS, 0)
+
+    def _stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = dict(wall=0.0, cpu=0.0, calls=0, **{c: 0 for c in COUNTERS})
+
+        return stage
+
+    @contextmanager
+    def stage(self, name):
+        """time a stage run in this process, the stage dict is yielded for its counters"""
+        stage = self._stage(name)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add(self, name, wall=0.0, cpu=0.0, calls=1, **counters):
+        """add a timing or counters measured elsewhere"""
+        stage = self._stage(name)
+        stage['wall'] += wall
+        stage['cpu'] += cpu
+        stage['calls'] += calls
+        for counter, n in counters.items():
+            stage[counter] += n
+
+    def update(self, other):
+        """add the stages, merged, reused and skipped files and cache counts of the Metrics of a worker"""
+        for name, stage in other.stages.items():
+            self.add(name, **stage)
+        self.skipped.extend(other.skipped)
+        self.merged += other.merged
+        self.reused += other.reused
+        self.add_cache(**other.cache)
+
+    def add_cache(self, **counts):
+        """add NavCache counts, the difference of its stats() over the reads of a file"""
+        for counter, n in counts.items():
+            self.cache[counter] += n
+
+    def skip(self, file, reason, stored=False):
+        """stored: the file was skipped by an earlier run and not read again"""
+        self.skipped.append({'file': file, 'reason': reason, 'stored': stored})
+
+    def summary(self):
+        stages = {}
+        for name in sorted(self.stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)):
+            stage = dict(self.stages[name])
+            for counter in COUNTERS:
+                if stage[counter] and stage['wall']:
+                    stage[f'{counter}_per_second'] = stage[counter] / stage['wall']
+            stages[name] = stage
+
+        return {
+            'started': self.started,
+            'seconds': time.time() - self.started,
+            'files': {'merged': self.merged, 'reused': self.reused, 'skipped': len(self.skipped)},
+            'cache': dict(self.cache),
+            'skipped': self.skipped,
+            'stages': stages,
+            'peak_rss_bytes': peak_rss(),
+        }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=1))
+
+    def prometheus(self):
+        """the summary in the Prometheus text format"""
+        s = self.summary()
+        p = PROMETHEUS_PREFIX
+        lines = []
+
+        def metric(name, help_text, samples):
+            lines.append(f'# HELP {p}_{name} {help_text}')
+            lines.append(f'# TYPE {p}_{name} gauge')
+            for labels, value in samples:
+                label = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'{p}_{name}{{{label}}} {value}' if label else f'{p}_{name} {value}')
+
+        stages = s['stages'].items()
+        metric('stage_seconds', 'wall time of a pipeline stage in the last run',
+               [({'stage': n}, st['wall']) for n, st in stages])
+        metric('stage_cpu_seconds', 'CPU time of a pipeline stage in the last run',
+               [({'stage': n}, st['cpu']) for n, st in stages])
+        for counter in COUNTERS:
+            metric(f'stage_{counter}', f'{counter} processed by a pipeline stage in the last run',
+                   [({'stage': n}, st[counter]) for n, st in stages if st[counter]])
+        metric('files', 'files of the last run', [({'status': k}, v) for k, v in s['files'].items()])
+        metric('cache', 'NAV cache reads and evictions of the last run',
+               [({'result': k}, v) for k, v in s['cache'].items()])
+        metric('run_seconds', 'duration of the last run', [({}, s['seconds'])])
+        metric('last_run_timestamp_seconds', 'start of the last run', [({}, s['started'])])
+        if s['peak_rss_bytes'] is not None:
+            metric('peak_rss_bytes', 'peak resident memory of the last run', [({}, s['peak_rss_bytes'])])
+
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """for the textfile collector of the node exporter, which needs the file replaced at once"""
+        _write_atomic(path, self.prometheus())
+
+
+def _write_atomic(path, text):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
@@ -1,5 +1,7 @@
 from .base import rinexnav
+from .cache import NavCache
 from .utils import gettime, rinexheader, globber, to_datetime
-from .rio import rinexinfo
+from .rio import rinexinfo, RinexHandle
+from .header import RinexHeader, rinex_header, decode_header
 from .nav2 import rinexnav2, navheader2
 #from .nav3 import rinexnav3, navheader3, navtime3
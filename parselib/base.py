@@ -4,22 +4,47 @@ from typing.io import TextIO
 from .nav2 import rinexnav2
 from datetime import datetime, timedelta
 from .nav3 import rinexnav3
-from .rio import rinexinfo
+from .rio import rinexinfo, RinexHandle
 from .utils import _tlim
+from .cache import NavCache
+from .epochs import datetimes
 
 
-def rinexnav(fn: Union[TextIO, str, Path],
+def rinexnav(fn: Union[TextIO, str, Path, RinexHandle],
              use: Sequence[str] = None,
-             tlim: Tuple[datetime, datetime] = None) -> Tuple:
-    """ Read RINEX 2 or 3  NAV files"""
+             tlim: Tuple[datetime, datetime] = None,
+             cache: NavCache = None,
+             index: bool = False,
+             epochs: bool = False) -> Tuple:
+    """ Read RINEX 2 or 3  NAV files
+
+    cache: NavCache, results of files on disk are read from and stored in it
+    index: uncompressed files are read through their byte offset index when tlim or use select records
+    epochs: key records on integer microseconds since 1970 instead of datetime
+    """
 
     tlim = _tlim(tlim)
 
+    if cache is not None and isinstance(fn, (str, Path, RinexHandle)):
+        path = fn.name if isinstance(fn, RinexHandle) else Path(fn).expanduser()
+        key = cache.entry_key(path, use, tlim)
+        raw = cache.get(key, epochs=True)
+        if raw is None:
+            raw = rinexnav(fn, use, tlim, index=index, epochs=True)
+            cache.put(key, raw)
+        return raw if epochs else datetimes(raw)
+
+    if isinstance(fn, (str, Path)):
+        with RinexHandle(fn) as h:
+            return rinexnav(h, use, tlim, index=index, epochs=epochs)
+
     info = rinexinfo(fn)
     if int(info['version']) == 2:
-        raw = rinexnav2(fn, tlim=tlim)
+        raw = rinexnav2(fn, tlim=tlim, index=index, epochs=epochs)
+        if use is not None:  # a RINEX 2 NAV file holds one system
+            raw['data'] = {sv: records for sv, records in raw['data'].items() if sv[0] in use}
     elif int(info['version']) == 3:
-        raw = rinexnav3(fn, use=use, tlim=tlim)
+        raw = rinexnav3(fn, use=use, tlim=tlim, index=index, epochs=epochs)
     else:
         raise LookupError(f'unknown RINEX  {info}  {fn}')
 
@@ -22,3 +22,13 @@ def build(cc: str = None, src: Path = R / 'source/crx2rnx.c') -> int:
                 break
 
     return ret
+
+
+def do_compile(cc: str, src: Path) -> int:
+    exe = R / 'crx2rnx'
+    if Path(cc).stem in ('cl', 'icl', 'clang-cl'):
+        cmd = [cc, str(src), f'/Fe{exe}']
+    else:
+        cmd = [cc, '-O2', str(src), '-o', str(exe)]
+
+    return subprocess.run(cmd).returncode
@@ -0,0 +1,173 @@
+"""
+on-disk cache of parsed NAV files
+"""
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Sequence, Tuple, Union
+
+import numpy as np
+
+SUFFIX = '.npz'
+# bump when rinexnav() output or the entry format changes, entries of other versions are misses
+CACHE_VERSION = 2  # 2: rinexnav applies use to RINEX 2 files
+
+
+class NavCache:
+    """
+    Parsed NAV files keyed on the file content (or path, size and mtime), the parse arguments and CACHE_VERSION.
+
+    An entry is an uncompressed npz: the header as JSON, the satellite, time and number of
+    coefficients of every record, and all coefficient strings as one newline separated byte array,
+    so loading is a few array reads and one split.
+    Least recently used entries are removed when the directory grows over max_bytes.
+    hits, misses and evictions count the reads of this object: a copy pickled into a worker process
+    counts its own, the caller adds them up (see rinex_merger.parse_rinex_file).
+    """
+
+    def __init__(self, directory: Union[str, Path],
+                 max_bytes: int = 1 << 30,
+                 key: str = 'content'):
+        """
+        key: 'content' hashes the file bytes, 'stat' uses path, size and mtime
+        """
+        if key not in ('content', 'stat'):
+            raise ValueError(f'unknown cache key {key}')
+
+        self.directory = Path(directory).expanduser()
+        self.max_bytes = max_bytes
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def entry_key(self, fn: Path, use: Sequence[str] = None, tlim: Tuple[datetime, datetime] = None) -> str:
+        h = hashlib.sha256()
+        if self.key == 'content':
+            with fn.open('rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    h.update(block)
+        else:
+            stat = fn.stat()
+            h.update(f'{fn.resolve()}\0{stat.st_size}\0{stat.st_mtime_ns}'.encode())
+
+        use = None if use is None else sorted(use)
+        tlim = None if tlim is None else [t.isoformat() for t in tlim]
+        h.update(json.dumps([CACHE_VERSION, use, tlim]).encode())
+
+        return h.hexdigest()
+
+    def get(self, key: str, epochs: bool = False) -> Union[Dict[str, Any], None]:
+        """
+        None on a miss: an entry that can't be loaded (truncated, corrupt, of another version)
+        is a miss too and is removed, the file is parsed again
+
+        epochs: key records on integer microseconds since 1970 instead of datetime
+        """
+        path = self.directory / (key + SUFFIX)
+        try:
+            rinex_parsed = load_parsed(path, epochs)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:  # np.load raises EOFError, BadZipFile, ValueError, ... on a bad entry
+            logging.warning(f'dropping cache entry {path}: {type(e).__name__}: {e}')
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+
+        os.utime(path)  # mtime is the last use
+        self.hits += 1
+
+        return rinex_parsed
+
+    def put(self, key: str, rinex_parsed: Dict[str, Any]):
+        path = self.directory / (key + SUFFIX)
+        tmp = self.directory / (key + '.tmp' + SUFFIX)
+        save_parsed(tmp, rinex_parsed)
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def evict(self):
+        """remove the least recently used entries until the cache fits in max_bytes"""
+        entries = []
+        for path in self.directory.glob('*' + SUFFIX):
+            try:
+                stat = path.stat()
+            except OSError:  # removed by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        for path in self.directory.glob('*' + SUFFIX):
+            path.unlink()
+
+
+def save_parsed(path: Path, rinex_parsed: Dict[str, Any]):
+    """write the result of rinexnav() in the cache entry format, with datetime or integer epoch keys"""
+    svs = []
+    times = []
+    ncoefs = []
+    coefs = []
+    for sv, svdata in rinex_parsed['data'].items():
+        for time, record in svdata.items():
+            svs.append(sv)
+            times.append(time)
+            ncoefs.append(len(record))
+            coefs.extend(record)
+
+    with open(path, 'wb') as f:
+        np.savez(f,
+                 version=np.array(CACHE_VERSION),
+                 header=np.array(json.dumps(rinex_parsed['header'])),
+                 sv=np.array(svs, dtype=str),
+                 time=np.array(times, dtype='datetime64[us]'),
+                 ncoefs=np.array(ncoefs, dtype=np.int32),
+                 coefs=np.frombuffer('\n'.join(coefs).encode('ascii'), dtype=np.uint8))
+
+
+def load_parsed(path: Path, epochs: bool = False) -> Dict[str, Any]:
+    """
+    read a cache entry written by save_parsed(), ValueError if it was written by another CACHE_VERSION
+
+    epochs: key records on integer microseconds since 1970 instead of datetime
+    """
+    with np.load(path, allow_pickle=False) as data:
+        if int(data['version']) != CACHE_VERSION:
+            raise ValueError(f'{path} is a cache entry of version {int(data["version"])}, not {CACHE_VERSION}')
+        header = json.loads(data['header'][()])
+        svs = data['sv'].tolist()
+        times = (data['time'].astype(np.int64) if epochs else data['time']).tolist()
+        bounds = np.cumsum(data['ncoefs']).tolist()
+        coefs = data['coefs'].tobytes().decode('ascii').split('\n')
+
+    rinex_parsed: Dict[str, Any] = {'header': header, 'data': {}}
+    start = 0
+    for sv, time, end in zip(svs, times, bounds):
+        rinex_parsed['data'].setdefault(sv, {})[time] = coefs[start:end]
+        start = end
+
+    return rinex_parsed
@@ -33,7 +33,7 @@ def check_ram(memneed: int, fn: Path):
 
     if memneed > 0.5*mem.available:  # because of array copy Numpy => Xarray
         raise RuntimeError(f'{fn} needs {memneed/1e9} GBytes RAM, but only {mem.available/1e9} Gbytes available \n'
-                           'try fast=False to reduce RAM usage, raise a GitHub Issue to let us help')
+                           'try outofcore=True to read it into arrays on disk')
 
 
 def determine_time_system(header: Dict[str, Any]) -> str:
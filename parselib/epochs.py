@@ -0,0 +1,125 @@
+"""
+integer epochs: times as microseconds since 1970, the record keys inside parselib
+
+Epoch fields of many lines are decoded at once from byte columns (see MappedFile.columns),
+single lines without building a datetime. datetime objects are made only where
+a public function returns them.
+"""
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+US = 1000000  # microseconds per second
+DAY = 86400 * US
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch(t: datetime) -> int:
+    """datetime -> integer microseconds since 1970"""
+    d = t - EPOCH
+    return (d.days * 86400 + d.seconds) * US + d.microseconds
+
+
+def from_epoch(epoch: int) -> datetime:
+    """integer microseconds since 1970 -> datetime"""
+    return EPOCH + timedelta(microseconds=int(epoch))
+
+
+def from_epochs(epochs: Iterable[int]) -> List[datetime]:
+    """integer microseconds since 1970 -> datetime"""
+    return np.asarray(list(epochs), dtype=np.int64).astype('datetime64[us]').tolist()
+
+
+@lru_cache(maxsize=None)
+def _month(year: int, month: int) -> Tuple[int, int]:
+    """days from 1970 to the first of the month and days in the month"""
+    if not 1 <= year <= 9999 or not 1 <= month <= 12:
+        raise ValueError(f'invalid month {year}-{month}')
+    m = np.datetime64(f'{year:04d}-{month:02d}', 'M')
+    d0, d1 = np.array([m, m + 1]).astype('datetime64[D]').astype(np.int64).tolist()
+
+    return d0, d1 - d0
+
+
+def epoch(year: int, month: int, day: int, hour: int = 0, minute: int = 0, second: int = 0,
+          microsecond: int = 0) -> int:
+    """
+    integer microseconds since 1970 of a calendar time,
+    ValueError for fields datetime() would not accept
+    """
+    d0, ndays = _month(year, month)
+    if not (1 <= day <= ndays and 0 <= hour < 24 and 0 <= minute < 60 and 0 <= second < 60
+            and 0 <= microsecond < US):
+        raise ValueError(f'invalid time {year}-{month}-{day} {hour}:{minute}:{second}.{microsecond}')
+
+    return ((d0 + day - 1) * 86400 + hour * 3600 + minute * 60 + second) * US + microsecond
+
+
+def digits(cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (value, ok) of integer fields given as uint8 columns of shape (n, width),
+    ok where int() of the text would succeed: digits with leading or trailing blanks
+    """
+    d = cols.astype(np.int64) - ord('0')
+    isdig = (d >= 0) & (d <= 9)
+    runs = isdig[:, 0].astype(np.int64) + (isdig[:, 1:] & ~isdig[:, :-1]).sum(1)
+    ok = (runs == 1) & (isdig | (cols == ord(' '))).all(1)
+
+    value = np.zeros(cols.shape[0], dtype=np.int64)
+    for j in range(cols.shape[1]):
+        value = np.where(isdig[:, j], value * 10 + d[:, j], value)
+
+    return value, ok
+
+
+def decimal(cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (value, ok) of unsigned decimal fields like " 30.0000000", the values equal float() of the text:
+    the digits and the power of ten are exact, so their quotient is the correctly rounded value
+    """
+    d = cols.astype(np.int64) - ord('0')
+    isdig = (d >= 0) & (d <= 9)
+    dot = cols == ord('.')
+    body = isdig | dot
+    runs = body[:, 0].astype(np.int64) + (body[:, 1:] & ~body[:, :-1]).sum(1)
+    ok = (runs == 1) & isdig.any(1) & (dot.sum(1) <= 1) & (body | (cols == ord(' '))).all(1)
+
+    value = np.zeros(cols.shape[0], dtype=np.int64)
+    nfrac = np.zeros(cols.shape[0], dtype=np.int64)
+    point = np.zeros(cols.shape[0], dtype=bool)
+    for j in range(cols.shape[1]):
+        value = np.where(isdig[:, j], value * 10 + d[:, j], value)
+        nfrac += isdig[:, j] & point
+        point |= dot[:, j]
+
+    return value / 10.0 ** nfrac, ok
+
+
+def epoch_array(year: np.ndarray, month: np.ndarray, day: np.ndarray,
+                hour: np.ndarray, minute: np.ndarray, second: np.ndarray, microsecond: np.ndarray,
+                ok: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    epoch() of arrays of fields, (epochs, ok) with ok cleared where epoch() would raise
+    """
+    ok = ok & (year >= 1) & (year <= 9999) & (month >= 1) & (month <= 12)
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype('datetime64[M]')
+    d0 = months.astype('datetime64[D]').astype(np.int64)
+    ndays = (months + 1).astype('datetime64[D]').astype(np.int64) - d0
+    ok &= ((day >= 1) & (day <= ndays) & (hour >= 0) & (hour < 24) & (minute >= 0) & (minute < 60)
+           & (second >= 0) & (second < 60) & (microsecond >= 0) & (microsecond < US))
+
+    t = ((d0 + day - 1) * 86400 + hour * 3600 + minute * 60 + second) * US + microsecond
+
+    return np.where(ok, t, 0), ok
+
+
+def datetimes(rinex_parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """result of a NAV reader with integer epochs -> the same with datetime keys"""
+    data = rinex_parsed['data']
+    times = iter(from_epochs(t for svdata in data.values() for t in svdata))
+    rinex_parsed['data'] = {sv: {t: record for record, t in zip(svdata.values(), times)}
+                            for sv, svdata in data.items()}
+
+    return rinex_parsed
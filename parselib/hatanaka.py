@@ -1,18 +1,40 @@
 """
 handle Hatanka CRINEX files
+
+CRINEX 1.0 (RINEX 2) and 3.0 (RINEX 3) are decoded in-process as a line stream,
+the crx2rnx executable is the fallback for other versions.
 """
+import itertools
+import os
 import subprocess
 import shutil
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional
 from typing.io import TextIO
 
-from .build import build
+try:
+    import fcntl
+except ImportError:  # Windows, threads of this process are still serialized
+    fcntl = None
+
+from .build import R, build
+from .stream import LineStream
+
+NATIVE_VERSIONS = ('1.0', '3.0')
+MAX_CONVERTERS = os.cpu_count() or 1  # threads running crx2rnx at once, see _converter_slot()
 
+_exe: Optional[str] = None
+_exe_lock = threading.Lock()
+_converters = threading.BoundedSemaphore(MAX_CONVERTERS)
+_slots_held: Dict[int, int] = {}  # unfinished conversions per thread
 
-def crxexe(path: Path = Path(__file__).parent / 'rnxcmp') -> str:
+
+def crxexe(path: Path = R) -> str:
     """
     Determines if CRINEX converter is available.
-    Don't use LRU_CACHE to allow for build-on-demand
+    Not cached to allow for build-on-demand, converter() keeps the first valid result
 
     Parameters
     ----------
@@ -38,23 +60,271 @@ def crxexe(path: Path = Path(__file__).parent / 'rnxcmp') -> str:
         return None
 
 
+def converter() -> str:
+    """
+    crx2rnx executable, resolved and validated once per process
+
+    A missing converter is built once: threads wait on a lock, processes on a lock file next to the executable.
+    """
+    global _exe
+
+    with _exe_lock:
+        if _exe is None:
+            exe = crxexe()
+            if not exe:
+                with _build_lock():
+                    exe = crxexe()  # another process may have built it meanwhile
+                    if not exe:
+                        if build() != 0:
+                            raise RuntimeError('could not build Hatanka converter. Do you have a C compiler?')
+                        exe = crxexe()
+                        if not exe:
+                            raise RuntimeError('Hatanaka converter is broken or missing.')
+            _exe = exe
+
+    return _exe
+
+
+@contextmanager
+def _build_lock():
+    R.mkdir(parents=True, exist_ok=True)
+    with open(R / '.build.lock', 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def crx2rnx_proc(lines: Iterable[str]) -> Iterator[str]:
+    """
+    RINEX lines of CRINEX lines converted by crx2rnx
+
+    At most MAX_CONVERTERS threads run conversions at once, the others wait for a free slot.
+    Conversions a thread opens while one is unfinished share its slot.
+    The input is written by a thread while the output is read, neither is buffered whole.
+    """
+    exe = converter()
+
+    with _converter_slot():
+        proc = subprocess.Popen([exe, '-'], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                universal_newlines=True)
+        feeder = threading.Thread(target=_feed, args=(proc.stdin, lines), daemon=True)
+        feeder.start()
+        try:
+            yield from proc.stdout
+        except GeneratorExit:  # abandoned before the end
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+            feeder.join()
+
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, [exe, '-'])
+
+
+@contextmanager
+def _converter_slot():
+    """
+    slot of the calling thread, taken on its first unfinished conversion and released with its last
+
+    The bound is per thread: a conversion opened while the thread has one unfinished (two CRINEX
+    files read interleaved) counts against the slot the thread holds, so there may be more crx2rnx
+    processes than MAX_CONVERTERS. Waiting for another slot could deadlock threads waiting for each other.
+    """
+    thread = threading.get_ident()
+    with _exe_lock:
+        held = _slots_held.get(thread, 0)
+        _slots_held[thread] = held + 1
+    if not held:
+        _converters.acquire()
+    try:
+        yield
+    finally:
+        with _exe_lock:
+            _slots_held[thread] -= 1
+            last = not _slots_held[thread]
+            if last:
+                del _slots_held[thread]
+        if last:
+            _converters.release()
+
+
+def _feed(stdin: TextIO, lines: Iterable[str]):
+    try:
+        for ln in lines:
+            stdin.write(ln)
+        stdin.close()
+    except (BrokenPipeError, OSError, ValueError):  # converter killed or failed
+        pass
+
+
 def opencrx(f: TextIO) -> str:
     """
-    Conversion to string is necessary because of a quirk where gzip.open() even with 'rt' doesn't decompress until read.
+    whole RINEX text of a CRINEX file converted by crx2rnx
+    """
+    return ''.join(crx2rnx_proc(f))
+
 
-    Nbytes is used to read first line.
+def crxstream(f: TextIO, native: bool = True) -> TextIO:
+    """
+    RINEX text of a CRINEX file, decoded lazily line by line.
+    Falls back to the crx2rnx executable for CRINEX versions not decoded in-process or if native is False.
     """
-    exe = crxexe()
+    version = f.readline()[:20].strip()
+    f.seek(0)
+
+    decode = crx2rnx_lines if native and version in NATIVE_VERSIONS else crx2rnx_proc
+
+    def source() -> Iterator[str]:
+        f.seek(0)
+        return decode(f)
+
+    return LineStream(source, getattr(f, 'name', ''))
+
+
+def crxlines(lines: Iterable[str], native: bool = True) -> Iterator[str]:
+    """
+    RINEX lines of CRINEX lines that are already being read, like crxstream without seeking back
+    """
+    lines = iter(lines)
+    first = next(lines, '')
+    lines = itertools.chain([first], lines)
+
+    if not native or first[:20].strip() not in NATIVE_VERSIONS:
+        return crx2rnx_proc(lines)
+
+    return crx2rnx_lines(lines)
+
+
+def crx2rnx_lines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    decode CRINEX 1.0 / 3.0 lines to RINEX 2 / 3 lines
+
+    Observations and the receiver clock offset are integer arcs of up to k-th order differences,
+    epoch lines and LLI/SSI flags are differences of text against the previous epoch.
+    Only the arcs of the satellites in the previous epoch are kept.
+    """
+    lines = iter(lines)
+    crx_version = next(lines)[:20].strip()
+    if crx_version not in NATIVE_VERSIONS:
+        raise ValueError(f'CRINEX version {crx_version} is not decoded in-process')
+    v3 = crx_version.startswith('3')
+    next(lines)  # CRINEX PROG / DATE
+
+    ntypes: Dict[str, int] = {}
+    for ln in lines:
+        ln = ln.rstrip('\r\n')
+        label = ln[60:80]
+        if label.startswith('# / TYPES OF OBSERV') and ln[:6].strip():
+            ntypes[''] = int(ln[:6])
+        elif label.startswith('SYS / # / OBS TYPES') and ln[0] != ' ':
+            ntypes[ln[0]] = int(ln[3:6])
+        yield ln + '\n'
+        if label.startswith('END OF HEADER'):
+            break
+
+    epoch = ''
+    clock: Optional[list] = None
+    arcs: Dict[str, tuple] = {}
+    for ln in lines:
+        ln = ln.rstrip('\r\n')
+        if not v3 and ln.startswith('&'):
+            epoch = ' ' + ln[1:]
+        elif v3 and ln.startswith('>'):
+            epoch = ln
+        else:
+            epoch = _repair(epoch, ln)
+
+        if v3:
+            head, flag, Nsv, sats = epoch[:35], epoch[31:32], epoch[32:35], epoch[41:]
+        else:
+            head, flag, Nsv, sats = epoch[:32], epoch[28:29], epoch[29:32], epoch[32:]
+
+        if flag.strip() and flag in '2345':  # event, Nsv special records follow
+            yield epoch.rstrip() + '\n'
+            for _, special in zip(range(int(Nsv)), lines):
+                yield special.rstrip('\r\n') + '\n'
+            arcs = {}
+            continue
+
+        clock = _arc(clock, next(lines).rstrip('\r\n'))
+        svs = [sats[i:i + 3] for i in range(0, 3 * int(Nsv), 3)]
+
+        if v3:
+            yield head + ('' if clock is None else '      ' + _fixed(clock[1], 12, 15)) + '\n'
+        else:
+            first = head + ''.join(svs[:12])
+            if clock is not None:
+                first = first.ljust(68) + _fixed(clock[1], 9, 12)
+            yield first + '\n'
+            for i in range(12, len(svs), 12):
+                yield ' ' * 32 + ''.join(svs[i:i + 12]) + '\n'
+
+        new_arcs = {}
+        for sv in svs:
+            ntype = ntypes[sv[0]] if v3 else ntypes['']
+            parts = next(lines).rstrip('\r\n').split(' ', ntype)
+            parts += [''] * (ntype + 1 - len(parts))
+            old_arcs, old_flags = arcs.get(sv, ((None,) * ntype, ''))
+
+            sv_arcs = [_arc(old, field) for old, field in zip(old_arcs, parts[:ntype])]
+            flags = _repair(old_flags, parts[ntype]).ljust(2 * ntype)
+            new_arcs[sv] = (sv_arcs, flags)
+
+            # crx2rnx blanks the flags of a missing observation, their text stays for the next difference
+            obs = [' ' * 16 if arc is None else _fixed(arc[1], 3, 14) + flags[2 * j:2 * j + 2]
+                   for j, arc in enumerate(sv_arcs)]
+            if v3:
+                yield (sv + ''.join(obs)).rstrip() + '\n'
+            else:
+                for i in range(0, ntype, 5):
+                    yield ''.join(obs[i:i + 5]).rstrip() + '\n'
+
+        arcs = new_arcs
+
+
+def _repair(old: str, diff: str) -> str:
+    """
+    text difference: ' ' keeps the old character, '&' is a blank, anything else replaces it
+    """
+    if not diff:
+        return old
+    if len(diff) > len(old):
+        old = old.ljust(len(diff))
+
+    return ''.join(o if d == ' ' else (' ' if d == '&' else d)
+                   for o, d in zip(old, diff)) + old[len(diff):]
+
+
+def _arc(arc: Optional[list], field: str) -> Optional[list]:
+    """
+    next state of a difference arc: [maximum order, value, 1st difference, ...], updated in place
+    field: 'k&value' starts an arc of order k, an integer is the next difference, blank ends the arc
+    """
+    if not field:
+        return None
+
+    if '&' in field:
+        order, value = field.split('&')
+        return [int(order), int(value)]
+
+    if arc is None:
+        raise ValueError(f'CRINEX difference {field} without initialized arc')
+
+    if len(arc) <= arc[0] + 1:
+        arc.append(int(field))
+    else:
+        arc[-1] = int(field)
+
+    for i in range(len(arc) - 2, 0, -1):
+        arc[i] += arc[i + 1]
+
+    return arc
 
-    if not exe:
-        if build() != 0:
-            raise RuntimeError('could not build Hatanka converter. Do you have a C compiler?')
-        exe = crxexe()
-        if not exe:
-            raise RuntimeError('Hatanaka converter is broken or missing.')
 
-    ret = subprocess.check_output([exe, '-'],
-                                  input=f.read(),
-                                  universal_newlines=True)
+def _fixed(value: int, decimals: int, width: int) -> str:
+    """integer in units of 10**-decimals as Fortran F(width).(decimals), without a leading zero like crx2rnx"""
+    q, r = divmod(abs(value), 10 ** decimals)
 
-    return ret
+    return f'{"-" if value < 0 else ""}{q or ""}.{r:0{decimals}d}'.rjust(width)
@@ -0,0 +1,98 @@
+"""
+decoded RINEX header, parsed once per file
+"""
+import os
+import re
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple, Union
+
+from .rio import RinexHandle
+from .utils import rinexheader
+
+MEMO_SIZE = 1 << 12  # headers remembered per process
+
+ION_COEF = re.compile(r'[- ]\d+\.\d+E[+-]\d+', re.IGNORECASE)  # ION ALPHA / ION BETA of RINEX 2
+ION_KIND = re.compile(r'([A-Z]{2,})', re.IGNORECASE)
+ION_CORR = re.compile(r'(\d\.\d+[E].\d\d)')
+
+_memo: 'OrderedDict[Tuple[str, int, int], RinexHeader]' = OrderedDict()
+
+
+class RinexHeader(NamedTuple):
+    """
+    the numeric fields of the header of a NAV or OBS file of RINEX 2 or 3, decoded
+
+    ionospheric: {kind: coefficients}, GPSA and GPSB of RINEX 2 ION ALPHA and ION BETA or the
+                 IONOSPHERIC CORR lines of RINEX 3
+    first_obs, last_obs and interval are given by OBS headers only
+    """
+    version: float
+    rinextype: str
+    filetype: str
+    systems: str
+    ionospheric: Dict[str, Tuple[float, ...]]
+    leap_seconds: Optional[int] = None
+    first_obs: Optional[datetime] = None
+    last_obs: Optional[datetime] = None
+    interval: Optional[float] = None
+
+
+def decode_header(hdr: Dict[str, Any]) -> RinexHeader:
+    """RinexHeader of the dict navheader2(), navheader3(), obsheader2() or obsheader3() give"""
+    try:
+        leap_seconds = int(hdr['LEAP SECONDS'][:6])
+    except (KeyError, ValueError, TypeError):
+        leap_seconds = None
+
+    return RinexHeader(version=float(hdr['version']),
+                       rinextype=hdr['rinextype'],
+                       filetype=hdr['filetype'],
+                       systems=hdr.get('systems', ''),
+                       ionospheric=_ionospheric(hdr),
+                       leap_seconds=leap_seconds,
+                       first_obs=hdr.get('t0'),
+                       last_obs=hdr.get('t1'),
+                       interval=hdr.get('interval'))
+
+
+def _ionospheric(hdr: Dict[str, Any]) -> Dict[str, Tuple[float, ...]]:
+    corr = hdr.get('IONOSPHERIC CORR')
+    if isinstance(corr, dict):  # navheader3() decodes it
+        return {kind: tuple(coefs) for kind, coefs in corr.items()}
+    elif isinstance(corr, str):  # not RINEX 3, decoded to floats like every other coefficient
+        corr = corr.replace('D', 'E').replace('e', 'E')
+        kind = ION_KIND.search(corr)
+        return {kind.group(1): tuple(map(float, ION_CORR.findall(corr)))} if kind else {}
+
+    if 'ION ALPHA' in hdr and 'ION BETA' in hdr:
+        alpha, beta = (hdr[k].replace('D', 'E').replace('e', 'E').replace('\n', '') for k in ('ION ALPHA', 'ION BETA'))
+        return {'GPSA': tuple(map(float, ION_COEF.findall(alpha))),
+                'GPSB': tuple(map(float, ION_COEF.findall(beta)))}
+
+    return {}
+
+
+def rinex_header(fn: Union[str, Path, RinexHandle],
+                 hdr: Dict[str, Any] = None) -> RinexHeader:
+    """
+    decoded header of a file, remembered by path, size and mtime so a file's header is read
+    and decoded once per process while the file is unchanged: call it in the long lived process,
+    the memo of a pool worker is gone with the pool
+    hdr: the header dict already read with the data, the file isn't opened then
+    """
+    path = os.path.abspath(os.path.expanduser(fn.name if isinstance(fn, RinexHandle) else fn))
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns)
+
+    header = _memo.get(key)
+    if header is not None:
+        _memo.move_to_end(key)
+        return header
+
+    header = _memo[key] = decode_header(rinexheader(fn) if hdr is None else hdr)
+    if len(_memo) > MEMO_SIZE:
+        _memo.popitem(last=False)
+
+    return header
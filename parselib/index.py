@@ -0,0 +1,196 @@
+"""
+byte offsets of the records of uncompressed RINEX files, kept in a sidecar file next to each file
+"""
+import io
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterable, Iterator, Optional, Sequence, Tuple, Union
+from typing.io import TextIO
+
+import numpy as np
+
+from .rio import COMPRESSED, RinexHandle, first_nonblank_line, rinex_version
+
+SUFFIX = '.idx.npz'
+
+Row = Tuple[int, str, int, int]  # epoch in microseconds since 1970, SV ('' for OBS epochs), start and end byte offset
+
+
+class RecordIndex:
+    """
+    records of a file in file order: time, SV, byte offset and length
+
+    size and mtime_ns of the indexed file tell if the index is still valid.
+    """
+
+    def __init__(self, time: np.ndarray, sv: np.ndarray, offset: np.ndarray, length: np.ndarray,
+                 size: int, mtime_ns: int):
+        self.time = time
+        self.sv = sv
+        self.offset = offset
+        self.length = length
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Row], stat: os.stat_result) -> 'RecordIndex':
+        return cls(np.array([r[0] for r in rows], dtype='datetime64[us]'),
+                   np.array([r[1] for r in rows], dtype='U3'),
+                   np.array([r[2] for r in rows], dtype=np.int64),
+                   np.array([r[3] - r[2] for r in rows], dtype=np.int64),
+                   stat.st_size, stat.st_mtime_ns)
+
+    def valid(self, stat: os.stat_result) -> bool:
+        return self.size == stat.st_size and self.mtime_ns == stat.st_mtime_ns
+
+    def times(self) -> np.ndarray:
+        """times of the records as datetime"""
+        return self.time.astype(datetime)
+
+    def select(self, tlim: Tuple[datetime, datetime] = None,
+               systems: Sequence[str] = None,
+               monotonic: bool = False) -> np.ndarray:
+        """
+        offsets of the records within tlim of the given systems, in file order
+
+        monotonic: stop at the first record after tlim like a scan of a time sorted file does
+        """
+        keep = np.ones(self.offset.size, dtype=bool)
+        if tlim is not None:
+            t0, t1 = (np.datetime64(t, 'us') for t in tlim)
+            after = self.time > t1
+            if monotonic and after.any():
+                keep[np.argmax(after):] = False
+            keep &= (self.time >= t0) & ~after
+        if systems is not None:
+            keep &= np.isin(self.sv.astype('U1'), list(systems))
+
+        return self.offset[keep]
+
+    def first(self, t0: datetime) -> Optional[int]:
+        """offset of the first record at or after t0"""
+        i = np.flatnonzero(self.time >= np.datetime64(t0, 'us'))
+
+        return int(self.offset[i[0]]) if i.size else None
+
+    def save(self, path: Path):
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as f:
+            np.savez(f, time=self.time, sv=self.sv, offset=self.offset, length=self.length,
+                     stat=np.array([self.size, self.mtime_ns], dtype=np.int64))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> 'RecordIndex':
+        with np.load(path, allow_pickle=False) as data:
+            size, mtime_ns = data['stat'].tolist()
+            return cls(data['time'], data['sv'], data['offset'], data['length'], size, mtime_ns)
+
+
+class OffsetLines:
+    """lines of a binary file as text, offset and end are the byte range of the last line read"""
+
+    def __init__(self, f: BinaryIO):
+        self._f = f
+        self.offset = self.end = f.tell()
+
+    def readline(self) -> str:
+        ln = self._f.readline()
+        self.offset = self.end
+        self.end += len(ln)
+
+        ln = ln.decode('ascii', 'ignore')
+        if ln.endswith('\r\n'):  # like the text files the parsers read
+            ln = ln[:-2] + '\n'
+
+        return ln
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        ln = self.readline()
+        if not ln:
+            raise StopIteration
+
+        return ln
+
+
+def sidecar(path: Path) -> Path:
+    return path.with_name(path.name + SUFFIX)
+
+
+def indexable(fn: Union[TextIO, str, Path, RinexHandle]) -> Optional[Path]:
+    """path of an uncompressed RINEX file, None for streams, compressed and CRINEX files"""
+    if isinstance(fn, RinexHandle):
+        if fn.crinex:
+            return None
+        path = fn.name
+    elif isinstance(fn, (str, Path)):
+        path = Path(fn).expanduser()
+    else:
+        return None
+
+    if path.suffix in COMPRESSED or path.suffix == '.nc':
+        return None
+    if not isinstance(fn, RinexHandle):
+        with path.open('r', encoding='ascii', errors='ignore') as f:
+            if rinex_version(first_nonblank_line(f))[1]:
+                return None
+
+    return path
+
+
+def record_index(fn: Union[TextIO, str, Path, RinexHandle],
+                 scan: Callable[[OffsetLines, TextIO], Iterable[Row]]) -> Optional[RecordIndex]:
+    """
+    index of an uncompressed file, None for other inputs
+
+    The sidecar is used while the size and mtime of the file match, otherwise scan() builds
+    the index from the header (as a stream) and the lines after it and the sidecar is rewritten.
+    """
+    path = indexable(fn)
+    if path is None:
+        return None
+
+    stat = path.stat()
+    try:
+        idx = RecordIndex.load(sidecar(path))
+        if idx.valid(stat):
+            return idx
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with path.open('rb') as f:
+        lines = OffsetLines(f)
+        header = []
+        for ln in lines:
+            header.append(ln)
+            if 'END OF HEADER' in ln:
+                break
+        idx = RecordIndex.from_rows(list(scan(lines, io.StringIO(''.join(header)))), stat)
+
+    try:
+        idx.save(sidecar(path))
+    except OSError as e:  # read-only directory, the index is still used
+        logging.debug(f'could not write index of {path}: {e}')
+
+    return idx
+
+
+def seek_first(f: TextIO, idx: RecordIndex, t0: datetime):
+    """position an uncompressed text file at the first record at or after t0, or at its end"""
+    off = idx.first(t0)
+    if off is None:
+        f.seek(0, io.SEEK_END)
+    else:
+        f.seek(off)
+
+
+def lines_at(f: TextIO, offsets: Iterable[int]) -> Iterator[str]:
+    """first line of the record at each byte offset of an uncompressed text file"""
+    for off in offsets:
+        f.seek(off)
+        yield f.readline()
@@ -0,0 +1,126 @@
+"""
+streaming decoder of unix compress (.Z) files
+"""
+import io
+from typing import BinaryIO, Iterator, Optional
+
+from .stream import LineStream
+
+MAGIC = b'\x1f\x9d'
+CHUNK = 1 << 16  # compressed bytes read and decompressed bytes yielded at once
+
+
+def unlzw_chunks(f: BinaryIO, chunk_size: int = CHUNK) -> Iterator[bytes]:
+    """
+    decompress a .Z stream, yielding about chunk_size bytes at a time
+
+    Codes are read in groups of n_bits bytes (8 codes) like compress writes them:
+    when the code width grows or the table is cleared the rest of the group is padding.
+    """
+    header = f.read(3)
+    if len(header) < 3 or header[:2] != MAGIC:
+        raise ValueError('not a unix compress (.Z) stream')
+    maxbits = header[2] & 0x1f
+    block_mode = bool(header[2] & 0x80)
+    if not 9 <= maxbits <= 16:
+        raise ValueError(f'unsupported LZW code width {maxbits}')
+    max_entries = 1 << maxbits
+    first = 257 if block_mode else 256  # 256 is the clear code in block mode
+
+    table = [bytes((i,)) for i in range(256)] + [b''] * (first - 256)
+    n_bits = 9
+    mask = (1 << n_bits) - 1
+    prev: Optional[bytes] = None
+
+    buf = b''
+    off = 0
+    out = []
+    size = 0
+    while True:
+        while len(buf) - off < n_bits:
+            more = f.read(chunk_size)
+            if not more:
+                break
+            buf = buf[off:] + more
+            off = 0
+        group = buf[off:off + n_bits]
+        if not group:
+            break
+        off += n_bits
+
+        value = int.from_bytes(group, 'little')
+        for _ in range(len(group) * 8 // n_bits):
+            code = value & mask
+            value >>= n_bits
+
+            if code == 256 and block_mode:
+                del table[first:]
+                n_bits = 9
+                mask = (1 << n_bits) - 1
+                prev = None
+                break
+
+            if prev is None:
+                if code >= 256:
+                    raise ValueError(f'invalid LZW code {code}')
+                entry = table[code]
+            elif code < len(table):
+                entry = table[code]
+            elif code == len(table):
+                entry = prev + prev[:1]
+            else:
+                raise ValueError(f'invalid LZW code {code}')
+
+            if prev is not None and len(table) < max_entries:
+                table.append(prev + entry[:1])
+            out.append(entry)
+            size += len(entry)
+            prev = entry
+
+            if len(table) > mask and n_bits < maxbits:
+                n_bits += 1
+                mask = (1 << n_bits) - 1
+                break
+
+        if size >= chunk_size:
+            yield b''.join(out)
+            out = []
+            size = 0
+
+    if out:
+        yield b''.join(out)
+
+
+class ChunkReader(io.RawIOBase):
+    """raw binary file over an iterator of byte chunks"""
+
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._chunk = b''
+        self._off = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while self._off >= len(self._chunk):
+            self._chunk = next(self._chunks, b'')
+            self._off = 0
+            if not self._chunk:
+                return 0
+
+        n = min(len(b), len(self._chunk) - self._off)
+        b[:n] = self._chunk[self._off:self._off + n]
+        self._off += n
+
+        return n
+
+
+def lzwtext(fb: BinaryIO, name: str = '') -> LineStream:
+    """text lines of a .Z file, seek(0) decompresses again from the start"""
+    def source() -> Iterator[str]:
+        fb.seek(0)
+        raw = ChunkReader(unlzw_chunks(fb))
+        return iter(io.TextIOWrapper(io.BufferedReader(raw, CHUNK), encoding='ascii', errors='ignore'))
+
+    return LineStream(source, name)
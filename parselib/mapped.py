@@ -0,0 +1,133 @@
+"""
+memory mapped reading of uncompressed RINEX files
+
+Line boundaries are found with byte searches over the map and fixed-width columns of many lines
+are gathered into one NumPy array, so no Python string is made per line.
+Processes reading the same file share its pages in the page cache.
+"""
+import mmap
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence, Tuple, Union
+
+import numpy as np
+
+BLOCK = 1 << 24  # bytes searched for newlines at once
+CHUNK = 1 << 12  # records gathered at once
+
+
+class MappedFile:
+    """
+    uncompressed file mapped read-only
+
+    starts and ends are the byte ranges of the lines without their line ending.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.name = Path(path).expanduser()
+        self._f = self.name.open('rb')
+        try:
+            self._map = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._map = None
+        self.buf = np.frombuffer(self._map, dtype=np.uint8) if self._map is not None else np.empty(0, np.uint8)
+
+        newlines = [np.flatnonzero(self.buf[i:i + BLOCK] == 10) + i for i in range(0, self.buf.size, BLOCK)]
+        ends = np.concatenate(newlines) if newlines else np.empty(0, np.int64)
+        starts = np.r_[0, ends + 1]
+        if starts[-1] == self.buf.size:  # file ends with a newline
+            starts = starts[:-1]
+        else:
+            ends = np.r_[ends, self.buf.size]
+        self._newline = ends < self.buf.size
+        cr = (ends > starts) & (self.buf[np.maximum(ends - 1, 0)] == 13) if self.buf.size else ends > starts
+        self.starts = starts
+        self.ends = ends - cr
+        self.nlines = starts.size
+
+    def view(self, i: int) -> memoryview:
+        """the bytes of line i without copying"""
+        return memoryview(self._map)[self.starts[i]:self.ends[i]]
+
+    def text(self, i: int) -> str:
+        """line i like a text file gives it, with its newline"""
+        if i >= self.nlines:
+            return ''
+
+        ln = self._map[self.starts[i]:self.ends[i]].decode('ascii', 'ignore')
+
+        return ln + '\n' if self._newline[i] else ln
+
+    def texts(self, i: int, j: int) -> str:
+        """lines i to j like a text file gives them"""
+        return ''.join(self.text(k) for k in range(i, min(j, self.nlines)))
+
+    def header_end(self) -> int:
+        """number of lines up to END OF HEADER"""
+        for i in range(self.nlines):
+            if b'END OF HEADER' in self._map[self.starts[i]:self.ends[i]]:
+                return i + 1
+
+        return self.nlines
+
+    def line_at(self, offsets: Iterable[int]) -> np.ndarray:
+        """line numbers of byte offsets at the start of lines"""
+        return np.searchsorted(self.starts, np.asarray(offsets, dtype=np.int64))
+
+    def first_bytes(self, lines: np.ndarray) -> np.ndarray:
+        """first byte of each line, 0 for blank lines"""
+        lines = np.asarray(lines)
+        first = self.buf[np.minimum(self.starts[lines], max(self.buf.size - 1, 0))].copy()
+        first[self.ends[lines] <= self.starts[lines]] = 0
+
+        return first
+
+    def columns(self, lines: np.ndarray, c0: int, c1: int) -> np.ndarray:
+        """
+        columns c0:c1 of the lines, padded with spaces, as an uint8 array of shape lines.shape + (c1 - c0,)
+        line numbers past the end of the file give blank lines
+        """
+        lines = np.asarray(lines)
+        inside = lines < self.nlines
+        li = np.where(inside, lines, 0)
+        idx = (self.starts[li] + c0)[..., None] + np.arange(c1 - c0)
+        end = np.where(inside, self.ends[li], 0)[..., None]
+        if not self.buf.size:
+            return np.full(idx.shape, ord(' '), dtype=np.uint8)
+
+        out = self.buf[np.minimum(idx, self.buf.size - 1)]
+        out[idx >= end] = ord(' ')
+
+        return out
+
+    def records(self, first_lines: Sequence[int], npieces: Sequence[int],
+                cols: Tuple[Tuple[int, int], Tuple[int, int]]) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (record numbers, bytes) of records in chunks of equal size for navdecode.decode_fields
+
+        first_lines: first line of each record
+        npieces: lines of each record
+        cols: columns of the first line and of the following lines
+        """
+        first_lines = np.asarray(first_lines, dtype=np.int64)
+        npieces = np.asarray(npieces, dtype=np.int64)
+        (a0, a1), (b0, b1) = cols
+        sizes, first = np.unique(npieces, return_index=True)
+        for n in sizes[np.argsort(first)].tolist():  # in order of appearance like decode_records
+            irec = np.flatnonzero(npieces == n)
+            for k in range(0, irec.size, CHUNK):
+                sub = irec[k:k + CHUNK]
+                head = self.columns(first_lines[sub], a0, a1)
+                rest = self.columns(first_lines[sub, None] + np.arange(1, n), b0, b1).reshape(sub.size, -1)
+                yield sub, np.concatenate((head, rest), axis=1)
+
+    def close(self):
+        self.buf = None  # the map can't be closed while an array exports it
+        if self._map is not None:
+            self._map.close()
+        self._f.close()
+
+    def __enter__(self) -> 'MappedFile':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,22 +1,28 @@
 #!/usr/bin/env python
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Union, Any, Sequence, Tuple
+from typing import Dict, Union, Any, Iterator, List, Sequence, Tuple
 from typing.io import TextIO
+import io
 import xarray
 import numpy as np
 import logging
-import re
 
-from .rio import opener, rinexinfo
+from .rio import opener, rinexinfo, RinexHandle
+from .index import OffsetLines, indexable, record_index, lines_at
+from .mapped import MappedFile
 from .common import rinex_string_to_float
+from .navdecode import decode_records, decode_fields
+from .epochs import to_epoch, from_epochs, datetimes, epoch, epoch_array, digits, decimal, US
 #
 STARTCOL2 = 3  # column where numerical data starts for RINEX 2
 Nl = {'G': 7, 'R': 3, 'E': 7}   # number of additional SV lines
 
 
-def rinexnav2(fn: Union[TextIO, str, Path],
-              tlim: Sequence[datetime] = None) -> Tuple:
+def rinexnav2(fn: Union[TextIO, str, Path, RinexHandle],
+              tlim: Sequence[datetime] = None,
+              index: bool = False,
+              epochs: bool = False) -> Tuple:
     """
     Reads RINEX 2.x NAV files
     Michael Hirsch, Ph.D.
@@ -24,75 +30,148 @@ def rinexnav2(fn: Union[TextIO, str, Path],
 
     http://gage14.upc.es/gLAB/HTML/GPS_Navigation_Rinex_v2.11.html
     ftp://igs.org/pub/data/format/rinex211.txt
+
+    index: read only the records within tlim through the byte offset index of an uncompressed file
+    epochs: key records on integer microseconds since 1970 instead of datetime
+
+    Uncompressed files are read through a memory map.
     """
     if isinstance(fn, (str, Path)):
         fn = Path(fn).expanduser()
 
+    idx = record_index(fn, _scan) if index and tlim is not None else None
+    path = indexable(fn)
+    if path is not None:
+        rinex_parsed = _rinexnav2_mapped(path, tlim, idx)
+        return rinex_parsed if epochs else datetimes(rinex_parsed)
+
+    elim = None if tlim is None else [to_epoch(t) for t in tlim]
+
     Lf = 19  # string length per field
 
     rinex_parsed = {}
     rinex_parsed['data'] = {}
+    records = []
 
     with opener(fn) as f:
 
         header = navheader2(f)
         rinex_parsed['header'] = header
-
-        if header['filetype'] == 'N':
-            svtype = 'G'
-        elif header['filetype'] == 'G':
-            svtype = 'R'  # GLONASS
-        elif header['filetype'] == 'E':
-            svtype = 'E'  # Galileo
-        else:
-            raise NotImplementedError(f'I do not yet handle Rinex 2 NAV {header["sys"]}  {fn}')
+        svtype = _svtype(header, fn)
 # %% read data
-        for ln in f:
-            granule = {}
+        for ln in (f if idx is None else lines_at(f, idx.select(tlim, monotonic=True))):
             try:
-                time = _timenav(ln)
+                time = _epochnav(ln)
             except ValueError:
                 continue
 
-            if tlim is not None:
-                if time < tlim[0]:
+            if elim is not None:
+                if time < elim[0]:
                     _skip(f, Nl[header['systems']])
                     continue
-                elif time > tlim[1]:
+                elif time > elim[1]:
                     break
 # %% format I2 http://gage.upc.edu/sites/default/files/gLAB/HTML/GPS_Navigation_Rinex_v2.11.html
             sv = f'{svtype}{ln[:2]}'
             sv = sv.replace(' ', '0')
             """
-            now get the data as one big long string per SV
+            keep the data part of each line, all records are decoded at once at the end
             """
-            raw = ln[22:79]  # NOTE: MUST be 79, not 80 due to some files that put \n a character early!
+            pieces = [ln[22:79]]  # NOTE: MUST be 79, not 80 due to some files that put \n a character early!
             for _ in range(Nl[header['systems']]):
-                raw += f.readline()[STARTCOL2:79]
-            # one line per SV
-            # NOTE: Sebastijan added .replace('  ', ' ').replace(' -', '-')
-            # here, I would like to see a file that needs this first, to be sure
-            # I'm not needlessly slowing down reading or creating new problems.
-            raw = raw.replace('D', 'E').replace('\n', '')
-            raw = raw.replace('e', 'E')
-            temp_raw = re.findall('[- ]\d+\.\d+E[+-]\d+', raw, flags=re.IGNORECASE)
-            if(len(temp_raw) == 0):
-                temp_raw = re.findall('[- ]\.\d+E[+-]\d+', raw, flags=re.IGNORECASE)
-                temp_raw = list(map(lambda x: x.replace('.', '0.'), temp_raw))
-
-            if not sv in rinex_parsed['data']:
-                rinex_parsed['data'][sv] = {}
-                rinex_parsed['data'][sv][time] = temp_raw
-            elif not time in rinex_parsed['data'][sv]:
-                rinex_parsed['data'][sv][time] = temp_raw
-            
+                pieces.append(f.readline()[STARTCOL2:79])
+
+            svdata = rinex_parsed['data'].setdefault(sv, {})
+            if not time in svdata:
+                svdata[time] = len(records)
+                records.append(pieces)
+
+    coefs = decode_records(records)
+    for svdata in rinex_parsed['data'].values():
+        for time, i in svdata.items():
+            svdata[time] = coefs[i]
+
+    return rinex_parsed if epochs else datetimes(rinex_parsed)
+
+def _rinexnav2_mapped(path: Path, tlim: Sequence[datetime] = None, idx=None) -> Dict[str, Any]:
+    """
+    rinexnav2() of an uncompressed file with integer epochs: the epochs of all lines are decoded at once
+    and the coefficients are gathered from the memory map, no line becomes a string
+    """
+    rinex_parsed: Dict[str, Any] = {'data': {}}
+    first = []
+    elim = None if tlim is None else [to_epoch(t) for t in tlim]
+
+    with MappedFile(path) as m:
+        h = m.header_end()
+        header = navheader2(io.StringIO(m.texts(0, h)))
+        rinex_parsed['header'] = header
+        svtype = _svtype(header, path)
+        nl = Nl[header['systems']]
+
+        body = np.arange(h, m.nlines)
+        times, ok = (a.tolist() for a in _epochs(m, body))
+        prns = m.columns(body, 0, 2).view('S2').ravel().tolist()
+
+        # from the index only record lines are read, otherwise a garbage line is skipped alone
+        lines = None if idx is None else iter(m.line_at(idx.select(tlim, monotonic=True)).tolist())
+        nxt = h
+        while True:
+            i = nxt if lines is None else next(lines, m.nlines)
+            if i >= m.nlines:
+                break
+
+            time = times[i - h]
+            if not ok[i - h]:  # fields int() and float() accept in other spellings, or a garbage line
+                try:
+                    time = _epochnav(m.text(i))
+                except ValueError:
+                    nxt = i + 1
+                    continue
+
+            nxt = i + 1 + nl
+            if elim is not None:
+                if time < elim[0]:
+                    continue
+                elif time > elim[1]:
+                    break
+
+            sv = svtype + prns[i - h].decode('ascii', 'ignore').replace(' ', '0')
+            svdata = rinex_parsed['data'].setdefault(sv, {})
+            if not time in svdata:
+                svdata[time] = len(first)
+                first.append(i)
+
+        def raw(k: int) -> str:
+            i = first[k]
+            return ''.join([m.text(i)[22:79]] + [m.text(i + j)[STARTCOL2:79] for j in range(1, nl + 1)])
+
+        coefs = decode_fields(m.records(first, [1 + nl] * len(first), ((22, 79), (STARTCOL2, 79))),
+                              len(first), raw)
+
+    for svdata in rinex_parsed['data'].values():
+        for time, k in svdata.items():
+            svdata[time] = coefs[k]
+
     return rinex_parsed
 
+
+def _svtype(header: Dict[str, Any], fn) -> str:
+    if header['filetype'] == 'N':
+        return 'G'
+    elif header['filetype'] == 'G':
+        return 'R'  # GLONASS
+    elif header['filetype'] == 'E':
+        return 'E'  # Galileo
+    else:
+        raise NotImplementedError(f'I do not yet handle Rinex 2 NAV {header["sys"]}  {fn}')
+
+
 def navheader2(f: TextIO) -> Dict[str, Any]:
     """
     For RINEX NAV version 2 only. End users should use rinexheader()
     """
-    if isinstance(f, (str, Path)):
+    if isinstance(f, (str, Path, RinexHandle)):
         with opener(f, header=True) as h:
             return navheader2(h)
 
@@ -107,8 +186,8 @@ def navheader2(f: TextIO) -> Dict[str, Any]:
     return hdr
 
 
-def _timenav(ln: str) -> datetime:
-
+def _epochnav(ln: str) -> int:
+    """epoch of a record line as integer microseconds since 1970"""
     year = int(ln[3:5])
     if 80 <= year <= 99:
         year += 1900
@@ -117,25 +196,45 @@ def _timenav(ln: str) -> datetime:
     else:
         raise ValueError(f'unknown year format {year}')
 
-    return datetime(year=year,
-                    month=int(ln[6:8]),
-                    day=int(ln[9:11]),
-                    hour=int(ln[12:14]),
-                    minute=int(ln[15:17]),
-                    second=int(float(ln[17:20])),
-                    microsecond=int(float(ln[17:22]) % 1 * 1000000)
-                    )
+    return epoch(year,
+                 int(ln[6:8]),
+                 int(ln[9:11]),
+                 int(ln[12:14]),
+                 int(ln[15:17]),
+                 int(float(ln[17:20])),
+                 int(float(ln[17:22]) % 1 * US))
+
+
+def _epochs(m: MappedFile, lines: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """_epochnav() of many lines at once, (epochs, ok) with ok False where it would raise"""
+    cols = m.columns(lines, 3, 22)
+    year, ok = digits(cols[:, 0:2])
+    year = np.where(year < 80, year + 2000, year + 1900)
+    fields = [digits(cols[:, k:k + 2]) for k in (3, 6, 9, 12)]
+    second, ok_s = decimal(cols[:, 14:17])
+    frac, ok_f = decimal(cols[:, 14:19])
+    for _, ok_k in fields:
+        ok = ok & ok_k
+
+    return epoch_array(year, *(v for v, _ in fields), second.astype(np.int64),
+                       (frac % 1 * US).astype(np.int64), ok & ok_s & ok_f)
 
 
 def _skip(f: TextIO, Nl: int):
     for _, _ in zip(range(Nl), f):
         pass
 
-def navtime2(fn: Union[TextIO, Path]) -> np.ndarray:
+def navtime2(fn: Union[TextIO, Path, RinexHandle], index: bool = False) -> np.ndarray:
     """
     read all times in RINEX 2 NAV file
+
+    index: take the times from the byte offset index of an uncompressed file
     """
-    times = []
+    idx = record_index(fn, _scan) if index else None
+    if idx is not None:
+        return np.unique(idx.times())
+
+    times: List[int] = []
     with opener(fn) as f:
         hdr = navheader2(f)
 
@@ -145,7 +244,7 @@ def navtime2(fn: Union[TextIO, Path]) -> np.ndarray:
                 break
 
             try:
-                time = _timenav(ln)
+                time = _epochnav(ln)
             except ValueError:
                 continue
 
@@ -153,4 +252,20 @@ def navtime2(fn: Union[TextIO, Path]) -> np.ndarray:
 
             _skip(f, Nl[hdr['systems']])
 
-    return np.unique(times)
+    return np.asarray(from_epochs(np.unique(times)))
+
+
+def _scan(f: OffsetLines, header: TextIO) -> Iterator[Tuple[int, str, int, int]]:
+    """time, SV and byte range of every record for the index"""
+    hdr = navheader2(header)
+
+    for ln in f:
+        start = f.offset
+        try:
+            time = _epochnav(ln)
+        except ValueError:
+            continue
+
+        _skip(f, Nl[hdr['systems']])
+
+        yield time, f"{hdr['systems']}{ln[:2]}".replace(' ', '0'), start, f.end
@@ -1,25 +1,31 @@
 #!/usr/bin/env python
 from pathlib import Path
+import io
 import xarray
 import logging
 import numpy as np
 import math
 from datetime import datetime
-from typing import Dict, Union, List, Any, Sequence
+from typing import Dict, Union, List, Any, Iterator, Sequence, Tuple
 from typing.io import TextIO
-import re
 #
-from .rio import opener, rinexinfo
+from .rio import opener, rinexinfo, RinexHandle
+from .index import OffsetLines, indexable, record_index, lines_at
+from .mapped import MappedFile
 from .common import rinex_string_to_float
+from .navdecode import decode_records, decode_fields
+from .epochs import to_epoch, from_epochs, datetimes, epoch, epoch_array, digits
 # constants
 STARTCOL3 = 4  # column where numerical data starts for RINEX 3
 Nl = {'C': 7, 'E': 7, 'G': 7, 'J': 7, 'R': 3, 'S': 3, 'I': 7}   # number of additional SV lines
 Lf = 19  # string length per field
 
 
-def rinexnav3(fn: Union[TextIO, str, Path],
+def rinexnav3(fn: Union[TextIO, str, Path, RinexHandle],
               use: Sequence[str] = None,
-              tlim: Sequence[datetime] = None) -> xarray.Dataset:
+              tlim: Sequence[datetime] = None,
+              index: bool = False,
+              epochs: bool = False) -> xarray.Dataset:
     """
     Reads RINEX 3.x NAV files
     Michael Hirsch, Ph.D.
@@ -27,29 +33,43 @@ def rinexnav3(fn: Union[TextIO, str, Path],
     http://www.gage.es/sites/default/files/gLAB/HTML/SBAS_Navigation_Rinex_v3.01.html
 
     The "eof" stuff is over detection of files that may or may not have a trailing newline at EOF.
+
+    index: read only the records within tlim and of the systems in use
+           through the byte offset index of an uncompressed file
+    epochs: key records on integer microseconds since 1970 instead of datetime
+
+    Uncompressed files are read through a memory map.
     """
     if isinstance(fn, (str, Path)):
         fn = Path(fn).expanduser()
 
+    idx = record_index(fn, _scan) if index and (tlim is not None or use is not None) else None
+    path = indexable(fn)
+    if path is not None:
+        rinex_parsed = _rinexnav3_mapped(path, use, tlim, idx)
+        return rinex_parsed if epochs else datetimes(rinex_parsed)
+
+    elim = None if tlim is None else [to_epoch(t) for t in tlim]
+
     rinex_parsed = {}
     rinex_parsed['data'] = {}
+    records = []
 
     with opener(fn) as f:
         header = navheader3(f)
         rinex_parsed['header'] = header
 # %% read data
-        for line in f:
-            granule = {}
+        for line in (f if idx is None else lines_at(f, idx.select(tlim, use))):
             if line.startswith('\n'):  # EOF
                 break
 
             try:
-                time = _time(line)
+                time = _epoch(line)
             except ValueError:  # blank or garbage line
                 continue
 
-            if tlim is not None:
-                if time < tlim[0] or time > tlim[1]:
+            if elim is not None:
+                if time < elim[0] or time > elim[1]:
                     _skip(f, Nl[line[0]])
                     continue
                 # not break due to non-monotonic NAV files
@@ -59,26 +79,91 @@ def rinexnav3(fn: Union[TextIO, str, Path],
                 _skip(f, Nl[sv[0]])
                 continue
             
-# %% get the data as one big long string per SV, unknown # of lines per SV
-            raw = line[23:80]  # NOTE: 80, files put data in the last column!
+# %% keep the data part of each line, unknown # of lines per SV, all records are decoded at once at the end
+            pieces = [line[23:80]]  # NOTE: 80, files put data in the last column!
 
             for _, ln in zip(range(Nl[sv[0]]), f):
-                raw += ln[STARTCOL3:80]
-            # one line per SV
-            raw = raw.replace('D', 'E').replace('\n', '')
-            raw = raw.replace('e', 'E')
-            temp_raw = re.findall('[- ]\d+\.\d+E[+-]\d+', raw, flags=re.IGNORECASE)
-            if(len(temp_raw) == 0):
-                temp_raw = re.findall('[- ]\.\d+E[+-]\d+', raw, flags=re.IGNORECASE)
-                temp_raw = list(map(lambda x: x.replace('.', '0.'), temp_raw))
+                pieces.append(ln[STARTCOL3:80])
 
             sv = sv.replace(' ', '0')
-            if not sv in rinex_parsed['data']:
-                rinex_parsed['data'][sv] = {}
-                rinex_parsed['data'][sv][time] = temp_raw
-            elif not time in rinex_parsed['data'][sv]:
-                rinex_parsed['data'][sv][time] = temp_raw
-            
+            svdata = rinex_parsed['data'].setdefault(sv, {})
+            if not time in svdata:
+                svdata[time] = len(records)
+                records.append(pieces)
+
+    coefs = decode_records(records)
+    for svdata in rinex_parsed['data'].values():
+        for time, i in svdata.items():
+            svdata[time] = coefs[i]
+
+    return rinex_parsed if epochs else datetimes(rinex_parsed)
+
+
+def _rinexnav3_mapped(path: Path, use: Sequence[str] = None, tlim: Sequence[datetime] = None,
+                      idx=None) -> Dict[str, Any]:
+    """
+    rinexnav3() of an uncompressed file with integer epochs: the epochs of all lines are decoded at once
+    and the coefficients are gathered from the memory map, no line becomes a string
+    """
+    rinex_parsed: Dict[str, Any] = {'data': {}}
+    first = []
+    sizes = []
+    elim = None if tlim is None else [to_epoch(t) for t in tlim]
+
+    with MappedFile(path) as m:
+        h = m.header_end()
+        rinex_parsed['header'] = navheader3(io.StringIO(m.texts(0, h)))
+
+        body = np.arange(h, m.nlines)
+        times, ok = (a.tolist() for a in _epochs(m, body))
+        svs = m.columns(body, 0, 3).view('S3').ravel().tolist()
+        blank = (m.ends[h:] == m.starts[h:]).tolist()
+
+        # from the index only record lines are read, otherwise a garbage line is skipped alone
+        lines = None if idx is None else iter(m.line_at(idx.select(tlim, use)).tolist())
+        nxt = h
+        while True:
+            i = nxt if lines is None else next(lines, m.nlines)
+            if i >= m.nlines:
+                break
+
+            if blank[i - h]:  # EOF
+                break
+
+            time = times[i - h]
+            if not ok[i - h]:  # fields int() accepts in other spellings, or a garbage line
+                try:
+                    time = _epoch(m.text(i))
+                except ValueError:
+                    nxt = i + 1
+                    continue
+
+            sv = svs[i - h].decode('ascii', 'ignore')
+            nxt = i + 1 + Nl[sv[0]]
+            if elim is not None:
+                if time < elim[0] or time > elim[1]:
+                    continue
+
+            if use is not None and not sv[0] in use:
+                continue
+
+            sv = sv.replace(' ', '0')
+            svdata = rinex_parsed['data'].setdefault(sv, {})
+            if not time in svdata:
+                svdata[time] = len(first)
+                first.append(i)
+                sizes.append(1 + min(Nl[sv[0]], m.nlines - i - 1))
+
+        def raw(k: int) -> str:
+            i = first[k]
+            return ''.join([m.text(i)[23:80]] + [m.text(i + j)[STARTCOL3:80] for j in range(1, sizes[k])])
+
+        coefs = decode_fields(m.records(first, sizes, ((23, 80), (STARTCOL3, 80))), len(first), raw)
+
+    for svdata in rinex_parsed['data'].values():
+        for time, k in svdata.items():
+            svdata[time] = coefs[k]
+
     return rinex_parsed
 
 
@@ -87,14 +172,20 @@ def _skip(f: TextIO, Nl: int):
         pass
 
 
-def _time(ln: str) -> datetime:
+def _epoch(ln: str) -> int:
+    """epoch of a record line as integer microseconds since 1970"""
+    return epoch(int(ln[4:8]), int(ln[9:11]), int(ln[12:14]), int(ln[15:17]), int(ln[18:20]), int(ln[21:23]))
+
 
-    return datetime(year=int(ln[4:8]),
-                    month=int(ln[9:11]),
-                    day=int(ln[12:14]),
-                    hour=int(ln[15:17]),
-                    minute=int(ln[18:20]),
-                    second=int(ln[21:23]))
+def _epochs(m: MappedFile, lines: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """_epoch() of many lines at once, (epochs, ok) with ok False where it would raise"""
+    cols = m.columns(lines, 4, 23)
+    fields = [digits(cols[:, 0:4])] + [digits(cols[:, k:k + 2]) for k in (5, 8, 11, 14, 17)]
+    ok = np.ones(cols.shape[0], dtype=bool)
+    for _, ok_k in fields:
+        ok &= ok_k
+
+    return epoch_array(*(v for v, _ in fields), np.zeros(cols.shape[0], dtype=np.int64), ok)
 
 
 def _sparefields(cf: List[str], sys: str, raw: str) -> List[str]:
@@ -229,7 +320,7 @@ def _newnav(ln: str, sv: str) -> List[str]:
 
 def navheader3(f: TextIO) -> Dict[str, Any]:
 
-    if isinstance(f, (str, Path)):
+    if isinstance(f, (str, Path, RinexHandle)):
         with opener(f, header=True) as h:
             return navheader3(h)
 
@@ -255,22 +346,45 @@ def navheader3(f: TextIO) -> Dict[str, Any]:
     return hdr
 
 
-def navtime3(fn: Union[TextIO, Path]) -> np.ndarray:
+def navtime3(fn: Union[TextIO, Path, RinexHandle], index: bool = False) -> np.ndarray:
     """
     return all times in RINEX file
+
+    index: take the times from the byte offset index of an uncompressed file
     """
-    times = []
+    idx = record_index(fn, _scan) if index else None
+    if idx is not None:
+        return np.unique(idx.times())
+
+    times: List[int] = []
 
     with opener(fn) as f:
         navheader3(f)  # skip header
 
         for line in f:
             try:
-                time = _time(line)
+                time = _epoch(line)
             except ValueError:
                 continue
 
             times.append(time)
             _skip(f, Nl[line[0]])  # different system types skip different line counts
 
-    return np.unique(times)
+    return np.asarray(from_epochs(np.unique(times)))
+
+
+def _scan(f: OffsetLines, header: TextIO) -> Iterator[Tuple[int, str, int, int]]:
+    """time, SV and byte range of every record for the index, up to the blank line rinexnav3 stops at"""
+    for line in f:
+        if line.startswith('\n'):
+            break
+
+        start = f.offset
+        try:
+            time = _epoch(line)
+        except ValueError:
+            continue
+
+        _skip(f, Nl[line[0]])
+
+        yield time, line[:3].replace(' ', '0'), start, f.end
@@ -0,0 +1,136 @@
+"""
+batch decoding of the fixed-width 19 character NAV record fields
+"""
+import re
+from itertools import repeat, product
+import numpy as np
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple
+
+Lf = 19  # string length per field
+BLANK = b' ' * Lf
+
+# every digit is mapped to '9' and every exponent letter to 'E',
+# so a field is validated by comparing it with a few templates
+_CLASS = np.arange(256, dtype=np.uint8)
+_CLASS[ord('0'):ord('9') + 1] = ord('9')
+_CLASS[[ord('D'), ord('e')]] = ord('E')
+
+TEMPLATES = {
+    False: [f'{s}9.999999999999E{e}99'.encode() for s, e in product(' -', '+-')],  # -1.234567890123D+00
+    True: [f' {s}.999999999999E{e}99'.encode() for s, e in product(' -', '+-')],  # -.123456789012D+01
+}
+
+
+def decode_raw(raw: str) -> List[str]:
+    """
+    regex decoding of one record, for records that are not strictly fixed-width
+    """
+    raw = raw.replace('D', 'E').replace('\n', '')
+    raw = raw.replace('e', 'E')
+    coefs = re.findall(r'[- ]\d+\.\d+E[+-]\d+', raw, flags=re.IGNORECASE)
+    if len(coefs) == 0:
+        coefs = re.findall(r'[- ]\.\d+E[+-]\d+', raw, flags=re.IGNORECASE)
+        coefs = [c.replace('.', '0.') for c in coefs]
+
+    return coefs
+
+
+def decode_records(records: Sequence[Sequence[str]]) -> List[List[str]]:
+    """
+    decode the coefficients of all records of a file at once
+
+    records: per record the data part of each line,
+             3 fields for the first line and 4 fields for the following ones
+
+    The exponent style (D/E/e, leading '.') is detected once, then every field
+    is validated and sliced as a NumPy byte array.
+    Records which don't match the detected fixed-width layout go through decode_raw(),
+    so the output is the same as decoding every record with decode_raw().
+    """
+    def groups() -> Iterator[Tuple[Sequence[int], np.ndarray]]:
+        grouped: dict = {}
+        for i, pieces in enumerate(records):
+            grouped.setdefault(len(pieces), []).append(i)
+
+        for Npieces, irec in grouped.items():
+            pieces = [p for i in irec for p in records[i]]
+            widths = [3 * Lf] + [4 * Lf] * (Npieces - 1)
+            buf = ''.join(map(str.ljust,
+                              map(str.rstrip, pieces, repeat('\n')),
+                              widths * len(irec))).encode('ascii', 'replace')
+            yield irec, np.frombuffer(buf, dtype=np.uint8).reshape(len(irec), -1)
+
+    return decode_fields(groups(), len(records), lambda i: ''.join(records[i]))
+
+
+def decode_fields(groups: Iterable[Tuple[Sequence[int], np.ndarray]], Nrecords: int,
+                  raw: Callable[[int], str]) -> List[List[str]]:
+    """
+    decode_records() of records already laid out as bytes
+
+    groups: record numbers and their space padded data parts as an uint8 array, one row per record
+    raw: text of the data part of a record, for records not in the fixed-width layout
+    """
+    coefs: List[List[str]] = [None] * Nrecords  # type: ignore
+
+    leading_dot = None
+    for irec, rows in groups:
+        data = rows.reshape(len(irec), -1, Lf)
+
+        blank = data.view(f'S{Lf}')[..., 0] == BLANK
+        if leading_dot is None:
+            leading_dot = _detect_leading_dot(data, blank)
+            if leading_dot is None:  # only blank fields so far
+                for i in irec:
+                    coefs[i] = []
+                continue
+
+        classes = _CLASS[data].view(f'S{Lf}')[..., 0]
+        valid = blank.copy()
+        for template in TEMPLATES[leading_dot]:
+            valid |= classes == template
+
+        fast = valid.all(axis=1)
+
+        for j in np.nonzero(~fast)[0]:
+            i = irec[j]
+            coefs[i] = decode_raw(raw(i))
+
+        if not fast.any():
+            continue
+
+        used = ~blank[fast]
+        fields = data[fast][used]
+        # one separator per field, so a single split() creates all the strings
+        out = np.empty((fields.shape[0], Lf + 1), dtype=np.uint8)
+        if leading_dot:
+            out[:, 0] = fields[:, 1]
+            out[:, 1] = ord('0')
+            out[:, 2:Lf] = fields[:, 2:]
+        else:
+            out[:, :Lf] = fields
+        out[:, 15] = ord('E')
+        out[:, Lf] = ord('\n')
+
+        values = out.tobytes().decode('ascii').split('\n')
+        ends = np.cumsum(used.sum(axis=1)).tolist()
+
+        start = 0
+        for i, end in zip(np.asarray(irec)[fast].tolist(), ends):
+            coefs[i] = values[start:end]
+            start = end
+
+    return coefs
+
+
+def _detect_leading_dot(data: np.ndarray, blank: np.ndarray):
+    """
+    exponent style from the first non-blank field: True for '.123D+01', False for '1.23D+00'
+    """
+    nonblank = np.nonzero(~blank.ravel())[0]
+    if nonblank.size == 0:
+        return None
+
+    field = data.reshape(-1, Lf)[nonblank[0]]
+
+    return not chr(field[1]).isdigit()
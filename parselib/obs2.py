@@ -1,19 +1,33 @@
 from pathlib import Path
 import numpy as np
 import logging
-import io
+from concurrent.futures import ProcessPoolExecutor
 from math import ceil
 from datetime import datetime, timedelta
 import xarray
-from typing import List, Union, Any, Dict, Tuple, Sequence, Optional
+from typing import List, Union, Any, Dict, Iterator, Tuple, Sequence
 from typing.io import TextIO
 try:
     from pymap3d import ecef2geodetic
 except ImportError:
     ecef2geodetic = None
 
-from .rio import opener, rinexinfo
+from .rio import opener, rinexinfo, RinexHandle
+from .index import OffsetLines, record_index, seek_first
 from .common import determine_time_system, check_ram, check_time_interval, check_unique_times
+from .epochs import US, epoch, from_epoch, from_epochs
+from .store import TCHUNK, Growing, Store
+
+
+CHUNK = 1 << 14  # SV rows decoded at once
+"""
+Nsvsys may need updating as GNSS systems grow.
+Let us know if you needed to change them.
+
+Beidou is 35 max
+Galileo is 36 max
+"""
+Nsvsys = 36
 
 
 def rinexobs2(fn: Path,
@@ -24,28 +38,60 @@ def rinexobs2(fn: Path,
               verbose: bool = False,
               *,
               fast: bool = True,
-              interval: Union[float, int, timedelta] = None) -> xarray.Dataset:
+              interval: Union[float, int, timedelta] = None,
+              index: bool = False,
+              workers: int = None,
+              outofcore: Union[bool, str, Path] = False,
+              keep: bool = False) -> xarray.Dataset:
+    """
+    process RINEX 2 OBS data of the systems in use, read in one pass over the file
 
+    workers: decode the SV rows of each system in this many worker processes, None decodes in this process
+    outofcore, keep: see rinexsystem2
+    """
     if isinstance(use, str):
         use = [use]
 
     if use is None or not use[0].strip():
         use = ('C', 'E', 'G', 'J', 'R', 'S')
 
-    obs = xarray.Dataset({}, coords={'time': [], 'sv': []})
-    attrs: Dict[str, Any] = {}
-    for u in use:
-        o = rinexsystem2(fn, system=u, tlim=tlim,
-                         useindicators=useindicators, meas=meas,
-                         verbose=verbose,
-                         fast=fast, interval=interval)
-        if len(o.variables) > 0:
-            attrs = o.attrs
-            obs = xarray.merge((obs, o))
-
-    obs.attrs = attrs
-
-    return obs
+    store = Store(outofcore, keep) if outofcore else None
+    try:
+        systems = _rinexsystems2(fn, use, tlim, useindicators, meas, verbose,
+                                 fast=fast, interval=interval, index=index, workers=workers, store=store)
+    except BaseException:
+        if store is not None:
+            store.close()
+        raise
+    systems = {s: o for s, o in systems.items() if len(o.variables) > 0}
+    if not systems:
+        if store is not None:
+            store.close()
+        return xarray.Dataset({}, coords={'time': [], 'sv': []})
+# %% the systems have distinct SVs, so their variables are placed side by side on the union of times and SVs
+    times = np.unique(np.concatenate([o.time.values for o in systems.values()]))
+    svs = np.unique(np.concatenate([o.sv.values for o in systems.values()]))
+    data: Dict[str, np.ndarray] = {}
+    for o in systems.values():
+        ti = np.searchsorted(times, o.time.values)
+        si = np.searchsorted(svs, o.sv.values)
+        for k, v in o.data_vars.items():
+            if k not in data:
+                data[k] = store.array(k, (times.size, svs.size)) if store else np.full((times.size, svs.size), np.nan)
+            for t0 in range(0, ti.size, TCHUNK):
+                data[k][np.ix_(ti[t0:t0+TCHUNK], si)] = v.data[t0:t0+TCHUNK]
+
+    if store is not None:
+        data = {k: store.load(k) for k in data}
+        for s, o in systems.items():
+            for k in o.data_vars:
+                store.remove(f'{s}_{k}')
+
+    obs = xarray.Dataset({k: (('time', 'sv'), v) for k, v in data.items()},
+                         coords={'time': times, 'sv': svs})
+    obs.attrs = list(systems.values())[-1].attrs
+
+    return obs if store is None else store.attach(obs)
 
 
 def rinexsystem2(fn: Union[TextIO, Path],
@@ -56,7 +102,10 @@ def rinexsystem2(fn: Union[TextIO, Path],
                  verbose: bool = False,
                  *,
                  fast: bool = True,
-                 interval: Union[float, int, timedelta] = None) -> xarray.Dataset:
+                 interval: Union[float, int, timedelta] = None,
+                 index: bool = False,
+                 outofcore: Union[bool, str, Path] = False,
+                 keep: bool = False) -> xarray.Dataset:
     """
     process RINEX OBS data
 
@@ -67,173 +116,297 @@ def rinexsystem2(fn: Union[TextIO, Path],
     useindicators: SSI, LLI are output
     meas:  'L1C'  or  ['L1C', 'C1C'] or similar
 
-    fast: speculative preallocation based on minimum SV assumption and file size.
-          Avoids double-reading file and more complicated linked lists.
-          Believed that Numpy array should be faster than lists anyway.
-          Reduce Nsvmin if error (let us know)
+    fast: kept for compatibility and recorded in the attributes,
+          the file is always read in one pass into arrays that grow in chunks
 
     t_interval: allows decimating file read by time e.g. every 5 seconds.
                 Useful to speed up reading of very large RINEX files
+
+    index: start reading at tlim through the byte offset index of an uncompressed file
+
+    outofcore: for files too long to be held in RAM. The SV rows are written to arrays on disk
+               as they are decoded and copied a time chunk at a time into .npy files in a new directory
+               inside this directory, or inside the temporary directory if True, that the returned Dataset
+               maps read-only.
+               Memory use is bounded by the chunk size. The directory is in the attribute 'store',
+               it is removed when the returned Dataset is garbage collected.
+    keep: leave the directory on disk for the caller to remove, only if outofcore is a directory
     """
-    Lf = 14
     if not isinstance(system, str):
         raise TypeError('System type() must be str')
 
+    store = Store(outofcore, keep) if outofcore else None
+    try:
+        obs = _rinexsystems2(fn, [system], tlim, useindicators, meas, verbose,
+                             fast=fast, interval=interval, index=index, store=store)[system]
+    except BaseException:
+        if store is not None:
+            store.close()
+        raise
+
+    return obs if store is None else store.attach(obs)
+
+
+def _rinexsystems2(fn: Union[TextIO, Path],
+                   systems: Sequence[str],
+                   tlim: Tuple[datetime, datetime] = None,
+                   useindicators: bool = False,
+                   meas: Sequence[str] = None,
+                   verbose: bool = False,
+                   *,
+                   fast: bool = True,
+                   interval: Union[float, int, timedelta] = None,
+                   index: bool = False,
+                   workers: int = None,
+                   store: Store = None) -> Dict[str, xarray.Dataset]:
+    """
+    rinexsystem2() of several systems: the SV rows are split by system while the file is read once,
+    each system's rows are decoded in chunks, in worker processes if workers is given
+
+    store: the decoded chunks are written to it instead of being kept in memory
+    """
     if tlim is not None and not isinstance(tlim[0], datetime):
         raise TypeError('time bounds are specified as datetime.datetime')
 
     interval = check_time_interval(interval)
-# %% allocation
-    """
-    Nsvsys may need updating as GNSS systems grow.
-    Let us know if you needed to change them.
-
-    Beidou is 35 max
-    Galileo is 36 max
-    """
-    Nsvsys = 36
 
     hdr = obsheader2(fn, useindicators, meas)
 
-    if hdr['systems'] != 'M' and system != hdr['systems']:
-        logging.debug(f'system {system} in {fn} was not present')
-        return xarray.Dataset({})
-# %% preallocate
-    if fast:
-        Nextra = _fast_alloc(fn, hdr['Nl_sv'])
-        fast = Nextra > 0
-        if verbose and not fast:
-            logging.info(f'fast mode disabled due to estimation problem, Nextra: {Nextra}')
-    else:
-        Nextra = 0
-
-    times = _num_times(fn, Nextra, tlim, verbose)
-    Nt = times.size
-
-    Npages = hdr['Nobsused']*3 if useindicators else hdr['Nobsused']
-
-    memneed = Npages * Nt * Nsvsys * 8  # 8 bytes => 64-bit float
-    check_ram(memneed, fn)
-    data = np.empty((Npages, Nt, Nsvsys))
-    data.fill(np.nan)
-# %% start reading
-    with opener(fn) as f:
-        _skip_header(f)
+    out = {}
+    for system in systems:
+        if hdr['systems'] != 'M' and system != hdr['systems']:
+            logging.debug(f'system {system} in {fn} was not present')
+            out[system] = xarray.Dataset({})
+    read = [s for s in systems if s not in out]
+    if not read:
+        return out
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+    # per system: epoch numbers, SV indices and the text or the decoded values of the SV rows
+    rows: Dict[str, Tuple[List[int], List[int], List[str]]] = {s: ([], [], []) for s in read}
+    chunks: Dict[str, List[Tuple[np.ndarray, np.ndarray, Any]]] = {s: [] for s in read}
+    if store is not None:
+        Npages = len(hdr['fields_ind']) * 3 if useindicators else len(hdr['fields_ind'])
+        raw = {s: store.growing(s, (Nsvsys, Npages)) for s in read}
+
+    def decode(s: str, last: bool = False):
+        j, isv, text = rows[s]
+        if executor is None:
+            values = _decode(text, hdr['Nobs'], useindicators)
+        else:
+            values = executor.submit(_decode, text, hdr['Nobs'], useindicators)
+        chunks[s].append((np.array(j, dtype=np.int64), np.array(isv, dtype=np.int64), values))
+        rows[s] = ([], [], [])
+        if store is None:
+            return
+        # at most one chunk per worker is held while waiting for its result
+        while chunks[s] and (executor is None or last or len(chunks[s]) > workers):
+            j, isv, values = chunks[s].pop(0)
+            if j.size:
+                _fill(raw[s].rows(j[0], j[-1] + 1).transpose(2, 0, 1), j - j[0], isv, values,
+                      hdr, useindicators, meas)
+
+    times: List[datetime] = []
+    idx = record_index(fn, _scan) if index and tlim is not None else None
+    try:
+        with opener(fn) as f:
+            _skip_header(f)
+            if idx is not None:
+                seek_first(f, idx, tlim[0])
 
 # %% process data
-        j = -1  # not enumerate in case of time error
-        last_epoch = None
+            last_epoch = None
 # %% time handling / skipping
-        for ln in f:
-            try:
-                time_epoch = _timeobs(ln)
-            except ValueError:
-                continue
-
-            if tlim is not None:
-                if time_epoch < tlim[0]:  # before specified start-time
-                    _skip(f, ln, hdr['Nl_sv'])
+            for ln in f:
+                try:
+                    time_epoch = _timeobs(ln)
+                except ValueError:
                     continue
-                elif time_epoch > tlim[1]:  # reached end-time of read
-                    break
 
-            if interval is not None:
-                if last_epoch is None:  # initialization
-                    last_epoch = time_epoch
-                else:
-                    if time_epoch - last_epoch < interval:
+                if tlim is not None:
+                    if time_epoch < tlim[0]:  # before specified start-time
                         _skip(f, ln, hdr['Nl_sv'])
                         continue
+                    elif time_epoch > tlim[1]:  # reached end-time of read
+                        break
+
+                if interval is not None:
+                    if last_epoch is None:  # initialization
+                        last_epoch = time_epoch
                     else:
-                        last_epoch += interval
+                        if time_epoch - last_epoch < interval:
+                            _skip(f, ln, hdr['Nl_sv'])
+                            continue
+                        else:
+                            last_epoch += interval
+
+# %% the epoch number must be taken after all time skipping
+                j = len(times)
+                times.append(time_epoch)
+
+                if verbose:
+                    print(time_epoch, end="\r")
+# %% get SV indices
+                try:
+                    sv = _getsvind(f, ln)
+                except ValueError as e:
+                    logging.debug(e)
+                    continue
+# %% keep the rows of the selected systems
+                for s in sv:
+                    r = rows.get(s[0])
+                    # don't process discarded satellites
+                    if r is None:
+                        for _ in range(hdr['Nl_sv']):
+                            f.readline()
+                        continue
 
-# %% j += 1 must be after all time skipping
-            j += 1
+                    r[0].append(j)
+                    r[1].append(int(s[1:]) - 1)
+                    # .rstrip() necessary to handle variety of files and Windows vs. Unix
+                    # NOT readline(80), but readline()[:80] is needed!
+                    r[2].append(''.join([f'{f.readline()[:80]:80s}' for _ in range(hdr['Nl_sv'])]))
+                    if len(r[2]) == CHUNK:
+                        decode(s[0])
 
-            if verbose:
-                print(time_epoch, end="\r")
+        for s in read:
+            decode(s, last=True)
 
-            if fast:
-                try:
-                    times[j] = time_epoch
-                except IndexError as e:
-                    raise IndexError(f'may be "fast" mode bug, try fast=False or "-strict" command-line option {e}')
-# %% Does anyone need this?
-#            try:
-#                toffset = ln[68:80]
-#            except ValueError:
-#                pass
-# %% get SV indices
-            try:
-                sv = _getsvind(f, ln)
-            except ValueError as e:
-                logging.debug(e)
-                continue
-# %% select one, a few, or all satellites
-            iuse = [i for i, s in enumerate(sv) if s[0] == system]
-            if len(iuse) == 0:
-                _skip(f, ln, hdr['Nl_sv'], sv)
-                continue
-
-            gsv = np.array(sv)[iuse]
-# %% assign data for each time step
-            raws = []
-            for s in sv:
-                # don't process discarded satellites
-                if s[0] != system:
-                    for _ in range(hdr['Nl_sv']):
-                        f.readline()
-                    continue
-                # .rstrip() necessary to handle variety of files and Windows vs. Unix
-                # NOT readline(80), but readline()[:80] is needed!
-                raw = [f'{f.readline()[:80]:80s}' for _ in range(hdr['Nl_sv'])]  # .rstrip() adds no significant process time
-
-                raws.append(''.join(raw))
-            """
-            it is about 5x faster to call np.genfromtxt() for all sats and then index,
-            vs. calling np.genfromtxt() for each sat.
-            """
-            # can't use "usecols" with "delimiter"
-            # FIXME: only read requested meas=
-            darr = np.empty((len(raws), hdr['Nobsused']))
-            darr.fill(np.nan)
-            for i, r in enumerate(raws):
-                for k in range(hdr['Nobs']):
-                    v = r[k*(Lf+2):(k+1)*(Lf+2)]
-
-                    if useindicators:
-                        if v[:-2].strip():
-                            darr[i, k*3] = float(v[:-2])
-
-                        if v[-2].strip():
-                            darr[i, k*3+1] = float(v[-2])
-
-                        if v[-1].strip():
-                            darr[i, k*3+2] = float(v[-1])
-                    else:
-                        if v[:-2].strip():
-                            darr[i, k] = float(v[:-2])
+        for s in read:
+            if store is None:
+                out[s] = _system2(fn, s, hdr, times, chunks[s], useindicators, meas, fast)
+            else:
+                out[s] = _stored2(fn, s, hdr, times, raw[s], useindicators, fast, store)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    return out
+
+
+def _decode(rows: List[str], Nobs: int, useindicators: bool) -> np.ndarray:
+    """
+    observations of SV rows, each row being the SV's lines padded to 80 columns,
+    shape (rows, Nobs) or (rows, 3 * Nobs) with LLI and SSI. Blank fields are NaN.
+    """
+    Lf = 14
+    W = Nobs * (Lf + 2)
+    text = ''.join([r[:W].ljust(W) for r in rows]).replace('\n', ' ')
+    b = np.frombuffer(text.encode('ascii', 'replace'), dtype=np.uint8).reshape(len(rows), Nobs, Lf + 2)
+
+    raw = b[:, :, :Lf].copy()
+    raw[(raw == ord(' ')).all(-1)] = np.frombuffer(b'nan'.ljust(Lf), dtype=np.uint8)
+    values = raw.view(f'S{Lf}')[..., 0].astype(np.float64)
+    if not useindicators:
+        return values
 
-            assert darr.shape[0] == gsv.size
+    ind = b[:, :, Lf:]
+    blank = ind == ord(' ')
+    digit = (ind >= ord('0')) & (ind <= ord('9'))
+    if not (blank | digit).all():
+        bad = ind[~(blank | digit)][0]
+        raise ValueError(f'could not convert string to float: {chr(bad)!r}')
 
+    darr = np.empty((len(rows), Nobs, 3))
+    darr[:, :, 0] = values
+    darr[:, :, 1:] = np.where(digit, ind - ord('0'), np.nan)
+
+    return darr.reshape(len(rows), Nobs * 3)
+
+
+def _system2(fn: Union[TextIO, Path], system: str, hdr: Dict[str, Any], times: List[datetime],
+             chunks: List[Tuple[np.ndarray, np.ndarray, Any]],
+             useindicators: bool, meas: Sequence[str], fast: bool) -> xarray.Dataset:
+    """Dataset of one system from its decoded SV rows"""
+    Nt = len(times)
+    Npages = len(hdr['fields_ind']) * 3 if useindicators else len(hdr['fields_ind'])
+
+    memneed = Npages * Nt * Nsvsys * 8  # 8 bytes => 64-bit float
+    check_ram(memneed, fn)
+    data = np.empty((Npages, Nt, Nsvsys))
+    data.fill(np.nan)
 # %% select only "used" satellites
-            isv = [int(s[1:])-1 for s in gsv]
-
-            for i, k in enumerate(hdr['fields_ind']):
-                if useindicators:
-                    data[i*3, j, isv] = darr[:, k*3]
-                    # FIXME which other should be excluded?
-                    ind = i if meas is not None else k
-                    if not hdr['fields'][ind].startswith('S'):
-                        if hdr['fields'][ind].startswith('L'):
-                            data[i*3+1, j, isv] = darr[:, k*3+1]
-
-                        data[i*3+2, j, isv] = darr[:, k*3+2]
-                else:
-                    data[i, j, isv] = darr[:, k]
+    for j, isv, darr in chunks:
+        _fill(data, j, isv, darr, hdr, useindicators, meas)
 # %% output gathering
-    data = data[:, :times.size, :]  # trims down for unneeded preallocated
+    fields = _fields(hdr, useindicators)
+
+    obs = xarray.Dataset(coords={'time': times,
+                                 'sv': [f'{system}{i:02d}' for i in range(1, Nsvsys+1)]})
 
+    for i, k in enumerate(fields):
+        # FIXME: for limited time span reads, this drops unused data variables
+        # if np.isnan(data[i, ...]).all():
+        #     continue
+        if k is None:
+            continue
+        obs[k] = (('time', 'sv'), data[i, :, :])
+
+    obs = obs.dropna(dim='sv', how='all')
+    obs = obs.dropna(dim='time', how='all')  # when tlim specified
+
+    return _attrs(obs, fn, hdr, fast)
+
+
+def _stored2(fn: Union[TextIO, Path], system: str, hdr: Dict[str, Any], times: List[datetime],
+             raw: Growing, useindicators: bool, fast: bool, store: Store) -> xarray.Dataset:
+    """
+    _system2() of SV rows written to the store: the epochs and SVs without data are dropped
+    while each variable is copied a time chunk at a time into an array mapped by the Dataset
+    """
+    fields = _fields(hdr, useindicators)
+    pages = [i for i, k in enumerate(fields) if k is not None]
+    Nt = len(times)
+    raw.extend(Nt)
+# %% dropna(how='all') over time and sv
+    keep_t = np.zeros(Nt, dtype=bool)
+    keep_sv = np.zeros(Nsvsys, dtype=bool)
+    for t0 in range(0, Nt, TCHUNK):
+        ok = ~np.isnan(raw.read(t0, t0 + TCHUNK)[:, :, pages])
+        keep_t[t0:t0 + ok.shape[0]] = ok.any(axis=(1, 2))
+        keep_sv |= ok.any(axis=(0, 2))
+    si = np.flatnonzero(keep_sv)
+# %% copy the kept rows
+    data = {fields[i]: store.array(f'{system}_{fields[i]}', (keep_t.sum(), si.size)) for i in pages}
+    n = 0
+    for t0 in range(0, Nt, TCHUNK):
+        block = raw.read(t0, t0 + TCHUNK)[keep_t[t0:t0 + TCHUNK]][:, si]
+        for i in pages:
+            data[fields[i]][n:n + block.shape[0]] = block[:, :, i]
+        n += block.shape[0]
+    raw.remove()
+
+    coords = xarray.Dataset(coords={'time': times,
+                                    'sv': [f'{system}{i:02d}' for i in range(1, Nsvsys+1)]})
+    obs = xarray.Dataset({k: (('time', 'sv'), store.load(f'{system}_{k}')) for k in data},
+                         coords=coords.isel(time=np.flatnonzero(keep_t), sv=si).coords)
+    obs.attrs['store'] = str(store.path)
+
+    return _attrs(obs, fn, hdr, fast)
+
+
+def _fill(data: np.ndarray, j: np.ndarray, isv: np.ndarray, darr: Any,
+          hdr: Dict[str, Any], useindicators: bool, meas: Sequence[str]):
+    """place decoded SV rows at epochs j and SV indices isv of data shaped (pages, time, sv)"""
+    if not isinstance(darr, np.ndarray):  # decoded in a worker
+        darr = darr.result()
+
+    for i, k in enumerate(hdr['fields_ind']):
+        if useindicators:
+            data[i*3, j, isv] = darr[:, k*3]
+            # FIXME which other should be excluded?
+            ind = i if meas is not None else k
+            if not hdr['fields'][ind].startswith('S'):
+                if hdr['fields'][ind].startswith('L'):
+                    data[i*3+1, j, isv] = darr[:, k*3+1]
+
+                data[i*3+2, j, isv] = darr[:, k*3+2]
+        else:
+            data[i, j, isv] = darr[:, k]
+
+
+def _fields(hdr: Dict[str, Any], useindicators: bool) -> List[str]:
+    """variable of each page of the data, None for pages not output"""
     fields = []
     for field in hdr['fields']:
         fields.append(field)
@@ -247,20 +420,10 @@ def rinexsystem2(fn: Union[TextIO, Path],
             else:
                 fields.extend([None, None])
 
-    obs = xarray.Dataset(coords={'time': times,
-                                 'sv': [f'{system}{i:02d}' for i in range(1, Nsvsys+1)]})
+    return fields
 
-    for i, k in enumerate(fields):
-        # FIXME: for limited time span reads, this drops unused data variables
-        # if np.isnan(data[i, ...]).all():
-        #     continue
-        if k is None:
-            continue
-        obs[k] = (('time', 'sv'), data[i, :, :])
 
-    obs = obs.dropna(dim='sv', how='all')
-    obs = obs.dropna(dim='time', how='all')  # when tlim specified
-# %% attributes
+def _attrs(obs: xarray.Dataset, fn: Union[TextIO, Path], hdr: Dict[str, Any], fast: bool) -> xarray.Dataset:
     obs.attrs['version'] = hdr['version']
 
     # Get interval from header or derive it from the data
@@ -291,44 +454,13 @@ def rinexsystem2(fn: Union[TextIO, Path],
     return obs
 
 
-def _num_times(fn: Path, Nextra: int,
-               tlim: Optional[Tuple[datetime, datetime]],
-               verbose: bool) -> np.ndarray:
-    Nsvmin = 6  # based on GPS only, 20 deg. min elev. at poles
-
-    if Nextra:
-        """
-        estimated number of satellites per file:
-            * RINEX OBS2 files have at least one 80-byte line per time: Nsvmin* ceil(Nobs / 5)
-
-        We open the file and seek because often we're using compressed files
-        that have been decompressed in memory only--there is no on-disk
-        uncompressed file.
-        """
-        with opener(fn) as f:
-            f.seek(0, io.SEEK_END)
-            filesize = f.tell()
-            f.seek(0, io.SEEK_SET)  # NEED THIS for io.StringIO input from user!
-
-        Nt = ceil(filesize / 80 / (Nsvmin * Nextra))
-        times = np.empty(Nt, dtype=datetime)
-    else:  # strict preallocation by double-reading file, OK for < 100 MB files
-        t = obstime2(fn, verbose=verbose)  # < 10 ms for 24 hour 15 second cadence
-        if tlim is not None:
-            times = t[(tlim[0] <= t) & (t <= tlim[1])]
-        else:
-            times = t
-
-    return times
-
-
 def obsheader2(f: TextIO,
                useindicators: bool = False,
                meas: Sequence[str] = None) -> Dict[str, Any]:
     """
     End users should use rinexheader()
     """
-    if isinstance(f, (str, Path)):
+    if isinstance(f, (str, Path, RinexHandle)):
         with opener(f, header=True) as h:
             return obsheader2(h, useindicators, meas)
 
@@ -461,25 +593,33 @@ def _getSVlist(ln: str, N: int,
     return sv
 
 
-def obstime2(fn: Union[TextIO, Path],
-             verbose: bool = False) -> np.ndarray:
+def obstime2(fn: Union[TextIO, Path, RinexHandle],
+             verbose: bool = False,
+             index: bool = False) -> np.ndarray:
     """
     read all times in RINEX2 OBS file
+
+    index: take the times from the byte offset index of an uncompressed file
     """
-    times = []
-    with opener(fn) as f:
-        # Capture header info
-        hdr = obsheader2(f)
+    idx = record_index(fn, _scan) if index else None
+    if idx is not None:
+        times = idx.times()
+    else:
+        epochs = []
+        with opener(fn) as f:
+            # Capture header info
+            hdr = obsheader2(f)
 
-        for ln in f:
-            try:
-                time_epoch = _timeobs(ln)
-            except ValueError:
-                continue
+            for ln in f:
+                try:
+                    time_epoch = _epochobs(ln)
+                except ValueError:
+                    continue
 
-            times.append(time_epoch)
+                epochs.append(time_epoch)
 
-            _skip(f, ln, hdr['Nl_sv'])
+                _skip(f, ln, hdr['Nl_sv'])
+        times = from_epochs(epochs)
 
     times = np.asarray(times)
 
@@ -488,6 +628,22 @@ def obstime2(fn: Union[TextIO, Path],
     return times
 
 
+def _scan(f: OffsetLines, header: TextIO) -> Iterator[Tuple[int, str, int, int]]:
+    """time and byte range of every epoch for the index"""
+    hdr = obsheader2(header)
+
+    for ln in f:
+        start = f.offset
+        try:
+            time_epoch = _epochobs(ln)
+        except ValueError:
+            continue
+
+        _skip(f, ln, hdr['Nl_sv'])
+
+        yield time_epoch, '', start, f.end
+
+
 def _skip(f: TextIO, ln: str,
           Nl_sv: int,
           sv: Sequence[str] = None):
@@ -532,6 +688,11 @@ def _timehdr(ln: str) -> datetime:
 
 def _timeobs(ln: str) -> datetime:
 
+    return from_epoch(_epochobs(ln))
+
+
+def _epochobs(ln: str) -> int:
+    """time of an epoch line as integer microseconds since 1970"""
     year = int(ln[1:3])
     if year < 80:
         year += 2000
@@ -539,21 +700,21 @@ def _timeobs(ln: str) -> datetime:
         year += 1900
 
     try:
-        usec = int(float(ln[16:26]) % 1 * 1000000)
+        usec = int(float(ln[16:26]) % 1 * US)
     except ValueError:
         usec = 0
 
-    t = datetime(year=year,
-                 month=int(ln[4:6]),
-                 day=int(ln[7:9]),
-                 hour=int(ln[10:12]),
-                 minute=int(ln[13:15]),
-                 second=int(ln[16:18]),
-                 microsecond=usec)
+    t = epoch(year,
+              int(ln[4:6]),
+              int(ln[7:9]),
+              int(ln[10:12]),
+              int(ln[13:15]),
+              int(ln[16:18]),
+              usec)
 # %% check if valid time
     eflag = int(ln[28])
     if eflag not in (0, 1, 5, 6):  # EPOCH FLAG
-        raise ValueError(f'{t}: epoch flag {eflag}')
+        raise ValueError(f'{from_epochs([t])[0]}: epoch flag {eflag}')
 
     return t
 
@@ -562,47 +723,3 @@ def _skip_header(f: TextIO):
     for ln in f:
         if "END OF HEADER" in ln:
             break
-
-
-def _fast_alloc(fn: Union[TextIO, Path], Nl_sv: int) -> int:
-    """
-    prescan first N lines of file to see if it truncates to less than 80 bytes
-
-    Picking N:  N > Nobs+4 or so.
-      100 seemed a good start.
-    """
-    if isinstance(fn, Path):
-        assert fn.is_file(), 'need freshly opened file'
-    elif isinstance(fn, io.StringIO):
-        fn.seek(0)
-    else:
-        raise TypeError(f'Unknown filetype {type(fn)}')
-
-    ln = ""  # in case of truncated file, don't crash
-    with opener(fn) as f:
-        _skip_header(f)
-# %% find the first line with time (sometimes a blank line or two after header)
-        for ln in f:
-            try:
-                t = _timeobs(ln)
-            except ValueError:
-                continue
-
-            if isinstance(t, datetime):
-                break
-
-        try:
-            _getsvind(f, ln)
-        except ValueError as e:
-            logging.debug(e)
-            return 0
-
-        raw = [f.readline() for _ in range(Nl_sv)]
-
-    lens = list(map(len, raw))
-    if max(lens) < 79:  # oddly formatted file, no prediction
-        return 0
-
-    shorts = sum(ln < 79 for ln in lens)
-
-    return len(lens) - shorts
@@ -4,21 +4,25 @@ import logging
 from datetime import datetime, timedelta
 import io
 import xarray
-from typing import Dict, Union, List, Tuple, Any, Sequence
+from typing import Dict, Union, List, Tuple, Any, Iterator, Sequence
 from typing.io import TextIO
 try:
     from pymap3d import ecef2geodetic
 except ImportError:
     ecef2geodetic = None
 #
-from .rio import opener, rinexinfo
+from .rio import opener, rinexinfo, RinexHandle
+from .index import OffsetLines, indexable, record_index, seek_first
+from .mapped import MappedFile
 from .common import determine_time_system, check_time_interval, check_unique_times
+from .epochs import US, epoch, epoch_array, from_epoch, from_epochs, digits, decimal
 """https://github.com/mvglasow/satstat/wiki/NMEA-IDs"""
 
 SBAS = 100  # offset for ID
 GLONASS = 37
 QZSS = 192
 BEIDOU = 0
+CHUNK = 1 << 16  # SV lines converted to numbers at once
 
 
 def rinexobs3(fn: Union[TextIO, str, Path],
@@ -29,7 +33,8 @@ def rinexobs3(fn: Union[TextIO, str, Path],
               verbose: bool = False,
               *,
               fast: bool = False,
-              interval: Union[float, int, timedelta] = None) -> xarray.Dataset:
+              interval: Union[float, int, timedelta] = None,
+              index: bool = False) -> xarray.Dataset:
     """
     process RINEX 3 OBS data
 
@@ -41,14 +46,13 @@ def rinexobs3(fn: Union[TextIO, str, Path],
     meas:  'L1C'  or  ['L1C', 'C1C'] or similar
 
     fast:
-          TODO: FUTURE, not yet enabled for OBS3
-          speculative preallocation based on minimum SV assumption and file size.
-          Avoids double-reading file and more complicated linked lists.
-          Believed that Numpy array should be faster than lists anyway.
-          Reduce Nsvmin if error (let us know)
+          not used for OBS3: the SV lines are converted in chunks
+          and the Dataset is built once from preallocated arrays
 
     interval: allows decimating file read by time e.g. every 5 seconds.
                 Useful to speed up reading of very large RINEX files
+
+    index: start reading at tlim through the byte offset index of an uncompressed file
     """
 
     interval = check_time_interval(interval)
@@ -66,14 +70,17 @@ def rinexobs3(fn: Union[TextIO, str, Path],
         meas = None
 # %% allocate
     # times = obstime3(fn)
-    data = xarray.Dataset({}, coords={'time': [], 'sv': []})
     if tlim is not None and not isinstance(tlim[0], datetime):
         raise TypeError('time bounds are specified as datetime.datetime')
 
     last_epoch = None
+    idx = record_index(fn, _scan) if index and tlim is not None else None
 # %% loop
     with opener(fn) as f:
         hdr = obsheader3(f, use, meas)
+        epochs = _Epochs(hdr, useindicators)
+        if idx is not None:
+            seek_first(f, idx, tlim[0])
 # %% process OBS file
         for ln in f:
             if not ln.startswith('>'):  # end of file
@@ -86,12 +93,12 @@ def rinexobs3(fn: Union[TextIO, str, Path],
                 continue
 # %% get SV indices
             sv = []
-            raw = ''
+            lines = []
             # Number of visible satellites this time %i3  pg. A13
             for _ in range(int(ln[33:35])):
                 ln = f.readline()
                 sv.append(ln[:3])
-                raw += ln[3:]
+                lines.append(ln[3:])
 
             if tlim is not None:
                 if time < tlim[0]:
@@ -111,8 +118,10 @@ def rinexobs3(fn: Union[TextIO, str, Path],
             if verbose:
                 print(time, end="\r")
 
-            # this time epoch is complete, assemble the data.
-            data = _epoch(data, raw, hdr, time, sv, useindicators, verbose)
+            # this time epoch is complete, keep it for assembling the data at the end
+            epochs.add(time, sv, lines)
+
+    data = epochs.dataset()
 
 # %% patch SV names in case of "G 7" => "G07"
     data = data.assign_coords(sv=[s.replace(' ', '0') for s in data.sv.values.tolist()])
@@ -151,26 +160,52 @@ def _timeobs(ln: str) -> datetime:
     """
     convert time from RINEX 3 OBS text to datetime
     """
+    return from_epoch(_epochobs(ln))
+
+
+def _epochobs(ln: str) -> int:
+    """time of an epoch line as integer microseconds since 1970"""
     if not ln.startswith('> '):  # pg. A13
         raise ValueError('RINEX 3 line beginning "> " is not present')
 
-    return datetime(int(ln[2:6]), int(ln[7:9]), int(ln[10:12]),
-                    hour=int(ln[13:15]), minute=int(ln[16:18]),
-                    second=int(ln[19:21]),
-                    microsecond=int(float(ln[19:29]) % 1 * 1000000))
+    return epoch(int(ln[2:6]), int(ln[7:9]), int(ln[10:12]), int(ln[13:15]), int(ln[16:18]),
+                 int(ln[19:21]), int(float(ln[19:29]) % 1 * US))
+
+
+def _epochs(m: MappedFile, lines: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """_epochobs() of many lines at once, (epochs, ok) with ok False where it would raise"""
+    cols = m.columns(lines, 0, 29)
+    fields = [digits(cols[:, 2:6])] + [digits(cols[:, k:k + 2]) for k in (7, 10, 13, 16, 19)]
+    frac, ok = decimal(cols[:, 19:29])
+    ok &= (cols[:, 0] == ord('>')) & (cols[:, 1] == ord(' '))
+    for _, ok_k in fields:
+        ok &= ok_k
+
+    return epoch_array(*(v for v, _ in fields), (frac % 1 * US).astype(np.int64), ok)
 
 
-def obstime3(fn: Union[TextIO, Path],
-             verbose: bool = False) -> np.ndarray:
+def obstime3(fn: Union[TextIO, Path, RinexHandle],
+             verbose: bool = False,
+             index: bool = False) -> np.ndarray:
     """
     return all times in RINEX file
-    """
-    times = []
 
-    with opener(fn) as f:
-        for ln in f:
-            if ln.startswith('>'):
-                times.append(_timeobs(ln))
+    index: take the times from the byte offset index of an uncompressed file
+    """
+    idx = record_index(fn, _scan) if index else None
+    path = indexable(fn) if idx is None else None
+    if idx is not None:
+        times = idx.times()
+    elif path is not None:  # epoch lines found and decoded at once in the memory map
+        with MappedFile(path) as m:
+            lines = np.flatnonzero(m.first_bytes(np.arange(m.nlines)) == ord('>'))
+            epochs, ok = _epochs(m, lines)
+            for k in np.flatnonzero(~ok).tolist():  # other spellings of the fields, or raises
+                epochs[k] = _epochobs(m.text(lines[k]))
+            times = from_epochs(epochs)
+    else:
+        with opener(fn) as f:
+            times = from_epochs(_epochobs(ln) for ln in f if ln.startswith('>'))
 
     times = np.asarray(times)
 
@@ -179,62 +214,130 @@ def obstime3(fn: Union[TextIO, Path],
     return times
 
 
-def _epoch(data: xarray.Dataset, raw: str,
-           hdr: Dict[str, Any],
-           time: datetime,
-           sv: List[str],
-           useindicators: bool,
-           verbose: bool) -> xarray.Dataset:
-    """
-    block processing of each epoch (time step)
-    """
-    darr = np.atleast_2d(np.genfromtxt(io.BytesIO(raw.encode('ascii')),
-                                       delimiter=(14, 1, 1) * hdr['Fmax']))
-# %% assign data for each time step
-    for sk in hdr['fields']:  # for each satellite system type (G,R,S, etc.)
-        # satellite indices "si" to extract from this time's measurements
-        si = [i for i, s in enumerate(sv) if s[0] in sk]
-        if len(si) == 0:  # no SV of this system "sk" at this time
-            continue
-
-        # measurement indices "di" to extract at this time step
-        di = hdr['fields_ind'][sk]
-        garr = darr[si, :]
-        garr = garr[:, di]
-
-        gsv = np.array(sv)[si]
+def _scan(f: OffsetLines, header: TextIO) -> Iterator[Tuple[int, str, int, int]]:
+    """time and byte range of every epoch for the index"""
+    epoch = None
+    for ln in f:
+        if ln.startswith('>'):
+            if epoch is not None:
+                yield epoch[0], '', epoch[1], f.offset
+            epoch = (_epochobs(ln), f.offset)
 
-        dsf: Dict[str, tuple] = {}
-        for i, k in enumerate(hdr['fields'][sk]):
-            dsf[k] = (('time', 'sv'), np.atleast_2d(garr[:, i*3]))
+    if epoch is not None:
+        yield epoch[0], '', epoch[1], f.end
 
-            if useindicators:
-                dsf = _indicators(dsf, k, garr[:, i*3+1:i*3+3])
 
-        if verbose:
-            print(time, '\r', end='')
+class _Epochs:
+    """
+    epochs of an OBS file gathered in chunks of SV lines,
+    the Dataset is built once from preallocated arrays at the end
+    """
 
-        epoch_data = xarray.Dataset(dsf, coords={'time': [time], 'sv': gsv})
-        if len(data) == 0:
-            data = epoch_data
-        elif len(hdr['fields']) == 1:  # one satellite system selected, faster to process
-            data = xarray.concat((data, epoch_data), dim='time')
-        else:  # general case, slower for different satellite systems all together
-            data = xarray.merge((data, epoch_data))
+    def __init__(self, hdr: Dict[str, Any], useindicators: bool):
+        self.hdr = hdr
+        self.useindicators = useindicators
+        self.times: List[datetime] = []
+        # pending SV lines: epoch number, SV and the fields after the SV
+        self._t: List[int] = []
+        self._sv: List[str] = []
+        self._lines: List[str] = []
+        # converted SV lines of each system: epoch numbers, SVs and (value, LLI, SSI) columns of its fields
+        self._blocks: Dict[str, List[Tuple[np.ndarray, List[str], np.ndarray]]] = {sk: [] for sk in hdr['fields']}
+
+    def add(self, time: datetime, sv: List[str], lines: List[str]):
+        self._t += [len(self.times)] * len(sv)
+        self.times.append(time)
+        self._sv += sv
+        self._lines += lines
+        if len(self._lines) >= CHUNK:
+            self._flush()
+
+    def _flush(self):
+        if not self._lines:
+            return
+
+        Fmax = self.hdr['Fmax']
+        darr = _fields(self._lines, Fmax)
+        t = np.array(self._t)
+        for sk, fields in self.hdr['fields'].items():  # for each satellite system type (G,R,S, etc.)
+            si = [i for i, s in enumerate(self._sv) if s[0] in sk]
+            if not si:
+                continue
+            # measurement columns of this system
+            di = np.arange(Fmax * 3)[self.hdr['fields_ind'][sk]][:3 * len(fields)]
+            self._blocks[sk].append((t[si], [self._sv[i] for i in si], darr[np.ix_(si, di)]))
+
+        self._t, self._sv, self._lines = [], [], []
+
+    def dataset(self) -> xarray.Dataset:
+        self._flush()
+        blocks = {sk: b for sk, b in self._blocks.items() if b}
+        if not blocks:
+            return xarray.Dataset({}, coords={'time': [], 'sv': []})
+
+        t = {sk: np.concatenate([tb for tb, _, _ in b]) for sk, b in blocks.items()}
+        sv = {sk: [s for _, sb, _ in b for s in sb] for sk, b in blocks.items()}
+        arr = {sk: np.concatenate([ab for _, _, ab in b]) for sk, b in blocks.items()}
+        del blocks
+        self._blocks = {}
+# %% epochs with data, merging epochs of several systems sorted them by time
+        used = np.unique(np.concatenate(list(t.values())))
+        if len(self.hdr['fields']) > 1:
+            used = used[np.argsort(np.array([self.times[i] for i in used.tolist()]), kind='stable')]
+        row = np.empty(len(self.times), dtype=np.int64)
+        row[used] = np.arange(used.size)
+        svs = np.unique([s for ss in sv.values() for s in ss])
+# %% variables in the order they first appear in the file
+        dsf: Dict[str, np.ndarray] = {}
+        for sk in sorted(arr, key=lambda sk: (t[sk].min(), list(self.hdr['fields']).index(sk))):
+            ti = row[t[sk]]
+            si = np.searchsorted(svs, sv[sk])
+            for i, k in enumerate(self.hdr['fields'][sk]):
+                names = [(k, 0)]
+                if self.useindicators:
+                    if k.startswith(('L1', 'L2')):  # LLI, loss of lock
+                        names.append((k + 'lli', 1))
+                    names.append((k + 'ssi', 2))  # signal strength
+
+                for name, j in names:
+                    if name not in dsf:
+                        dsf[name] = np.full((used.size, svs.size), np.nan)
+                    dsf[name][ti, si] = arr[sk][:, 3 * i + j]
+
+        return xarray.Dataset({k: (('time', 'sv'), v) for k, v in dsf.items()},
+                              coords={'time': [self.times[i] for i in used.tolist()], 'sv': svs})
+
+
+def _fields(lines: List[str], Fmax: int) -> np.ndarray:
+    """
+    value, LLI and SSI columns of SV lines without the SV, like np.genfromtxt(delimiter=(14, 1, 1) * Fmax):
+    blank and unreadable fields are NaN
+    """
+    W = 16 * Fmax
+    text = ''.join([ln.rstrip('\n')[:W].ljust(W) for ln in lines]).encode('ascii', 'replace')
+    b = np.frombuffer(text, dtype=np.uint8).reshape(len(lines), Fmax, 16)
 
-    return data
+    raw = b[:, :, :14].copy()
+    raw[(raw == ord(' ')).all(-1)] = np.frombuffer(b'nan'.ljust(14), dtype=np.uint8)
+    raw = raw.view('S14')[..., 0]
+    try:
+        values = raw.astype(np.float64)
+    except ValueError:  # garbage in some field
+        values = np.array([_float(v) for v in raw.ravel().tolist()]).reshape(raw.shape)
 
+    out = np.empty((len(lines), Fmax, 3))
+    out[:, :, 0] = values
+    ind = b[:, :, 14:] - ord('0')
+    out[:, :, 1:] = np.where(ind <= 9, ind, np.nan)  # a digit or nothing
 
-def _indicators(d: dict, k: str, arr: np.ndarray) -> Dict[str, tuple]:
-    """
-    handle LLI (loss of lock) and SSI (signal strength)
-    """
-    if k.startswith(('L1', 'L2')):
-        d[k+'lli'] = (('time', 'sv'), np.atleast_2d(arr[:, 0]))
+    return out.reshape(len(lines), Fmax * 3)
 
-    d[k+'ssi'] = (('time', 'sv'), np.atleast_2d(arr[:, 1]))
 
-    return d
+def _float(v: bytes) -> float:
+    try:
+        return float(v)
+    except ValueError:
+        return np.nan
 
 
 def obsheader3(f: TextIO,
@@ -245,7 +348,7 @@ def obsheader3(f: TextIO,
     optionally, select system type and/or measurement type to greatly
     speed reading and save memory (RAM, disk)
     """
-    if isinstance(f, (str, Path)):
+    if isinstance(f, (str, Path, RinexHandle)):
         with opener(f, header=True) as h:
             return obsheader3(h, use, meas)
 
@@ -1,73 +1,155 @@
 import gzip
 import zipfile
 from pathlib import Path
-from contextlib import contextmanager
+from contextlib import contextmanager, ExitStack
 import io
+import itertools
 import logging
 import xarray
 from typing.io import TextIO
 import typing
 
-try:
-    from unlzw3 import unlzw
-except ImportError:
-    try:
-        from unlzw import unlzw
-    except ImportError:
-        unlzw = None
+from .hatanaka import crxlines, crxstream
+from .lzw import lzwtext
+from .stream import LineStream
 
-from .hatanaka import opencrx
+COMPRESSED = ('.gz', '.zip', '.Z')
 
 
 @contextmanager
-def opener(fn: typing.Union[TextIO, Path], header: bool = False) -> TextIO:
-    """provides file handle for regular ASCII or gzip files transparently"""
+def opener(fn: typing.Union[TextIO, Path, 'RinexHandle'], header: bool = False) -> TextIO:
+    """
+    provides file handle for regular ASCII, gzip, zip, .Z and CRINEX files transparently
+
+    Every container is decompressed as a stream, CRINEX inside any of them is decoded line by line,
+    so the whole file is never in memory.
+    A RinexHandle gives a new stream over its already opened file, always decoded.
+    """
     if isinstance(fn, str):
         fn = Path(fn).expanduser()
 
     if isinstance(fn, io.StringIO):
         fn.seek(0)
         yield fn
+    elif isinstance(fn, RinexHandle):
+        yield fn.file()
     elif isinstance(fn, Path):
-        finf = fn.stat()
-        if finf.st_size > 100e6:
-            logging.info(f'opening {finf.st_size/1e6} MByte {fn.name}')
-
-        if fn.suffix == '.gz':
-            with gzip.open(fn, 'rt') as f:
-                version, is_crinex = rinex_version(first_nonblank_line(f))
-                f.seek(0)
-
-                if is_crinex and not header:
-                    f = io.StringIO(opencrx(f))
-                yield f
-        elif fn.suffix == '.zip':
-            with zipfile.ZipFile(fn, 'r') as z:
-                flist = z.namelist()
-                for rinexfn in flist:
-                    with z.open(rinexfn, 'r') as bf:
-                        f = io.StringIO(
-                            io.TextIOWrapper(bf, encoding='ascii', errors='ignore').read()  # type: ignore
-                        )
-                        yield f
-        elif fn.suffix == '.Z':
-            if unlzw is None:
-                raise ImportError('pip install unlzw3')
-            with fn.open('rb') as zu:
-                with io.StringIO(unlzw(zu.read()).decode('ascii')) as f:
-                    yield f
-        else:  # assume not compressed (or Hatanaka)
-            with fn.open('r', encoding='ascii', errors='ignore') as f:
-                version, is_crinex = rinex_version(first_nonblank_line(f))
-                f.seek(0)
-
-                if is_crinex and not header:
-                    f = io.StringIO(opencrx(f))
-                yield f
+        with _container(fn) as f:
+            yield _decode_crinex(f, header)
     else:
         raise OSError(f'Unsure what to do with input of type: {type(fn)}')
 
 
+@contextmanager
+def _container(fn: Path) -> TextIO:
+    """text of the file, or of the first member of a zip file, CRINEX is not decoded"""
+    finf = fn.stat()
+    if finf.st_size > 100e6:
+        logging.info(f'opening {finf.st_size/1e6} MByte {fn.name}')
+
+    if fn.suffix == '.gz':
+        with gzip.open(fn, 'rt', encoding='ascii', errors='ignore') as f:
+            yield f
+    elif fn.suffix == '.zip':
+        with zipfile.ZipFile(fn, 'r') as z:
+            with z.open(z.namelist()[0], 'r') as bf:
+                yield io.TextIOWrapper(bf, encoding='ascii', errors='ignore')  # type: ignore
+    elif fn.suffix == '.Z':
+        with fn.open('rb') as zu:
+            yield lzwtext(zu, str(fn))
+    else:  # assume not compressed (or Hatanaka)
+        with fn.open('r', encoding='ascii', errors='ignore') as f:
+            yield f
+
+
+def _decode_crinex(f: TextIO, header: bool) -> TextIO:
+    """CRINEX is decoded unless only the header is read"""
+    version, is_crinex = rinex_version(first_nonblank_line(f))
+    f.seek(0)
+
+    if is_crinex and not header:
+        f = crxstream(f)
+
+    return f
+
+
+class RinexHandle:
+    """
+    RINEX or CRINEX file opened and decompressed once
+
+    The first line and the header are read on opening: info is what rinexinfo() gives,
+    crinex tells if the file is Hatanaka compressed and header_lines are the (decoded) RINEX header lines.
+    opener(handle) replays the header from memory and continues with the same stream,
+    the file is only decompressed again when its data is read a second time.
+
+        with RinexHandle(fn) as h:
+            hdr = rinexheader(h)
+            nav = rinexnav(h)
+    """
+
+    def __init__(self, fn: typing.Union[str, Path]):
+        self.name = Path(fn).expanduser()
+        self._stack = ExitStack()
+        self._raw = self._stack.enter_context(_container(self.name))
+        try:
+            first = first_nonblank_line(self._raw)
+            self.crinex = rinex_version(first)[1]
+            lines = self._lines(first)
+            self.header_lines = [next(lines)] if self.crinex else [first]
+            self.info = _lineinfo(self.header_lines[0])
+            if self.info['rinextype'] != 'sp3':
+                for ln in lines:
+                    self.header_lines.append(ln)
+                    if 'END OF HEADER' in ln:
+                        break
+        except (TypeError, StopIteration, ValueError) as e:
+            self.close()
+            raise ValueError(f'not a known/valid RINEX file {self.name}.  {e}')
+        except BaseException:
+            self.close()
+            raise
+
+        self._body = lines
+        self._body_read = False
+
+    def _lines(self, first: str) -> typing.Iterator[str]:
+        """lines following the first line read: all decoded lines of a CRINEX file, the rest of a RINEX file"""
+        lines = itertools.chain([first], self._raw)
+
+        return crxlines(lines) if self.crinex else self._raw
+
+    def _replay(self) -> typing.Iterator[str]:
+        if self._body_read:  # start over, skipping the header already read
+            self._raw.seek(0)
+            self._body = self._lines(first_nonblank_line(self._raw))
+            for _ in range(len(self.header_lines) - (not self.crinex)):
+                next(self._body, None)
+
+        yield from self.header_lines
+        self._body_read = True
+        yield from self._body
+
+    def file(self) -> TextIO:
+        """RINEX text of the file from its start"""
+        if not self.crinex and self.name.suffix not in COMPRESSED:
+            self._raw.seek(0)  # uncompressed, seeking back is free
+            return self._raw
+
+        return LineStream(self._replay, str(self.name))
+
+    def close(self):
+        self._stack.close()
+
+    def __enter__(self) -> 'RinexHandle':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f'RinexHandle({str(self.name)!r})'
+
+
 def first_nonblank_line(f: TextIO, max_lines: int = 10) -> str:
     """ return first non-blank 80 character line in file
 
@@ -110,11 +192,22 @@ def rinexinfo(f: typing.Union[Path, TextIO]) -> typing.Dict[str, typing.Any]:
         with opener(fn, header=True) as f:
             return rinexinfo(f)
 
+    if isinstance(f, RinexHandle):
+        return dict(f.info)
+
     f.seek(0)
 
     try:
         line = first_nonblank_line(f)  # don't choke on binary files
+    except (TypeError, AttributeError, ValueError) as e:
+        raise ValueError(f'not a known/valid RINEX file.  {e}')
+
+    return _lineinfo(line)
 
+
+def _lineinfo(line: str) -> typing.Dict[str, typing.Any]:
+    """rinexinfo() of the first non-blank line"""
+    try:
         if line.startswith('#c'):
             return {'version': 'c', 'rinextype': 'sp3'}
         elif line.startswith('#d'):
@@ -0,0 +1,116 @@
+"""
+on-disk arrays of out-of-core OBS reads
+
+Arrays are .npy files in a store directory written a time chunk at a time and mapped read-only
+into the returned Dataset, so only the pages in use are held in memory.
+"""
+import logging
+import shutil
+import tempfile
+import weakref
+from pathlib import Path
+from typing import Any, Tuple, Union
+
+import numpy as np
+
+TCHUNK = 1 << 12  # epochs copied at once
+
+
+class Growing:
+    """
+    float64 array with a growing first axis, stored row after row in a raw file,
+    rows not written yet are NaN
+    """
+
+    def __init__(self, path: Path, row: Tuple[int, ...]):
+        self.path = path
+        self.row = row
+        self.rowbytes = int(np.prod(row)) * 8
+        self.n = 0
+        path.write_bytes(b'')
+
+    def extend(self, n: int):
+        """grow to n rows"""
+        if n <= self.n:
+            return
+
+        with self.path.open('ab') as f:
+            for k in range(self.n, n, TCHUNK):
+                np.full((min(TCHUNK, n - k),) + self.row, np.nan).tofile(f)
+        self.n = n
+
+    def rows(self, j0: int, j1: int) -> np.ndarray:
+        """rows j0:j1, writable, growing the array if needed"""
+        self.extend(j1)
+
+        return np.memmap(self.path, np.float64, 'r+', offset=j0 * self.rowbytes, shape=(j1 - j0,) + self.row)
+
+    def read(self, j0: int, j1: int) -> np.ndarray:
+        """rows j0:j1, read-only"""
+        j1 = min(j1, self.n)
+        if j1 <= j0:
+            return np.empty((0,) + self.row)
+
+        return np.memmap(self.path, np.float64, 'r', offset=j0 * self.rowbytes, shape=(j1 - j0,) + self.row)
+
+    def remove(self):
+        remove(self.path)
+
+
+class Store:
+    """
+    new directory of the arrays of one read, inside the given directory or the temporary directory if True,
+    so reads never overwrite arrays mapped by earlier results
+
+    keep: leave the directory on disk, only for a given directory,
+          otherwise it is removed with the result it's attached to
+    """
+
+    def __init__(self, path: Union[bool, str, Path], keep: bool = False):
+        if path is not True:
+            path = Path(path).expanduser()
+            path.mkdir(parents=True, exist_ok=True)
+        self.path = Path(tempfile.mkdtemp(prefix='rinex-', dir=None if path is True else path))
+        self.keep = keep and path is not True
+        logging.info(f'out-of-core arrays are stored in {self.path}')
+
+    def attach(self, result: Any) -> Any:
+        """
+        remove the directory once result is garbage collected, unless it is kept.
+        Arrays already mapped stay readable on POSIX, on Windows the files stay until unmapped
+        """
+        if not self.keep:
+            weakref.finalize(result, shutil.rmtree, str(self.path), ignore_errors=True)
+
+        return result
+
+    def close(self):
+        """remove the directory now, unless it is kept: the read failed or returned nothing stored"""
+        if not self.keep:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def growing(self, name: str, row: Tuple[int, ...]) -> Growing:
+        return Growing(self.path / f'{name}.raw', row)
+
+    def array(self, name: str, shape: Tuple[int, int]) -> np.ndarray:
+        """new writable array filled with NaN"""
+        shape = tuple(int(n) for n in shape)  # NumPy integers don't fit the .npy header
+        arr = np.lib.format.open_memmap(self.path / f'{name}.npy', 'w+', np.float64, shape)
+        for t0 in range(0, shape[0], TCHUNK):
+            arr[t0:t0 + TCHUNK] = np.nan
+
+        return arr
+
+    def load(self, name: str) -> np.ndarray:
+        """array mapped read-only"""
+        return np.load(self.path / f'{name}.npy', mmap_mode='r')
+
+    def remove(self, name: str):
+        remove(self.path / f'{name}.npy')
+
+
+def remove(path: Path):
+    try:
+        path.unlink()
+    except OSError as e:  # still mapped on Windows
+        logging.debug(f'could not remove {path}: {e}')
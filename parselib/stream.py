@@ -0,0 +1,86 @@
+"""
+text streams decoded line by line
+"""
+import io
+from typing import Callable, Iterator
+
+
+class LineStream(io.TextIOBase):
+    """
+    Read-only text file over a line generator, only the current line is kept in memory.
+
+    source() starts a new generator, seek(0) calls it again.
+    seek(0, io.SEEK_END) decodes to the end, so tell() gives the decoded size.
+    """
+
+    def __init__(self, source: Callable[[], Iterator[str]], name: str = ''):
+        self._source = source
+        self.name = name
+        self._lines = source()
+        self._pending = ''
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readline(self, size: int = -1) -> str:
+        self._checkClosed()
+
+        line = self._pending or next(self._lines, '')
+        self._pending = ''
+        if size is not None and 0 <= size < len(line):
+            line, self._pending = line[:size], line[size:]
+
+        self._pos += len(line)
+
+        return line
+
+    def __next__(self) -> str:
+        if self._pending:
+            line = self.readline()
+        else:
+            self._checkClosed()
+            line = next(self._lines)
+            self._pos += len(line)
+        if not line:
+            raise StopIteration
+
+        return line
+
+    def __iter__(self):
+        return self
+
+    def read(self, size: int = -1) -> str:
+        parts = []
+        n = 0
+        while size is None or size < 0 or n < size:
+            line = self.readline(-1 if size is None or size < 0 else size - n)
+            if not line:
+                break
+            parts.append(line)
+            n += len(line)
+
+        return ''.join(parts)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._checkClosed()
+
+        if whence == io.SEEK_SET and offset == 0:
+            self._lines = self._source()
+            self._pending = ''
+            self._pos = 0
+        elif whence == io.SEEK_END and offset == 0:
+            while self.readline():
+                pass
+        elif whence == io.SEEK_CUR and offset == 0:
+            pass
+        else:
+            raise io.UnsupportedOperation('can only seek to the start or the end of a decoded stream')
+
+        return self._pos
@@ -7,11 +7,11 @@ import io
 import xarray
 import numpy as np
 
-from .rio import rinexinfo, opener
+from .rio import rinexinfo, opener, RinexHandle
 from .obs2 import obstime2, obsheader2
 from .obs3 import obstime3, obsheader3
 from .nav2 import navtime2, navheader2
-#from .nav3 import navtime3, navheader3
+from .nav3 import navtime3, navheader3
 
 
 def globber(path: Path, glob: Sequence[str]) -> List[Path]:
@@ -30,7 +30,7 @@ def globber(path: Path, glob: Sequence[str]) -> List[Path]:
     return flist
 
 
-def gettime(fn: Union[TextIO, Path]) -> np.ndarray:
+def gettime(fn: Union[TextIO, Path, RinexHandle], index: bool = False) -> np.ndarray:
     """
     get times in RINEX 2/3 file
     Note: in header,
@@ -40,8 +40,10 @@ def gettime(fn: Union[TextIO, Path]) -> np.ndarray:
     Parameters
     ----------
 
-    fn : pathlib.Path or io.StringIO
+    fn : pathlib.Path, RinexHandle or io.StringIO
         RINEX file or stream to process
+    index : bool
+        times of uncompressed files come from their byte offset index, built on first use
 
     Returns
     -------
@@ -49,6 +51,10 @@ def gettime(fn: Union[TextIO, Path]) -> np.ndarray:
     times : numpy.ndarray of datetime.datetime
         1-D vector of epochs in file
     """
+    if isinstance(fn, (str, Path)) and Path(fn).suffix != '.nc':
+        with RinexHandle(fn) as h:
+            return gettime(h, index)
+
     info = rinexinfo(fn)
 
     version = info['version']
@@ -58,16 +64,16 @@ def gettime(fn: Union[TextIO, Path]) -> np.ndarray:
 # %% select function
     if rtype == 'obs':
         if vers == 2:
-            times = obstime2(fn)
+            times = obstime2(fn, index=index)
         elif vers == 3:
-            times = obstime3(fn)
+            times = obstime3(fn, index=index)
         else:
             raise ValueError(f'Unknown RINEX version {version} {fn}')
     elif rtype == 'nav':
         if vers == 2:
-            times = navtime2(fn)
+            times = navtime2(fn, index=index)
         elif vers == 3:
-            times = navtime3(fn)
+            times = navtime3(fn, index=index)
         else:
             raise ValueError(f'Unknown RINEX version {version} {fn}')
     else:
@@ -76,7 +82,7 @@ def gettime(fn: Union[TextIO, Path]) -> np.ndarray:
     return times
 
 
-def rinexheader(fn: Union[TextIO, str, Path]) -> Dict[str, Any]:
+def rinexheader(fn: Union[TextIO, str, Path, RinexHandle]) -> Dict[str, Any]:
     """
     retrieve RINEX 2/3 or CRINEX 1/3 header as unparsed dict()
     """
@@ -86,11 +92,14 @@ def rinexheader(fn: Union[TextIO, str, Path]) -> Dict[str, Any]:
     if isinstance(fn, Path) and fn.suffix == '.nc':
         return rinexinfo(fn)
     elif isinstance(fn, Path):
-        with opener(fn, header=True) as f:
+        with RinexHandle(fn) as h:
+            return rinexheader(h)
+    elif isinstance(fn, RinexHandle):
+        with opener(fn) as f:
             return rinexheader(f)
     elif isinstance(fn, io.StringIO):
         fn.seek(0)
-    elif isinstance(fn, io.TextIOWrapper):
+    elif isinstance(fn, io.TextIOBase):
         pass
     else:
         raise TypeError(f'unknown RINEX filetype {type(fn)}')
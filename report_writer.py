@@ -1,170 +1,158 @@
-class Report:
-    __file = None
-    __id = 0
-    __script = """<script>
-        var elems = document.getElementsByClassName('idx');
-        var idx_space = document.getElementsByClassName('idx-space');
-        var current_open_el = 0
-        for(var i = 0; i < elems.length; ++i) {
-            elems[i].addEventListener('click', function(event) {
-                var el = event.path[0]
-                var open_data = el.getAttribute("open-data")
-                var open_el = document.getElementById(open_data)
-                if(current_open_el) {
-                    var current_open_el_id = current_open_el.getAttribute('id')
-                    if(open_data != current_open_el_id) {
-                        current_open_el.setAttribute('class', 'cloud')
-                    }
-                }
-                if(open_el.getAttribute('class') == 'cloud') {
-                    open_el.setAttribute('class', 'cloud show')
-                    current_open_el = open_el
-                } else {
-                    open_el.setAttribute('class', 'cloud')
-                }
-            })
-        }
-        var w = document.getElementsByClassName('sv_dateime_inf')[0].clientWidth;
-        for(var i = 0; i < idx_space.length; ++i) {
-            idx_space[i].style.width = w + 'px';
-        }
-    </script>"""
-    __end_body = ''
-
-    def __init__(self, filename='report.html'):
-        self.__file = open(filename, 'w')
-        self.__begin()
-    
-    def __del__(self):
-        self.__endbody()
-        self.__end()
-        self.__file.close()
-    
-    def write_coefs(self, sv, datetime, coefs):
-        self.__file.write('<span class="sv_dateime_inf">')
-        self.__file.write(sv + ' ')
-        self.__file.write(datetime.strftime("%Y %m %d %H %M %S") + ' ')
-        self.__file.write('</span>')
-        coef_indexes_q = len(coefs)
-        for coef_idx in coefs:
-            right = coefs[coef_idx]['rigth_coef']
-            errors = coefs[coef_idx]['error_coefs']
-
-            errors_length = len(errors)
-
-            color = 'red'
-            if(errors_length == 0):
-                color = 'green'
-            
-            self.__file.write('<span class="idx" open-data="{0}" style="color:{1}">'.format(self.__id, color))
-            self.__file.write(right['value'].replace(' ', '&nbsp;'))
-            self.__file.write('</span>')
-
-            self.__file.write('<span class="cloud" id="{0}">'.format(self.__id))
-            self.__id += 1
-            self.__file.write('found in files({0}):<br>'.format(right['count']))
-
-            self.__file.write('<ol>')
-            for owner in right['owners']:
-                self.__file.write('<li>{0}</li>'.format(owner))
-            self.__file.write('</ol>')
-
-            if(errors_length > 0):
-                self.__file.write('errors({0}):<br>'.format(len(errors)))
-                self.__file.write('<ol>')
-                for error in errors:
-                    self.__file.write('<li>')
-                    self.__file.write(self.__highlight_differense(right['value'].replace(' ', '&nbsp;'), error['value'].replace(' ', '&nbsp;')) + '<br>')
-
-                    self.__file.write('<ol>found in files({0}):'.format(len(error['owners'])))
-                    for owner in error['owners']:
-                        self.__file.write('<li>{0}</li>'.format(owner))
-                    self.__file.write('</ol></li>')
-                
-                self.__file.write('</ol>')
-
-            self.__file.write('</span>')
-
-            if(coef_idx == 2 or ((coef_idx - 2) % 4 == 0 and coef_idx != (coef_indexes_q - 1))):
-                self.__file.write('<br><span class="idx-space"></span>')
-        
-        self.__file.write('<br>')
-        
-    def __highlight_differense(self, val1, val2):
-        val1_len = len(val1)
-        val2_len = len(val2)
-        min_v = min([val1_len, val2_len])
-        ret = ''
-        for i in range(min_v):
-            if (val1[i] == val2[i]):
-                ret += val2[i]
-            else:
-                ret += '<span style="color: yellow">{0}</span>'.format(val2[i])
-
-        return ret
-
-    def __endbody(self):
-        self.__file.write(self.__end_body)
-        self.__file.write(self.__script + '</body>')
-
-    def add_end_body(self, str_end):
-        self.__end_body += str_end
-    
-    def __begin(self):
-        self.__file.write("""
-        <!DOCTYPE html>
-        <html>
-            <head>
-                <title>Report</title>
-                <style>
-                    .cloud {
-                        display:none;
-                        position:absolute;
-                        background-color:grey;
-                        color:white;
-                        padding:10px;
-                        box-shadow: 10px 5px 5px rgba(0,0,0,.6);
-                        border-radius: 3px;
-                    }
-                    .show {
-                        display:inline-block !important;
-                    }
-                    span {
-                        display: inline-block;
-                    }
-                </style>
-            </head>
-            <body>
-        """)
-    
-    def __end(self):
-        self.__file.write('</html>')
-        
-
-class ChunckedReport:
-    __dictname = None
-    __current_report = None
-    __writed_chunks = 0
-    __elems_per_page = 30
-
-    def __init__(self, dictname='report'):
-        self.__dictname = dictname
-    
-    def write_coefs(self, sv, datetime, coefs):
-        if(self.__writed_chunks % self.__elems_per_page == 0):
-            self.__current_report = Report(self.__dictname + '/{0}.html'.format(int(self.__writed_chunks / self.__elems_per_page)))
-        
-        self.__current_report.write_coefs(sv, datetime, coefs)
-
-        self.__writed_chunks += 1
-    
-    def __del__(self):
-        index = open('index.html', 'r').read()
-        index = index.replace('{{q_pages}}', str(int(self.__writed_chunks / self.__elems_per_page) + 1))
-        open(self.__dictname + '/index.html', 'w').write(index)
-
-def write_report(rinex_merged_data):
-    r = ChunckedReport()
-    for sv in rinex_merged_data:
-        for datetime_k in rinex_merged_data[sv]:
-            r.write_coefs(sv, datetime_k, rinex_merged_data[sv][datetime_k])
\ No newline at end of file
+import json
+import os
+
+import numpy as np
+
+from parselib.epochs import from_epoch
+
+VIEWER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html')
+DATA_FILE = 'report.js'
+
+
+class ReportData:
+    """
+    compact report payload, the viewer index.html renders it
+
+    files: interned file names
+    groups: owner lists as file ids, each distinct list stored once
+    svs, epochs: names of the satellites and epochs of the records
+    records: [sv, epoch, [right coefs], owner group of the right coefs, one group or one per coef]
+    errors: [record, coef index, [[value, group], ...]] of the slots files disagree on
+    the count of a candidate is the length of its owner group
+    """
+
+    def __init__(self, files):
+        self.files = list(files)
+        self._file_ids = {file: i for i, file in enumerate(self.files)}
+        self.groups = []
+        self._group_ids = {}
+        self.svs = []
+        self.epochs = []
+        self.records = []
+        self.errors = []
+
+    def group(self, owners):
+        """intern an owner list of file ids"""
+        owners = tuple(owners)
+        g = self._group_ids.get(owners)
+        if g is None:
+            g = self._group_ids[owners] = len(self.groups)
+            self.groups.append(list(owners))
+
+        return g
+
+    def owner_group(self, owners):
+        """intern an owner list of file names"""
+        return self.group(self._file_ids[file] for file in owners)
+
+    def to_json(self):
+        return json.dumps({'files': self.files, 'groups': self.groups, 'svs': self.svs, 'epochs': self.epochs,
+                           'records': self.records, 'errors': self.errors}, separators=(',', ':'))
+
+
+def _owner_groups(data, owner_start, owner_file):
+    """
+    group id of the owners of every candidate: owner lists of one length are compared as rows
+    of one array, so each distinct list is interned once
+    """
+    lens = np.diff(owner_start)
+    groups = np.empty(lens.size, dtype=np.int64)
+    for n in np.unique(lens).tolist():
+        cands = np.flatnonzero(lens == n)
+        rows = owner_file[owner_start[cands, None] + np.arange(n)]
+        unique, inverse = np.unique(rows, axis=0, return_inverse=True)
+        ids = np.array([data.group(row) for row in unique.tolist()], dtype=np.int64)
+        groups[cands] = ids[inverse.reshape(-1)]
+
+    return groups
+
+
+def report_data(rinex_merged_data):
+    """
+    ReportData of a MergeTable after search_bad_coefs, records in the order of the table.
+    Slots all files agree on cost an array element, Python work and error detail
+    are spent on the slots with several candidates only.
+    A SqliteMergeTable is read a record at a time instead.
+    """
+    table = rinex_merged_data
+    if hasattr(table, 'report_records'):
+        return _streamed_report_data(table)
+
+    a = table.consensus_arrays()
+    data = ReportData(table.files)
+    Nsv, Nepoch, Ncoef = a['value'].shape
+
+    data.svs = a['sv'].tolist()
+    data.epochs = [from_epoch(e).strftime("%Y %m %d %H %M %S") for e in a['epoch'].tolist()]
+
+    cand_groups = _owner_groups(data, a['owner_start'], a['owner_file'])
+    cand_slot = (a['cand_sv'] * Nepoch + a['cand_epoch']) * Ncoef + a['cand_index']
+    ncands = np.bincount(cand_slot, minlength=Nsv * Nepoch * Ncoef)
+    right = np.full(Nsv * Nepoch * Ncoef, -1, dtype=np.int64)
+    single = ncands[cand_slot] == 1
+    right[cand_slot[single]] = cand_groups[single]
+    right = right.reshape(Nsv, Nepoch, Ncoef)
+    values = np.array(table.values, dtype=object)
+
+    # records in the order of the table
+    sv_index = {sv: i for i, sv in enumerate(data.svs)}
+    recs = [(sv_index[sv], rec) for sv, sv_recs in table.svs.items() for rec in sv_recs]
+    rec_epoch = np.searchsorted(a['epoch'], np.array([table.rec_epoch[rec] for _, rec in recs], dtype=np.int64))
+    position = {}
+    for (i, _), j in zip(recs, rec_epoch.tolist()):
+        n = int((a['value'][i, j] >= 0).sum())
+        position[i, j] = len(data.records)
+        data.records.append([i, j, values[a['value'][i, j, :n]].tolist(), right[i, j, :n].tolist()])
+
+    for slot in np.flatnonzero(ncands > 1).tolist():
+        i, rest = divmod(slot, Nepoch * Ncoef)
+        j, k = divmod(rest, Ncoef)
+        coefs = table[data.svs[i]][from_epoch(a['epoch'][j])][k]
+        r = position[i, j]
+        data.records[r][3][k] = data.owner_group(coefs['rigth_coef']['owners'])
+        if coefs['error_coefs']:
+            data.errors.append([r, k, [[e['value'], data.owner_group(e['owners'])] for e in coefs['error_coefs']]])
+
+    for record in data.records:
+        if len(set(record[3])) == 1:
+            record[3] = record[3][0]
+
+    return data
+
+
+def _streamed_report_data(table):
+    """ReportData of the records of table.report_records(), satellites and epochs in the order they come"""
+    data = ReportData(table.files)
+    svs = {}
+    epochs = {}
+    for sv, datetime_k, coefs in table.report_records():
+        i = svs.setdefault(sv, len(svs))
+        j = epochs.setdefault(datetime_k.strftime("%Y %m %d %H %M %S"), len(epochs))
+        r = len(data.records)
+        groups = []
+        for k, coef in enumerate(coefs):
+            groups.append(data.owner_group(coef['rigth_coef']['owners']))
+            if coef['error_coefs']:
+                data.errors.append([r, k, [[e['value'], data.owner_group(e['owners'])] for e in coef['error_coefs']]])
+        data.records.append([i, j, [coef['rigth_coef']['value'] for coef in coefs],
+                             groups[0] if len(set(groups)) == 1 else groups])
+
+    data.svs = list(svs)
+    data.epochs = list(epochs)
+
+    return data
+
+
+def write_report(rinex_merged_data, dictname='report'):
+    """
+    write the report of a MergeTable after search_bad_coefs into the directory dictname:
+    the payload as report.js and the viewer as index.html, which paginates on the client
+    """
+    data = report_data(rinex_merged_data)
+
+    os.makedirs(dictname, exist_ok=True)
+    # a script rather than a .json file, browsers don't fetch files of a page opened from disk
+    with open(os.path.join(dictname, DATA_FILE), 'w') as f:
+        f.write('var REPORT = ' + data.to_json() + ';\n')
+    with open(VIEWER) as f, open(os.path.join(dictname, 'index.html'), 'w') as out:
+        out.write(f.read())
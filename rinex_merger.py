@@ -1,27 +1,30 @@
 import parselib as pl
 import datetime
+import os
 import re
+from collections import deque
+from functools import partial
+from itertools import islice
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from parselib.epochs import DAY, to_epoch
+from merge_state import MergeState
+from metrics import Metrics
+from bad_coefs_searcher import similar_coefs_parents, vote
+
+IN_FLIGHT = 2  # files submitted per worker ahead of the merge
+
+def most_common_coef(coefs):
+    """
+    coefs: {coef: count}
+    return: coef found in most files, similar coefs are counted together
+    """
+    keys = list(coefs)
+    slots = np.zeros(len(keys), dtype=np.int64)
+    parent = similar_coefs_parents(slots, [float(k) for k in keys])
+    winners, _ = vote(slots, parent, [coefs[k] for k in keys])
 
-def delete_similar_coefs(coefs):
-    accuracy = 0.00000000001
-    for coef_to in coefs:
-        coef_to_float = float(coef_to)
-        for coef_from in coefs:
-            if(coef_to == coef_from or coefs[coef_to] == None or coefs[coef_from] == None):
-                continue
-            coef_from_float = float(coef_from)
-            if coef_to_float != 0.0:
-                res = coef_from_float / coef_to_float
-                if(accuracy > abs(1.0 - res)):
-                    coefs[coef_to] += coefs[coef_from]
-                    coefs[coef_from] = None
-
-    coefs_temp = {}
-    for coef in coefs:
-        if(coefs[coef] != None):
-            coefs_temp[coef] = coefs[coef]
-    
-    return coefs_temp
+    return keys[winners[0]]
 
 def get_datetime_from_file_name(filename):
     days_years = re.search('.{4}(\d{3}).\.(\d{2}).|.{12}(\d{4})(\d{3}).{11}', filename, re.IGNORECASE)
@@ -41,48 +44,104 @@ def get_datetime_from_file_name(filename):
 
     return d
 
-def parse_ionospheric_cor(cor_string):
-    cor_string = cor_string.replace('D', 'E').replace('e', 'E')
-
-    i_cor = re.search('([A-Z]{2,})', cor_string, re.IGNORECASE)
-    parsed = {}
-    if(i_cor):
-        parsed[i_cor.group(1)] = re.findall('(\d\.\d+[E].\d\d)', cor_string)
-
-    return parsed
-
 def get_ionospheric_cor(header):
+    """
+    header: pl.RinexHeader
+    return: {kind: [coef, ...]} floats, also of an IONOSPHERIC CORR line of a RINEX 2 file,
+            which used to be kept as strings
+    """
+    return {kind: list(coefs) for kind, coefs in header.ionospheric.items()}
 
-    t_cor = {}
-
-    if ('ION ALPHA' in header and 'ION BETA' in header):
-            ion_alpha = header['ION ALPHA']
-            ion_beta = header['ION BETA']
-            ion_alpha = ion_alpha.replace('D', 'E').replace('\n', '')
-            ion_alpha = ion_alpha.replace('e', 'E')
-            ion_beta = ion_beta.replace('D', 'E').replace('\n', '')
-            ion_beta = ion_beta.replace('e', 'E')
-            ion_alpha = re.findall('[- ]\d+\.\d+E[+-]\d+', ion_alpha, flags=re.IGNORECASE)
-            ion_beta = re.findall('[- ]\d+\.\d+E[+-]\d+', ion_beta, flags=re.IGNORECASE)
-            ion_alpha = list(map(lambda x: float(x), ion_alpha))
-            ion_beta = list(map(lambda x: float(x), ion_beta))
-            t_cor = {}
-            t_cor['GPSA'] = ion_alpha
-            t_cor['GPSB'] = ion_beta
 
+def parse_rinex_file(file, use=None, tlim=None, cache=None):
+    """
+    file: path string
+    use, tlim: constellations and time bounds of the records read, see parselib.rinexnav
+    cache: parselib.NavCache or None
+    return: (file, datetime from file name, parsed rinex with integer epochs or None if the file can't be read,
+             Metrics of the open and decode stages and of the cache, with the reason of a file that can't be read)
+    """
+    datetime_from_filename = get_datetime_from_file_name(file)
+    metrics = Metrics()
+    cached = cache.stats() if cache is not None else None
+
+    try:
+        metrics.add('open', calls=0, bytes=os.path.getsize(file))
+        if cache is not None:  # files are opened on cache misses only
+            with metrics.stage('decode') as stage:
+                current_rinex = pl.rinexnav(file, use, tlim, cache=cache, epochs=True)
+        else:
+            with metrics.stage('open'):
+                h = pl.RinexHandle(file)
+            with h, metrics.stage('decode') as stage:
+                current_rinex = pl.rinexnav(h, use, tlim, epochs=True)
+        stage['records'] += sum(map(len, current_rinex['data'].values()))
+    except Exception as e:
+        current_rinex = None
+        metrics.skip(file, f'{type(e).__name__}: {e}')
+    if cache is not None:  # the counts of a worker's copy of the cache come back with the metrics
+        metrics.add_cache(**{k: n - cached[k] for k, n in cache.stats().items()})
+
+    return file, datetime_from_filename, current_rinex, metrics
+
+def parse_rinex_files(files, workers=None, use=None, tlim=None, cache=None):
+    """
+    Parse files with a pool of worker processes.
+    Results are yielded in the order of files, so merging stays deterministic.
+    At most IN_FLIGHT files per worker are submitted ahead of the merge, parsed files don't pile up
+    when merging is slower than parsing.
+    workers: None or 1 parses in the current process
+    """
+    parse = partial(parse_rinex_file, use=use, tlim=tlim, cache=cache)
+    if not workers or workers <= 1:
+        yield from map(parse, files)
+        return
+
+    files = iter(files)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque(executor.submit(parse, file) for file in islice(files, IN_FLIGHT * workers))
+        while pending:
+            result = pending.popleft().result()
+            for file in islice(files, 1):
+                pending.append(executor.submit(parse, file))
+            yield result
+
+def add_rinex(table, file, datetime_from_filename, current_rinex, repeat=False):
+    """
+    add the records of one parsed file dated like its file name, current_rinex has integer epochs
+    repeat: the file is listed again, its records are counted again
+    return: number of records and coefficients added
+    """
+    file_id = table.file_id(file, repeat)
+    day = to_epoch(datetime_from_filename) // DAY
+    records = coefficients = 0
+    for sv in current_rinex['data']:
+        for epoch, coefs in current_rinex['data'][sv].items():
 
-    if 'IONOSPHERIC CORR' in header:
-            t_cor = header['IONOSPHERIC CORR']
+            if epoch // DAY != day:
+                break
 
-    if type(t_cor) == type(''):
-        t_cor = parse_ionospheric_cor(t_cor)
+            if not coefs:
+                raise Exception("Missed coefs")
 
-    return t_cor
+            table.add_record(file_id, sv, epoch, coefs)
+            records += 1
+            coefficients += len(coefs)
 
+    return records, coefficients
 
-def merge_rinexes(files):
+def merge_rinexes(files, workers=None, state=None, use=None, tlim=None, cache=None, metrics=None):
     """
-    files: list of path strings
+    files: list of path strings, without state a file listed twice is counted twice like every file is a vote
+    workers: number of processes parsing files, None parses serially
+    state: MergeState of a previous run, only new and changed files are parsed
+           and files no longer listed are removed from it, files listed twice are merged once.
+           None merges from scratch. A state made with other use or tlim is merged from scratch too.
+    use: constellations to merge like ['G', 'R'], None merges all
+    tlim: (start, stop) datetimes of the records to merge
+    cache: parselib.NavCache the parsed files are kept in
+    metrics: Metrics the open, decode, header and merge stages, the merged, reused and skipped files
+             and the cache counts are added to
     return: dictionary with merged data
     {
         'max_i_q: int,
@@ -93,41 +152,80 @@ def merge_rinexes(files):
                 'GPSB': []
             }
         },
-        'satellite_name': {
-            'datetime': {
-                'coef_index': coef,
+        'data': MergeTable {
+            'satellite_name': {
+                'datetime': {
+                    'coef_index': {
+                        'coef': {'count': int, 'owners': [file, ...]},
+                        ...
+                    },
+                    ...
+                },
                 ...
             },
             ...
-        },
-        ...
+        }
     }
     """
 
+    if state is None:
+        state = MergeState()
+    else:  # the state knows a file once
+        files = list(dict.fromkeys(files))
+    if metrics is None:
+        metrics = Metrics()
+    if state.set_filters(use, tlim):
+        print('Состояние собрано с другими use или tlim, файлы будут прочитаны заново')
+
+    rinex_merged_data = state.table
+    outdated = state.outdated(files)
+    parsed = set(outdated)
+    for file in (file for file in dict.fromkeys(files) if file not in parsed):
+        if state.files[file]['ionospheric_corr'] is None:
+            metrics.skip(file, state.files[file].get('reason', 'unknown'), stored=True)
+        else:
+            metrics.reused += 1
+
+    for file, datetime_from_filename, current_rinex, file_metrics in parse_rinex_files(outdated, workers,
+                                                                                       use, tlim, cache):
+        print(file)
+        metrics.update(file_metrics)
+        if current_rinex is None:
+            reason = file_metrics.skipped[-1]['reason']
+            print('Файл не будет учитываться', reason)
+            state.add_file(file, datetime_from_filename, None, reason)
+            continue
+
+        with metrics.stage('header'):  # here, the memo of rinex_header outlives the worker pool
+            ionospheric_corr = get_ionospheric_cor(pl.rinex_header(file, current_rinex['header']))
+        repeat = file in state.files
+        state.add_file(file, datetime_from_filename, ionospheric_corr)
+        with metrics.stage('merge') as stage:
+            records, coefficients = add_rinex(rinex_merged_data, file, datetime_from_filename, current_rinex, repeat)
+        stage['records'] += records
+        stage['coefficients'] += coefficients
+        metrics.merged += 1
+
+    with metrics.stage('merge'):
+        rinex_merged_data.set_file_order(files)
 
-    rinex_merged_data = {}
     rinex_merged = {}
     rinex_merged['header'] = {}
     rinex_merged['header']['IONOSPHERIC CORR'] = {}
     rinex_merged['datetimes'] = {}
-    rinex_merged['max_i_q'] = 0
+    rinex_merged['max_i_q'] = rinex_merged_data.max_i_q
     ionospheric_corr = {}
     for file in files:
-        datetime_from_filename = get_datetime_from_file_name(file)
+        datetime_from_filename = state.file_date(file)
         if datetime_from_filename in rinex_merged['datetimes']:
             rinex_merged['datetimes'][datetime_from_filename] += 1
         else:
             rinex_merged['datetimes'][datetime_from_filename] = 1
 
-        print(file)
-        try:
-            current_rinex = pl.rinexnav(file)
-        except Exception:
-            print('Файл не будет учитываться')
+        ionos_temp = state.files[file]['ionospheric_corr']
+        if ionos_temp is None:
             continue
 
-        ionos_temp = get_ionospheric_cor(current_rinex['header'])
-
         for gps in ionos_temp:
             if not gps in ionospheric_corr:
                 ionospheric_corr[gps] = {}
@@ -140,43 +238,11 @@ def merge_rinexes(files):
                 else:
                     ionospheric_corr[gps][idx] = {}
                     ionospheric_corr[gps][idx][val] = 1
-        
-        for sv in current_rinex['data']:
-            for datetime_k in current_rinex['data'][sv]:
-
-                if not (datetime_k.strftime('%y%j') == datetime_from_filename.strftime('%y%j')):
-                    break
-
-                if(not sv in rinex_merged_data):
-                    rinex_merged_data[sv] = {}
-
-                if(not datetime_k in rinex_merged_data[sv]):
-                    rinex_merged_data[sv][datetime_k] = {}
-
-                coefs = current_rinex['data'][sv][datetime_k]
-
-                if not coefs:
-                    raise Exception("Missed coefs")
-
-                for idx, coef in enumerate(coefs):
-                    if(idx > rinex_merged['max_i_q']):
-                        rinex_merged['max_i_q'] = idx
-                    if idx in rinex_merged_data[sv][datetime_k]:
-                        try:
-                            rinex_merged_data[sv][datetime_k][idx][coef]['count'] += 1
-                            rinex_merged_data[sv][datetime_k][idx][coef]['owners'].append(file)
-                        except KeyError:
-                            rinex_merged_data[sv][datetime_k][idx][coef] = {'count': 1, 'owners': [file] }
-                    else:
-                        rinex_merged_data[sv][datetime_k][idx] = {}
-                        rinex_merged_data[sv][datetime_k][idx][coef] = {'count': 1, 'owners': [file] }
 
     for gps in ionospheric_corr:
         for idx in ionospheric_corr[gps]:
-            coefs = delete_similar_coefs(ionospheric_corr[gps][idx])
-            
-            right_idx = sorted(coefs, key=lambda x: coefs.get(x), reverse=True)[0]
-            
+            right_idx = most_common_coef(ionospheric_corr[gps][idx])
+
             if not gps in rinex_merged['header']['IONOSPHERIC CORR']:
                 rinex_merged['header']['IONOSPHERIC CORR'][gps] = []
 
@@ -1,3 +1,9 @@
+from functools import lru_cache
+from parselib.epochs import from_epoch
+
+BLOCK_RECORDS = 512  # records formatted into one write
+BUFFER_SIZE = 1 << 20
+
 def widthAlignCoef(coef):
     add_space = ''
     if(coef >= 0):
@@ -14,45 +20,76 @@ def add_ods(lst):
     q = 4
     return lst + (['           '] * (q - len(lst)))
 
-def write_rinex(rinex_merged):
+@lru_cache(maxsize=None)
+def record_template(coef_indexes_q, max_i_q):
+    """
+    str.format template for the coefficients of a record with coef_indexes_q coefficients,
+    line breaks and zero padding up to max_i_q are in the template
+    """
+    parts = []
+    for coef_idx in range(coef_indexes_q):
+        parts.append('{}')
+        if(coef_idx == 2 or ((coef_idx - 2) % 4 == 0 and coef_idx != (coef_indexes_q - 1))):
+            parts.append('\n    ')
+
+    for i in range(coef_indexes_q - 1, max_i_q):
+        if((i - 2) % 4 == 0):
+            parts.append('\n    ')
+        parts.append(' 0.000000000000E+00')
+
+    parts.append('\n')
+
+    return ''.join(parts)
+
+def format_records(records, max_i_q):
+    """
+    records: iterable of (sv, epoch, coefs), epoch in integer microseconds
+    yields the text of each record
+    """
+    epoch_strings = {}
+    for sv, epoch, coefs in records:
+        epoch_str = epoch_strings.get(epoch)
+        if epoch_str is None:
+            epoch_str = epoch_strings[epoch] = from_epoch(epoch).strftime("%Y %m %d %H %M %S")
+
+        yield sv + ' ' + epoch_str + record_template(len(coefs), max_i_q).format(*coefs)
+
+def write_records(out, records, max_i_q):
+    """write records in blocks of BLOCK_RECORDS"""
+    block = []
+    for record in format_records(records, max_i_q):
+        block.append(record)
+        if len(block) == BLOCK_RECORDS:
+            out.write(''.join(block))
+            block = []
+
+    out.write(''.join(block))
+
+def write_rinex(rinex_merged, records=None, filename=None):
+    """
+    records: iterable of (sv, epoch, coefs), by default the right coefs of rinex_merged['data'],
+             sorted by satellite and epoch. A generator lets writing start while records are still produced.
+    """
     date = sorted(rinex_merged['datetimes'], key=lambda x: rinex_merged['datetimes'].get(x), reverse=True)[0]
 
     filetype = 'n'
 
-    filename = 'aaaa' + date.strftime("%j") + '0' + '.' + date.strftime("%y") + filetype
-
-    out = open(filename, 'w')
-
-    out.write('     3.03           N: GNSS NAV DATA    G: GPS              RINEX VERSION / TYPE\n')
-
-    i_c = rinex_merged['header']['IONOSPHERIC CORR']
-    
-
-    for gps in i_c:
-        ionospheric_corr_cefs_l = list(map(lambda x: widthAlignCoef(float(x)), i_c[gps]))
-        ionospheric_corr_cefs_l = add_ods(ionospheric_corr_cefs_l)
-        
-        out.write('{0}  {1} {2} {3} {4}       IONOSPHERIC CORR    \n'.format(widthAlignKey(gps), *ionospheric_corr_cefs_l))
-    out.write('                                                            END OF HEADER       \n')
-
-    rinex_merged_data = rinex_merged['data']
-    for sv in rinex_merged_data:
-        for datetime_k in rinex_merged_data[sv]:
-            out.write(sv + ' ')
-            out.write(datetime_k.strftime("%Y %m %d %H %M %S"))
-            coef_indexes_q = len(rinex_merged_data[sv][datetime_k])
-            for coef_idx in rinex_merged_data[sv][datetime_k]:
-                coef_val = rinex_merged_data[sv][datetime_k][coef_idx]['rigth_coef']['value']
-                out.write(coef_val)
-                if(coef_idx == 2 or ((coef_idx - 2) % 4 == 0 and coef_idx != (coef_indexes_q - 1))):
-                    out.write('\n    ')
-
-            for i in range(coef_indexes_q - 1, rinex_merged['max_i_q']):
-                if((i - 2) % 4 == 0):
-                    out.write('\n    ')
-                out.write(' 0.000000000000E+00')
-                
-                
-                
-            out.write('\n')
-    out.close()
\ No newline at end of file
+    if filename is None:
+        filename = 'aaaa' + date.strftime("%j") + '0' + '.' + date.strftime("%y") + filetype
+
+    if records is None:
+        records = rinex_merged['data'].right_coefs()
+
+    with open(filename, 'w', buffering=BUFFER_SIZE) as out:
+        out.write('     3.03           N: GNSS NAV DATA    G: GPS              RINEX VERSION / TYPE\n')
+
+        i_c = rinex_merged['header']['IONOSPHERIC CORR']
+
+        for gps in i_c:
+            ionospheric_corr_cefs_l = list(map(lambda x: widthAlignCoef(float(x)), i_c[gps]))
+            ionospheric_corr_cefs_l = add_ods(ionospheric_corr_cefs_l)
+
+            out.write('{0}  {1} {2} {3} {4}       IONOSPHERIC CORR    \n'.format(widthAlignKey(gps), *ionospheric_corr_cefs_l))
+        out.write('                                                            END OF HEADER       \n')
+
+        write_records(out, records, rinex_merged['max_i_q'])
@@ -1,15 +1,118 @@
+import argparse
 import glob
+import os
 import sys
+import parselib as pl
 from rinex_merger import merge_rinexes
+from merge_state import MergeState
 from bad_coefs_searcher import search_bad_coefs
 from rinex_writer import write_rinex
 from report_writer import write_report
+from consensus_store import write_consensus, CONSENSUS_FILE
+from ingest import mergeable
+from metrics import Metrics
+from merge_store import SqliteMergeTable
 
+STATE_DIR = 'merge_state'
+INPUTS = ['rintest/*']
+STAGES = ('merge', 'consensus', 'rinex', 'report', 'export')
+
+
+def input_files(inputs, recursive=False):
+    """
+    files of glob patterns ('**' matches directories recursively) and directories,
+    files of directories are taken if merge_rinexes can date their names
+    """
+    files = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            if recursive:
+                walk = ((root, names) for root, _, names in os.walk(pattern))
+            else:
+                walk = [(pattern, os.listdir(pattern))]
+            files.extend(os.path.join(root, name) for root, names in walk for name in sorted(names)
+                         if mergeable(name))
+        else:
+            files.extend(path for path in sorted(glob.glob(pattern, recursive=True)) if os.path.isfile(path))
+
+    return list(dict.fromkeys(files))
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description='merge RINEX NAV files of many stations into one by voting on every coefficient')
+    p.add_argument('inputs', nargs='*', default=INPUTS, help='glob patterns and directories of NAV files')
+    p.add_argument('-r', '--recursive', action='store_true', help='take the files of subdirectories of input directories')
+    p.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='processes parsing files')
+    p.add_argument('--use', nargs='+', metavar='SYSTEM', help='constellations to merge, like G R E')
+    p.add_argument('--tlim', nargs=2, metavar=('START', 'STOP'), help='merge records between these times')
+    p.add_argument('--stages', nargs='+', choices=STAGES,
+                   help='rinex, report and export need the consensus, which needs the merge, by default all stages')
+    p.add_argument('--rinex', help='merged RINEX file, by default aaaa<doy>0.<yy>n')
+    p.add_argument('--report', default='report', help='report directory')
+    p.add_argument('--export', default=CONSENSUS_FILE, help='consensus file')
+    p.add_argument('--state', default=STATE_DIR, help='merge state kept between runs')
+    p.add_argument('--no-state', dest='state', action='store_const', const=None, help='merge from scratch')
+    p.add_argument('--cache', help='directory of parsed NAV files kept between runs')
+    p.add_argument('--db', help='merge in this SQLite database instead of in memory, without state and export')
+    p.add_argument('--metrics', help='JSON summary of the time, throughput and memory of every stage')
+    p.add_argument('--prometheus', help='the summary in the Prometheus text format, for the node exporter')
+    a = p.parse_args(argv)
+
+    if a.stages is None:
+        a.stages = [s for s in STAGES if not (a.db and s == 'export')]
+    if a.db and 'export' in a.stages:
+        p.error('the export needs the merge in memory, not --db')
+
+    stages = set(a.stages) | {'merge'}
+    if stages & {'rinex', 'report', 'export'}:
+        stages.add('consensus')
+    a.stages = stages
+
+    return a
+
+
+def main(argv=None):
+    a = parse_args(argv)
+
+    files = input_files(a.inputs, a.recursive)
+    if not files:
+        sys.exit(f'no files in {" ".join(a.inputs)}')
+
+    metrics = Metrics()
+    if a.db:
+        try:
+            state = MergeState(table=SqliteMergeTable(a.db))
+        except FileExistsError as e:
+            sys.exit(str(e))
+    else:
+        state = MergeState.load(a.state) if a.state else None
+    cache = pl.NavCache(a.cache) if a.cache else None
+    merge_rin = merge_rinexes(files, workers=a.workers, state=state, use=a.use, tlim=a.tlim, cache=cache,
+                              metrics=metrics)
+    if 'consensus' in a.stages:
+        with metrics.stage('consensus'):
+            merge_rin['data'] = search_bad_coefs(merge_rin['data'])
+    if a.db:
+        merge_rin['data'].commit()
+    elif state is not None:
+        with metrics.stage('write'):
+            state.save(a.state)
+
+    if 'rinex' in a.stages:
+        with metrics.stage('write'):
+            write_rinex(merge_rin, filename=a.rinex)
+    if 'export' in a.stages:
+        with metrics.stage('write'):
+            write_consensus(merge_rin, a.export)
+    if 'report' in a.stages:
+        with metrics.stage('report'):
+            write_report(merge_rin['data'], a.report)
+
+    if a.metrics:
+        metrics.write_json(a.metrics)
+    if a.prometheus:
+        metrics.write_prometheus(a.prometheus)
 
 
 if __name__ == '__main__':
-    files = glob.glob('rintest/*')
-    merge_rin = merge_rinexes(files)
-    merge_rin['data'] = search_bad_coefs(merge_rin['data'])
-    write_rinex(merge_rin)
-    write_report(merge_rin['data'])
\ No newline at end of file
+    main()
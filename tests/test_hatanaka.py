@@ -0,0 +1,92 @@
+"""
+the in-process CRINEX decoder against crx2rnx, on files compressed by rnx2crx
+
+Both RNXCMP executables are looked up on PATH, next to parselib's built converter and in the
+hatanaka package, which bundles them. The tests are skipped without them.
+"""
+import datetime
+import io
+import random
+import re
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+import parselib.hatanaka as hatanaka
+from benchmarks.corpus import obs2_lines, obs3_lines
+from parselib.build import R
+
+try:
+    import hatanaka as rnxcmp
+except ImportError:
+    rnxcmp = None
+
+EPOCH2 = re.compile(r'^ \d\d [ \d]\d [ \d]\d [ \d]\d [ \d]\d[ \d.]{10}\d  0')
+# flag: special records, events 2-4 are followed by header lines, 5 carries no records here
+EVENTS = {40: (4, 2), 41: (3, 2), 90: (2, 2), 150: (5, 0)}
+COMMENTS = ['EVENT WITHIN OBSERVATION ARCS'.ljust(60) + 'COMMENT\n',
+            'SECOND SPECIAL RECORD'.ljust(60) + 'COMMENT\n']
+
+
+def _exe(name):
+    dirs = [None, str(R)]
+    if rnxcmp is not None:
+        dirs.append(str(Path(rnxcmp.__file__).parent / 'bin'))
+    for path in dirs:
+        exe = shutil.which(name, path=path)
+        if exe:
+            return exe
+
+    return None
+
+
+RNX2CRX = _exe('rnx2crx')
+CRX2RNX = _exe('crx2rnx')
+
+pytestmark = pytest.mark.skipif(not (RNX2CRX and CRX2RNX), reason='RNXCMP executables not found')
+
+
+@pytest.fixture(autouse=True)
+def converter(monkeypatch):
+    monkeypatch.setattr(hatanaka, '_exe', CRX2RNX)
+
+
+def _with_events(lines, v3):
+    """RINEX OBS lines with event records of flags 2-5 before some epochs, in the middle of the arcs"""
+    out = []
+    n = 0
+    for ln in lines:
+        if ln.startswith('>') if v3 else EPOCH2.match(ln):
+            n += 1
+            if n in EVENTS:
+                flag, nrec = EVENTS[n]
+                if v3:
+                    time = ln[:31] if flag == 5 else '>'.ljust(31)
+                    out.append(f'{time}{flag}{nrec:3d}\n')
+                else:
+                    out.append(f'{ln[:28]}{flag}{nrec:3d}\n')
+                out.extend(COMMENTS[:nrec])
+        out.append(ln)
+
+    return out
+
+
+@pytest.mark.parametrize('version, lines, svs', [
+    ('1.0', obs2_lines, ['G01', 'G02', 'R03', 'G05', 'E11']),
+    ('3.0', obs3_lines, ['G01', 'E02', 'R03', 'G05', 'C06']),
+])
+def test_native_matches_crx2rnx(version, lines, svs):
+    rnx = _with_events(lines(datetime.date(2020, 2, 14), svs, 300, random.Random(1)), version == '3.0')
+    crx = subprocess.run([RNX2CRX, '-'], input=''.join(rnx), stdout=subprocess.PIPE,
+                         universal_newlines=True, check=True).stdout
+    assert crx[:20].strip() == version
+
+    native = list(hatanaka.crx2rnx_lines(io.StringIO(crx)))
+    proc = list(hatanaka.crxstream(io.StringIO(crx), native=False))
+
+    assert sum(COMMENTS[0] in ln for ln in proc) == 3
+    assert len(native) == len(proc)
+    for i, (a, b) in enumerate(zip(native, proc)):
+        assert a == b, f'line {i + 1}'